@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Measure job construction throughput for job classes with different
+numbers of Params, with the Params field names cached on the class,
+against instantiating the Params schema for every job as BaseJob used to.
+
+    $ python -m benchmarks.job_init
+"""
+import argparse
+import time
+
+from benchmarks.synthetic import make_hierarchy
+
+PARAM_COUNTS = (5, 50, 500)
+
+
+def legacy_init(cls, kwargs):
+    job = cls(None, None, **kwargs)
+    for key in cls.Params().fields.keys():
+        if key in kwargs:
+            setattr(job, key, kwargs[key])
+
+    return job
+
+
+def time_init(make, cls, kwargs, numJobs):
+    start = time.perf_counter()
+    for _ in range(numJobs):
+        make(cls, kwargs)
+
+    return numJobs / (time.perf_counter() - start)
+
+
+def run(numJobs):
+    """
+    :returns results: jobs constructed per second, keyed by number of
+        params, then by mode
+    :rtype: dict
+    """
+    results = {}
+    for numParams in PARAM_COUNTS:
+        rootcls = make_hierarchy(
+            0, 0, 1, numParams, name="init%d" % numParams
+        )
+        cls = rootcls.__subclasses__()[0]
+        kwargs = {name: 1 for name in cls.PARAM_NAMES}
+
+        results[numParams] = dict(
+            cached=time_init(
+                lambda c, k: c(None, None, **k), cls, kwargs, numJobs
+            ),
+            legacy=time_init(legacy_init, cls, kwargs, numJobs)
+        )
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = run(args.jobs)
+    for numParams, result in results.items():
+        print(
+            "%4d params: cached %10.0f jobs/s, legacy %10.0f jobs/s" %
+            (numParams, result['cached'], result['legacy'])
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+End-to-end load generator. Submits jobs, polls their progress and fetches
+their data at a target request rate, then reports throughput and p50/p99
+latency for each endpoint.
+
+By default the load is driven against an in-process Spacewalk server with
+in-memory datastore and queue stand-ins and an in-process worker, so no
+Couchbase or beanstalkd is needed. Pass --url to drive a running service
+instead.
+
+    $ python -m benchmarks.loadtest --root example:BaseExampleJob \\
+        --leaf /examples/fizz_buzz --params '{"n": 100}' --rate 200
+"""
+import argparse
+import asyncio
+import importlib
+import itertools
+import json
+import random
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+import zerog
+
+from spacewalk import handlers
+
+from benchmarks.standins import MemoryWorker, start_server
+from benchmarks.synthetic import make_hierarchy
+
+SUBMIT = "submit"
+PROGRESS = "progress"
+DATA = "data"
+
+# default share of requests for each endpoint
+DEFAULT_MIX = {SUBMIT: 1, PROGRESS: 3, DATA: 1}
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class EndpointStats(object):
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+
+    def report(self, duration):
+        return dict(
+            requests=len(self.latencies),
+            errors=self.errors,
+            throughput=len(self.latencies) / duration,
+            p50=percentile(self.latencies, 50),
+            p99=percentile(self.latencies, 99)
+        )
+
+
+class LoadGenerator(object):
+    """
+    Sends requests at a fixed rate, whether or not earlier requests have
+    finished, so slow responses don't hide behind a lower request rate.
+    """
+    def __init__(self, url, rootPath, leafPath, params, mix, seed=0):
+        """
+        :param url: base url of the service
+        :type url: str
+
+        :param rootPath: path of the structure's root branch
+        :type rootPath: str
+
+        :param leafPath: path of the leaf to submit jobs to
+        :type leafPath: str
+
+        :param params: params for each submitted job
+        :type params: dict
+
+        :param mix: relative number of requests for each endpoint
+        :type mix: dict
+        """
+        self.url = url
+        self.rootPath = rootPath
+        self.leafPath = leafPath
+        self.body = json.dumps(params)
+        self.client = AsyncHTTPClient(max_clients=1000)
+        self.rng = random.Random(seed)
+
+        self.actions = list(
+            itertools.chain(*[[name] * count for name, count in mix.items()])
+        )
+        self.stats = {name: EndpointStats() for name in mix}
+        self.running = []
+        self.finished = []
+
+    async def request(self, name, path, **kwargs):
+        start = time.perf_counter()
+        response = await self.client.fetch(
+            self.url + path, raise_error=False, **kwargs
+        )
+        elapsed = time.perf_counter() - start
+
+        stats = self.stats[name]
+        if response.code >= 400 or response.code == 599:
+            stats.errors += 1
+            return None
+
+        stats.latencies.append(elapsed)
+        return json.loads(response.body)
+
+    async def submit(self):
+        result = await self.request(
+            SUBMIT,
+            "%s/%s" % (self.leafPath, handlers.RUN_JOB),
+            method="POST",
+            body=self.body
+        )
+        if result is not None:
+            self.running.append(result['uuid'])
+
+    async def progress(self):
+        if not self.running:
+            return await self.submit()
+
+        uuid = self.rng.choice(self.running)
+        result = await self.request(
+            PROGRESS, "%s/progress/%s" % (self.rootPath, uuid)
+        )
+        if result is not None and result.get('result') is not None:
+            if uuid in self.running:
+                self.running.remove(uuid)
+                self.finished.append(uuid)
+
+    async def data(self):
+        if not self.finished:
+            return await self.progress()
+
+        uuid = self.rng.choice(self.finished)
+        await self.request(DATA, "%s/data/%s" % (self.rootPath, uuid))
+
+    async def run(self, rate, duration):
+        """
+        :param rate: requests per second
+        :type rate: float
+
+        :param duration: seconds to run for
+        :type duration: float
+
+        :returns report: stats for each endpoint
+        :rtype: dict
+        """
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        nextTime = start
+        tasks = []
+
+        while nextTime < start + duration:
+            action = getattr(self, self.rng.choice(self.actions))
+            tasks.append(loop.create_task(action()))
+
+            nextTime += 1 / rate
+            await asyncio.sleep(max(0, nextTime - loop.time()))
+
+        await asyncio.gather(*tasks)
+        elapsed = loop.time() - start
+
+        return {
+            name: stats.report(elapsed) for name, stats in self.stats.items()
+        }
+
+
+def load_root(spec):
+    """
+    :param spec: root job class as :code:`module:ClassName`
+    :type spec: str
+    """
+    moduleName, _, className = spec.partition(":")
+    return getattr(importlib.import_module(moduleName), className)
+
+
+async def run(args):
+    mix = dict(DEFAULT_MIX)
+    if args.mix:
+        mix.update(json.loads(args.mix))
+
+    params = json.loads(args.params)
+
+    if args.url:
+        generator = LoadGenerator(
+            args.url, args.root_path, args.leaf, params, mix
+        )
+        return await generator.run(args.rate, args.duration)
+
+    if args.root:
+        rootcls = load_root(args.root)
+    else:
+        rootcls = make_hierarchy(1, 2, 2, name="load")
+
+    url, struct, httpServer = start_server(rootcls)
+    server = httpServer.request_callback
+    worker = MemoryWorker(
+        server.datastore,
+        server.makeQueue.queues,
+        zerog.find_subclasses(rootcls)
+    )
+    worker.start()
+
+    generator = LoadGenerator(
+        url,
+        struct.get_root_path(),
+        args.leaf or struct.get_leaf_paths()[0],
+        params,
+        mix
+    )
+    try:
+        return await generator.run(args.rate, args.duration)
+    finally:
+        worker.stop()
+        httpServer.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--root",
+                        help="root job class as module:ClassName. Uses a "
+                             "synthetic hierarchy by default")
+    parser.add_argument("--leaf", help="path of the leaf to submit jobs to")
+    parser.add_argument("--params", default="{}",
+                        help="JSON params for each submitted job")
+    parser.add_argument("--rate", type=float, default=100,
+                        help="requests per second")
+    parser.add_argument("--duration", type=float, default=10,
+                        help="seconds to run for")
+    parser.add_argument("--mix",
+                        help='JSON relative request counts, e.g. '
+                             '\'{"submit": 1, "progress": 3, "data": 1}\'')
+    parser.add_argument("--url",
+                        help="base url of a running service to load test")
+    parser.add_argument("--root-path",
+                        help="root branch path, when using --url")
+    parser.add_argument("--output", help="save the report to a JSON file")
+    args = parser.parse_args()
+
+    if args.url and not (args.leaf and args.root_path):
+        parser.error("--url needs --leaf and --root-path")
+
+    report = IOLoop.current().run_sync(lambda: run(args))
+
+    print("%-10s %8s %8s %10s %10s %10s" %
+          ("endpoint", "requests", "errors", "req/s", "p50 ms", "p99 ms"))
+    for name, result in report.items():
+        p50, p99 = (
+            "-" if result[pct] is None else "%.2f" % (result[pct] * 1e3)
+            for pct in ("p50", "p99")
+        )
+        print(
+            "%-10s %8d %8d %10.1f %10s %10s" % (
+                name, result['requests'], result['errors'],
+                result['throughput'], p50, p99
+            )
+        )
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+
+
+if __name__ == '__main__':
+    main()
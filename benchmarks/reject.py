@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Measure the latency of a POST to a leaf's /job endpoint that is rejected
+by Params validation, against one that creates a job.
+
+    $ python -m benchmarks.reject --requests 2000
+"""
+import argparse
+import json
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+from spacewalk import handlers
+
+from benchmarks.standins import start_server
+from benchmarks.synthetic import make_hierarchy
+
+
+async def time_posts(client, url, body, numRequests):
+    start = time.perf_counter()
+    for _ in range(numRequests):
+        await client.fetch(url, method="POST", body=body, raise_error=False)
+
+    return (time.perf_counter() - start) / numRequests
+
+
+async def run(numRequests, numParams):
+    """
+    :returns results: mean seconds per request, keyed by outcome
+    :rtype: dict
+    """
+    url, struct, httpServer = start_server(
+        make_hierarchy(0, 0, 1, numParams, name="reject")
+    )
+    url = "%s%s/%s" % (url, struct.get_leaf_paths()[0], handlers.RUN_JOB)
+    client = AsyncHTTPClient()
+
+    valid = json.dumps({"p%d" % i: i for i in range(numParams)})
+    invalid = json.dumps({"p%d" % i: "x" for i in range(numParams)})
+
+    results = dict(
+        accepted=await time_posts(client, url, valid, numRequests),
+        rejected=await time_posts(client, url, invalid, numRequests)
+    )
+
+    httpServer.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--params", type=int, default=10)
+    args = parser.parse_args()
+
+    results = IOLoop.current().run_sync(
+        lambda: run(args.requests, args.params)
+    )
+    for name in ("accepted", "rejected"):
+        print("%-8s %8.1f us/request" % (name, results[name] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Compare request routing latency for one regex route per Branch and Leaf
+resource against the single trie-backed :code:`StructureRouter`.
+
+    $ python -m benchmarks.routing --leaves 10000
+"""
+import argparse
+import random
+import time
+
+from tornado.httputil import HTTPServerRequest
+from tornado.web import Application
+
+from spacewalk import handlers
+from spacewalk.structure import auto_tree, Structure
+
+from benchmarks.synthetic import hierarchy_for_leaves
+
+
+def per_node_handlers(structure):
+    """
+    the route list that :code:`make_handlers` used to build, with a regex
+    route for each resource of every Branch and Leaf, followed by the job
+    endpoints
+    """
+    rules = []
+    for path in structure.get_branch_paths():
+        rules.append(("%s/%s" % (path, handlers.BRANCHES),
+                      handlers.SubBranchesHandler))
+        rules.append(("%s/%s" % (path, handlers.LEAVES),
+                      handlers.LeavesHandler))
+
+    for path in structure.get_leaf_paths():
+        rules.append(("%s/%s" % (path, handlers.POST_SCHEMA),
+                      handlers.PostSchemaHandler))
+        rules.append(("%s/%s" % (path, handlers.RUN_JOB),
+                      handlers.RunJobHandler))
+        rules.append(("%s/%s" % (path, handlers.RUN_JOBS),
+                      handlers.RunJobsHandler))
+
+    # all but the StructureRouter, which comes first
+    return rules + handlers.make_handlers(structure)[1:]
+
+
+def trie_app(structure):
+    app = Application(handlers.make_handlers(structure))
+    for rule in app.wildcard_router.rules:
+        if isinstance(rule.target, handlers.StructureRouter):
+            rule.target.bind(app)
+
+    return app
+
+
+def check_routes(perNodeApp, trieApp, requests):
+    """
+    raise an error unless both applications route every request to the
+    same handler, so they're timed doing the same work
+    """
+    for request in requests:
+        perNode = perNodeApp.find_handler(request)
+        trie = trieApp.find_handler(request)
+        if perNode.handler_class is not trie.handler_class:
+            raise RuntimeError(
+                "%s is routed to %s per node, but %s by the trie" % (
+                    request.path,
+                    perNode.handler_class.__name__,
+                    trie.handler_class.__name__
+                )
+            )
+
+
+def time_routing(app, requests):
+    start = time.perf_counter()
+    for request in requests:
+        if app.find_handler(request) is None:
+            raise RuntimeError("no route for %s" % request.path)
+
+    return (time.perf_counter() - start) / len(requests)
+
+
+def run(numLeaves, numRequests, seed=0):
+    """
+    :returns results: mean seconds per routed request, keyed by router
+    :rtype: dict
+    """
+    rootcls = hierarchy_for_leaves(numLeaves)
+    structure = Structure(auto_tree(rootcls, ""))
+
+    rng = random.Random(seed)
+    leafPaths = structure.get_leaf_paths()
+    branchPaths = structure.get_branch_paths()
+    requests = []
+    for _ in range(numRequests):
+        resource = rng.choice(list(handlers.StructureRouter.RESOURCES))
+        if resource in (handlers.BRANCHES, handlers.LEAVES):
+            path = rng.choice(branchPaths)
+        else:
+            path = rng.choice(leafPaths)
+
+        requests.append(
+            HTTPServerRequest(method="GET", uri="%s/%s" % (path, resource))
+        )
+
+    perNodeApp = Application(per_node_handlers(structure))
+    trieApp = trie_app(structure)
+    check_routes(perNodeApp, trieApp, requests)
+
+    return dict(
+        leaves=len(leafPaths),
+        perNode=time_routing(perNodeApp, requests),
+        trie=time_routing(trieApp, requests)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leaves", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=2000)
+    args = parser.parse_args()
+
+    results = run(args.leaves, args.requests)
+    print("leaves: %d" % results['leaves'])
+    for name in ("perNode", "trie"):
+        print("%-8s %10.2f us/request" % (name, results[name] * 1e6))
+
+
+if __name__ == '__main__':
+    main()
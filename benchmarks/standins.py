@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+In-memory datastore, queue and worker stand-ins, so a Spacewalk server can be
+benchmarked without Couchbase and beanstalkd, and a helper to run such a
+server
+"""
+import collections
+import copy
+import threading
+
+from tornado.httpserver import HTTPServer
+from tornado.testing import bind_unused_port
+import zerog
+
+import spacewalk
+from spacewalk.jobs import message_uuid
+
+import logging
+
+
+class MemoryDatastore(object):
+    """
+    Dictionary-backed datastore. Values are deep-copied in and out, like
+    they would be serialized to and from a real datastore.
+    """
+    def __init__(self):
+        self.docs = {}
+
+    def set(self, key, value):
+        self.docs[key] = copy.deepcopy(value)
+
+    def get(self, key):
+        return copy.deepcopy(self.docs.get(key))
+
+    def set_multi(self, docs):
+        for key, value in docs.items():
+            self.set(key, value)
+
+    def get_multi(self, keys):
+        return {key: self.get(key) for key in keys}
+
+    def delete(self, key):
+        self.docs.pop(key, None)
+
+
+class MemoryQueue(object):
+    """
+    FIFO queue
+    """
+    def __init__(self, queueName):
+        self.queueName = queueName
+        self.messages = collections.deque()
+
+    def put(self, message, **kwargs):
+        self.messages.append(message)
+
+    def put_multi(self, messages, **kwargs):
+        self.messages.extend(messages)
+
+    def reserve(self, timeout=None):
+        try:
+            return self.messages.popleft()
+        except IndexError:
+            return None
+
+
+class MemoryWorker(object):
+    """
+    Runs the jobs put in any of a server's :code:`MemoryQueue` s, one at a
+    time, in its own thread, so running jobs doesn't take time from the
+    IOLoop of the server being measured.
+    """
+    def __init__(self, datastore, queues, jobClasses, interval=0.01):
+        """
+        :param queues: dictionary that maps queue names to queues, which
+            the server adds its queues to as it makes them, like the one
+            kept by a :code:`make_queue_factory` queue factory
+        :type queues: dict
+
+        :param jobClasses: the job classes that can be run
+        :type jobClasses: list of :code:`spacewalk.BaseJob` subclasses
+
+        :param interval: seconds to wait when every queue is empty
+        :type interval: float
+        """
+        self.datastore = datastore
+        self.queues = queues
+        self.classes = {cls.JOB_TYPE: cls for cls in jobClasses}
+        self.interval = interval
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def run_job(self, queue, uuid):
+        doc = self.datastore.get(uuid)
+        job = self.classes[doc['jobType']](self.datastore, queue, **doc)
+
+        try:
+            resultCode = job.run()[0]
+        except Exception:
+            resultCode = 500
+
+        job.update_attrs(completeness=1.0, resultCode=resultCode)
+
+    def run(self):
+        while not self.stopping.is_set():
+            ran = False
+            # the server can add queues while the worker runs
+            for queue in list(self.queues.values()):
+                message = queue.reserve()
+                if message is not None:
+                    self.run_job(queue, message_uuid(message))
+                    ran = True
+
+            if not ran:
+                self.stopping.wait(self.interval)
+
+    def start(self):
+        self.thread = threading.Thread(
+            target=self.run, name="memory-worker", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+
+
+def make_datastore_factory():
+    """
+    :returns make_datastore: datastore factory for :code:`spacewalk.Server`
+        that always returns the same datastore
+    """
+    datastore = MemoryDatastore()
+
+    def make_datastore():
+        return datastore
+
+    return make_datastore
+
+
+def make_queue_factory():
+    """
+    :returns make_queue: queue factory for :code:`spacewalk.Server` that
+        returns the same queue for the same name, like tubes on one
+        beanstalkd. Its :code:`queues` attribute maps each name to its
+        queue.
+    """
+    queues = {}
+
+    def make_queue(queueName):
+        queue = queues.get(queueName)
+        if queue is None:
+            queue = queues[queueName] = MemoryQueue(queueName)
+        return queue
+
+    make_queue.queues = queues
+    return make_queue
+
+
+def start_server(rootcls, path=""):
+    """
+    Start a Spacewalk server for a job hierarchy, using the in-memory
+    datastore and queue, on an unused local port.
+
+    :returns url, structure, server: the server's base url, its
+        structure, and the HTTP server. The Spacewalk server is the HTTP
+        server's :code:`request_callback`, and its :code:`makeQueue` keeps
+        every queue it makes in :code:`makeQueue.queues`.
+    """
+    struct = spacewalk.Structure(spacewalk.auto_tree(rootcls, path))
+    server = spacewalk.Server(
+        struct,
+        "benchmark",
+        make_datastore_factory(),
+        make_queue_factory(),
+        zerog.find_subclasses(rootcls),
+        spacewalk.make_handlers(struct)
+    )
+
+    # don't log every 4xx response
+    logging.getLogger("tornado.access").setLevel(logging.ERROR)
+
+    sock, port = bind_unused_port()
+    httpServer = HTTPServer(server)
+    httpServer.add_sockets([sock])
+
+    return "http://127.0.0.1:%d" % port, struct, httpServer
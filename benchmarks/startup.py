@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Compare Structure build time with lazy post-schemas against generating
+every post-schema up front, as a Structure used to, and against loading a
+warmed-up structure from a snapshot.
+
+    $ python -m benchmarks.startup --leaves 2000 --params 20
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from spacewalk import snapshot
+from spacewalk.structure import auto_tree, Structure
+
+from benchmarks.synthetic import hierarchy_for_leaves
+
+
+def time_build(rootcls, eager):
+    start = time.perf_counter()
+    structure = Structure(auto_tree(rootcls, ""))
+    if eager:
+        structure.warm_up()
+
+    return time.perf_counter() - start
+
+
+def time_snapshot(rootcls, filename):
+    start = time.perf_counter()
+    fingerprint = snapshot.fingerprint(rootcls, "")
+    snapshot.load_snapshot(rootcls, filename, fingerprint)
+
+    return time.perf_counter() - start
+
+
+def run(numLeaves, numParams, repeats=3):
+    """
+    :returns results: fewest seconds to build the structure in
+        :code:`repeats` tries, which leaves out the garbage collector's
+        full collections, keyed by mode
+    :rtype: dict
+    """
+    rootcls = hierarchy_for_leaves(numLeaves, numParams=numParams)
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "structure.snapshot")
+        snapshot.cached_structure(rootcls, "", filename)
+
+        return dict(
+            eager=min(time_build(rootcls, True) for _ in range(repeats)),
+            lazy=min(time_build(rootcls, False) for _ in range(repeats)),
+            snapshot=min(
+                time_snapshot(rootcls, filename) for _ in range(repeats)
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--leaves", type=int, default=2000)
+    parser.add_argument("--params", type=int, default=20)
+    args = parser.parse_args()
+
+    results = run(args.leaves, args.params)
+    print("leaves: %d, params per leaf: %d" % (args.leaves, args.params))
+    for name in ("eager", "lazy", "snapshot"):
+        print("%-8s %8.3f s" % (name, results[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Compare job submission throughput for one POST per job to a leaf's /job
+endpoint against batched POSTs to its /jobs endpoint.
+
+    $ python -m benchmarks.submit --jobs 5000 --batch 500
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+from spacewalk import handlers
+
+from benchmarks.standins import start_server
+from benchmarks.synthetic import make_hierarchy
+
+
+async def submit_single(client, url, numJobs, concurrency):
+    async def worker(count):
+        for _ in range(count):
+            await client.fetch(
+                "%s/%s" % (url, handlers.RUN_JOB), method="POST", body="{}"
+            )
+
+    counts = [numJobs // concurrency] * concurrency
+    counts[0] += numJobs % concurrency
+    await asyncio.gather(*[worker(count) for count in counts])
+
+
+async def submit_batch(client, url, numJobs, batchSize):
+    for start in range(0, numJobs, batchSize):
+        size = min(batchSize, numJobs - start)
+        await client.fetch(
+            "%s/%s" % (url, handlers.RUN_JOBS),
+            method="POST",
+            body=json.dumps([{}] * size)
+        )
+
+
+async def run(numJobs, batchSize, concurrency):
+    """
+    :returns results: jobs per second, keyed by submission mode
+    :rtype: dict
+    """
+    url, struct, httpServer = start_server(
+        make_hierarchy(0, 0, 1, name="submit")
+    )
+    url += struct.get_leaf_paths()[0]
+    client = AsyncHTTPClient(max_clients=concurrency)
+
+    results = {}
+    start = time.perf_counter()
+    await submit_single(client, url, numJobs, concurrency)
+    results['single'] = numJobs / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await submit_batch(client, url, numJobs, batchSize)
+    results['batch'] = numJobs / (time.perf_counter() - start)
+
+    httpServer.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--jobs", type=int, default=5000)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args()
+
+    results = IOLoop.current().run_sync(
+        lambda: run(args.jobs, args.batch, args.concurrency)
+    )
+    print("jobs: %d, batch size: %d" % (args.jobs, args.batch))
+    for name in ("single", "batch"):
+        print("%-6s %10.0f jobs/s" % (name, results[name]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Micro-benchmark suite for building a Spacewalk structure, routing, and the
+discovery and post-schema handlers, on a synthetic job hierarchy.
+
+Results are saved as JSON, and can be compared against an earlier run to
+spot regressions:
+
+    $ python -m benchmarks.suite --depth 3 --width 10 --output new.json
+    $ python -m benchmarks.suite --output new.json --compare old.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+from tornado.ioloop import IOLoop
+
+from spacewalk import handlers
+from spacewalk.structure import auto_tree, make_path_map, Structure
+
+from benchmarks.standins import start_server
+from benchmarks.synthetic import make_hierarchy
+
+VERSION_FILE = "VERSION"
+
+# slowdown, as a ratio of medians, that is flagged by --compare
+REGRESSION_THRESHOLD = 1.2
+
+
+def summarize(times):
+    return dict(
+        median=statistics.median(times),
+        min=min(times),
+        mean=statistics.mean(times),
+        repeats=len(times)
+    )
+
+
+def measure(func, repeats, number=1):
+    """
+    :returns summary: statistics of the seconds per call of :code:`func`
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+
+    return summarize(times)
+
+
+async def measure_async(func, repeats, number=1):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        for _ in range(number):
+            await func()
+        times.append((time.perf_counter() - start) / number)
+
+    return summarize(times)
+
+
+def structure_benchmarks(rootcls, repeats):
+    tree = auto_tree(rootcls, "")
+    struct = Structure(tree)
+    struct.warm_up()
+
+    branchPath = struct.get_branch_paths()[-1]
+    leafPath = struct.get_leaf_paths()[-1]
+
+    return {
+        "auto_tree": measure(lambda: auto_tree(rootcls, ""), repeats),
+        "make_path_map": measure(lambda: make_path_map(tree, {}), repeats),
+        "Structure": measure(lambda: Structure(tree), repeats),
+        "Structure.warm_up": measure(
+            lambda: Structure(tree).warm_up(), repeats
+        ),
+        "make_handlers": measure(
+            lambda: handlers.make_handlers(struct), repeats, 100
+        ),
+        "get_branch_paths": measure(struct.get_branch_paths, repeats),
+        "get_leaf_paths": measure(struct.get_leaf_paths, repeats),
+        "get_sub_branches": measure(
+            lambda: struct.get_sub_branches(struct.get_root_path()),
+            repeats, 100
+        ),
+        "get_leaves": measure(
+            lambda: struct.get_leaves(branchPath), repeats, 1000
+        ),
+        "get_post_schema": measure(
+            lambda: struct.get_post_schema(leafPath), repeats, 1000
+        ),
+        "get_target": measure(
+            lambda: struct.get_target(leafPath), repeats, 1000
+        )
+    }
+
+
+async def handler_benchmarks(rootcls, repeats, number):
+    url, struct, httpServer = start_server(rootcls)
+    client = AsyncHTTPClient()
+
+    rootPath = struct.get_root_path()
+    branchPath = struct.get_branch_paths()[-1]
+    leafPath = struct.get_leaf_paths()[-1]
+
+    def fetch(path):
+        return lambda: client.fetch(url + path)
+
+    endpoints = {
+        "GET branches": "%s/%s" % (rootPath, handlers.BRANCHES),
+        "GET leaves": "%s/%s" % (branchPath, handlers.LEAVES),
+        "GET post-schema": "%s/%s" % (leafPath, handlers.POST_SCHEMA)
+    }
+
+    results = {}
+    for name, path in endpoints.items():
+        results[name] = await measure_async(fetch(path), repeats, number)
+
+    httpServer.stop()
+    return results
+
+
+def run(depth, width, leaves, params, repeats, number):
+    rootcls = make_hierarchy(depth, width, leaves, params, name="suite")
+    results = structure_benchmarks(rootcls, repeats)
+    results.update(
+        IOLoop.current().run_sync(
+            lambda: handler_benchmarks(rootcls, repeats, number)
+        )
+    )
+
+    try:
+        with open(VERSION_FILE) as f:
+            version = f.read().strip()
+    except OSError:
+        version = None
+
+    return dict(
+        meta=dict(
+            version=version,
+            python=platform.python_version(),
+            timestamp=time.time(),
+            depth=depth,
+            width=width,
+            leavesPerBranch=leaves,
+            params=params
+        ),
+        results=results
+    )
+
+
+def compare(new, old):
+    """
+    print each benchmark's median against an earlier run's
+
+    :returns regressions: names of benchmarks that got slower by more
+        than :code:`REGRESSION_THRESHOLD`
+    :rtype: list of str
+    """
+    regressions = []
+    for name, result in new['results'].items():
+        oldResult = old['results'].get(name)
+        if oldResult is None:
+            print("%-20s %12s" % (name, "new"))
+            continue
+
+        ratio = result['median'] / oldResult['median']
+        flag = ""
+        if ratio > REGRESSION_THRESHOLD:
+            flag = "  REGRESSION"
+            regressions.append(name)
+
+        print("%-20s %11.2fx%s" % (name, ratio, flag))
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--width", type=int, default=5)
+    parser.add_argument("--leaves", type=int, default=10,
+                        help="leaves per bottom level branch")
+    parser.add_argument("--params", type=int, default=5,
+                        help="params per leaf")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests per repeat for handler benchmarks")
+    parser.add_argument("--output", help="save results to this JSON file")
+    parser.add_argument("--compare", help="compare with this results file")
+    args = parser.parse_args()
+
+    results = run(
+        args.depth, args.width, args.leaves, args.params,
+        args.repeats, args.requests
+    )
+
+    for name, result in results['results'].items():
+        print("%-20s %12.2f us" % (name, result['median'] * 1e6))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+
+        print("\nmedian vs %s:" % args.compare)
+        if compare(results, old):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
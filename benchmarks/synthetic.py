@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Synthetic Spacewalk job hierarchies for benchmarking
+"""
+from marshmallow import fields, Schema
+
+from spacewalk.jobs import BaseJob
+
+
+def make_params(numParams):
+    """
+    make a Params schema class with :code:`numParams` integer fields
+    """
+    attrs = {"p%d" % i: fields.Integer() for i in range(numParams)}
+    return type("Params", (Schema,), attrs)
+
+
+def make_leaf(parent, name, numParams=1):
+    return type(
+        "Leaf_%s" % name.replace("-", "_"),
+        (parent,),
+        dict(
+            NAME=name,
+            LEAF_NAME=name,
+            DESCRIPTION="synthetic leaf %s" % name,
+            Params=make_params(numParams),
+            run=lambda self: (200, None)
+        )
+    )
+
+
+def make_branch(parent, name):
+    return type(
+        "Branch_%s" % name.replace("-", "_"),
+        (parent,),
+        dict(
+            NAME=name,
+            BRANCH_NAME=name,
+            DESCRIPTION="synthetic branch %s" % name
+        )
+    )
+
+
+def make_hierarchy(depth, width, leavesPerBranch, numParams=1, name="root"):
+    """
+    Dynamically create a job class hierarchy.
+
+    :param depth: number of branch levels below the root
+    :type depth: int
+
+    :param width: number of sub-branches for each branch above the bottom
+        level
+    :type width: int
+
+    :param leavesPerBranch: number of leaves on each bottom level branch
+    :type leavesPerBranch: int
+
+    :param numParams: number of Params fields for each leaf
+    :type numParams: int
+
+    :param name: BRANCH_NAME of the root class
+    :type name: str
+
+    :returns rootcls: the root job class
+    """
+    rootcls = make_branch(BaseJob, name)
+
+    # __subclasses__ only holds weak references, so keep the leaves alive
+    rootcls.synthetic = []
+
+    def grow(parent, prefix, level):
+        if level == depth:
+            for i in range(leavesPerBranch):
+                rootcls.synthetic.append(
+                    make_leaf(parent, "%s-l%d" % (prefix, i), numParams)
+                )
+            return
+
+        for i in range(width):
+            branchName = "%s-b%d" % (prefix, i)
+            grow(make_branch(parent, branchName), branchName, level + 1)
+
+    grow(rootcls, name, 0)
+    return rootcls
+
+
+def hierarchy_for_leaves(numLeaves, width=10, numParams=1, name="root"):
+    """
+    Make a hierarchy of branches :code:`width` wide with at least
+    :code:`numLeaves` leaves, and at most :code:`width` leaves per branch.
+
+    :returns rootcls: the root job class
+    """
+    depth = 0
+    while width ** (depth + 1) < numLeaves:
+        depth += 1
+
+    leavesPerBranch = -(-numLeaves // width ** depth)
+    return make_hierarchy(depth, width, leavesPerBranch, numParams, name)
+
@@ -1,6 +1,7 @@
 from marshmallow import fields, Schema
 import random
 import spacewalk
+import spacewalk.datastores
 import sys
 import time
 import tornado.ioloop
@@ -38,6 +39,9 @@ class WasteTimeJob(BaseExampleJob):
     LEAF_NAME = "waste_time"
     DESCRIPTION = "Randomly logs while wasting time"
 
+    # logs and adds to completeness in a loop, so coalesce the writes
+    BUFFER_WRITES = True
+
     class Params(Schema):
         delay = fields.Integer()
 
@@ -59,26 +63,19 @@ class WasteTimeJob(BaseExampleJob):
         return 200, None
 
 
-class FizzBuzzJobSchema(BaseExampleJobSchema):
-    output = fields.List(fields.String)
-
-
 class FizzBuzzJob(BaseExampleJob):
     NAME = "FizzBuzz Job"
     LEAF_NAME = "fizz_buzz"
     DESCRIPTION = "Solve FizzBuzz with settable n, fizz & buzz divisors"
 
-    BASE_SCHEMA = FizzBuzzJobSchema
+    # the output can be huge, so the data endpoint streams it
+    STREAM_FIELD = "output"
 
     class Params(Schema):
         n = fields.Integer(default=50, missing=50)
         fizzDivisor = fields.Integer(default=3, missing=3)
         buzzDivisor = fields.Integer(default=5, missing=5)
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.output = kwargs.get("output", [])
-
     def run(self):
         super().run()
 
@@ -97,19 +94,16 @@ class FizzBuzzJob(BaseExampleJob):
                 msg = str(i)
 
             output.append(msg)
+            if len(output) == self.STREAM_CHUNK_SIZE:
+                self.append_output(output)
+                output = []
 
-        self.update_attrs(output=output)
+        self.append_output(output)
         return 200, None
 
-    def get_data(self):
-        # start with the base data response and add our own
-        data = super().get_data()
-        data['output'] = self.output
-        return data
-
 
 def make_datastore():
-    return zerog.CouchbaseDatastore(
+    return spacewalk.datastores.CouchbaseDatastore(
         "couchbase", "Administrator", "password", "test"
     )
 
@@ -1,4 +1,7 @@
+from spacewalk.blobs import BlobStore, MmapFileStore
 from spacewalk.handlers import make_handlers
 from spacewalk.jobs import BaseJob, BaseJobSchema
-from spacewalk.server import Server
+from spacewalk.server import Server, serve_forked
+from spacewalk.snapshot import cached_structure
 from spacewalk.structure import auto_tree, Structure
+from spacewalk.worker import Worker
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Blob storage for large job results, kept out of the job document so they
+aren't read and rewritten with every update of the job. The job document
+keeps only a reference to each blob.
+
+A blob is a JSON-encoded value written and read in chunks, so neither
+writing nor serving it needs a second copy of the encoded value in
+memory. :code:`BlobStore` is the interface for storage backends, and
+:code:`MmapFileStore`, which keeps each blob in a local file, is the
+default.
+"""
+import abc
+import argparse
+import json
+import mmap
+import os
+import tempfile
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+# directory of the default blob store
+BLOB_DIR = os.environ.get(
+    "SPACEWALK_BLOB_DIR",
+    os.path.join(tempfile.gettempdir(), "spacewalk-blobs")
+)
+
+# bytes per chunk read from a blob
+BLOB_CHUNK_SIZE = 1 << 20
+
+_defaultStore = None
+
+
+def blob_key(uuid, field, version):
+    return "%s_%s_%s" % (uuid, field, version)
+
+
+def make_ref(key, size):
+    """
+    :returns ref: the reference to a blob kept in the job document
+    :rtype: dict
+    """
+    return dict(key=key, size=size)
+
+
+def encode_chunks(value):
+    """
+    :returns chunks: generator of the compact JSON encoding of a value, in
+        pieces, as bytes
+    :rtype: generator of bytes
+    """
+    encoder = json.JSONEncoder(separators=(",", ":"))
+    for piece in encoder.iterencode(value):
+        yield piece.encode("utf-8")
+
+
+class BlobStore(abc.ABC):
+    """
+    Interface for blob storage backends. Blobs are named by a key, which
+    is made of a job's uuid, a field name, and a version that is new each
+    time the field is stored. Subclasses MUST implement :code:`put`,
+    :code:`open`, :code:`delete` and :code:`sweep`, or they can't be
+    instantiated.
+    """
+    @abc.abstractmethod
+    def put(self, key, chunks):
+        """
+        Write a blob, replacing any earlier blob with the same key.
+
+        :param key: the blob's key
+        :type key: str
+
+        :param chunks: the blob's contents, in order
+        :type chunks: iterable of bytes
+
+        :returns size: the blob's size in bytes
+        :rtype: int
+        """
+
+    @abc.abstractmethod
+    def open(self, key, chunkSize=None):
+        """
+        Open a blob for reading, so a missing blob is found before any of
+        it is read.
+
+        :param key: the blob's key
+        :type key: str
+
+        :param chunkSize: most bytes per chunk. Defaults to
+            :code:`BLOB_CHUNK_SIZE`
+        :type chunkSize: int
+
+        :returns reader: iterable of the blob's contents, in order, which
+            MUST be closed, with :code:`close()` or as a context manager
+        :rtype: :code:`BlobReader`
+
+        :raises KeyError: if there is no blob for the key
+        """
+
+    def read_chunks(self, key, chunkSize=None):
+        """
+        :returns chunks: generator of the blob's contents, in order
+        :rtype: generator of bytes
+
+        :raises KeyError: when it is first read, if there is no blob for the
+            key
+        """
+        with self.open(key, chunkSize) as reader:
+            yield from reader
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """
+        Delete a blob, if there is one.
+
+        :param key: the blob's key
+        :type key: str
+        """
+
+    @abc.abstractmethod
+    def sweep(self, maxAge):
+        """
+        Delete the blobs written more than :code:`maxAge` seconds ago, for
+        stores of finished jobs' results that are only needed for a while.
+
+        :param maxAge: seconds
+        :type maxAge: float
+
+        :returns count: the number of blobs deleted
+        :rtype: int
+        """
+
+
+class BlobReader(abc.ABC):
+    """
+    Base class for readers of an open blob. Subclasses MUST implement
+    :code:`__iter__` and :code:`close`.
+    """
+    @abc.abstractmethod
+    def __iter__(self):
+        pass
+
+    @abc.abstractmethod
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class MappedBlob(BlobReader):
+    """
+    A blob file open for reading through a memory map
+    """
+    def __init__(self, f, chunkSize=None):
+        """
+        :param f: the open blob file
+        :type f: binary file
+
+        :param chunkSize: most bytes per chunk
+        :type chunkSize: int
+        """
+        self.file = f
+        self.chunkSize = chunkSize or BLOB_CHUNK_SIZE
+        self.size = os.fstat(f.fileno()).st_size
+
+        # an empty file can't be mapped
+        self.map = None
+        if self.size:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __iter__(self):
+        for start in range(0, self.size, self.chunkSize):
+            yield self.map[start:start + self.chunkSize]
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+
+        self.file.close()
+
+
+class MmapFileStore(BlobStore):
+    """
+    Keeps each blob in a file in a local directory, and reads blobs through
+    a memory map, so a blob is paged in from the file as it is served
+    rather than read into memory.
+
+    The API server and the workers must share the directory.
+    """
+    def __init__(self, directory=BLOB_DIR):
+        """
+        :param directory: the directory for the blob files, which is made
+            if it doesn't exist
+        :type directory: str
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        if os.sep in key or key.startswith("."):
+            raise ValueError("invalid blob key %r" % key)
+
+        return os.path.join(self.directory, key)
+
+    def put(self, key, chunks):
+        path = self.path(key)
+        size = 0
+
+        # write to a temporary file and rename it, so readers never see a
+        # partly written blob
+        fd, tmpPath = tempfile.mkstemp(dir=self.directory, prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in chunks:
+                    f.write(chunk)
+                    size += len(chunk)
+
+            os.replace(tmpPath, path)
+        except BaseException:
+            os.unlink(tmpPath)
+            raise
+
+        return size
+
+    def open(self, key, chunkSize=None):
+        try:
+            f = open(self.path(key), "rb")
+        except FileNotFoundError:
+            raise KeyError(key)
+
+        try:
+            return MappedBlob(f, chunkSize)
+        except BaseException:
+            f.close()
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self.path(key))
+        except FileNotFoundError:
+            pass
+
+    def sweep(self, maxAge):
+        # also removes temporary files left by writes that didn't finish
+        oldest = time.time() - maxAge
+        count = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < oldest:
+                    os.unlink(entry.path)
+                    count += 1
+            except FileNotFoundError:
+                pass
+
+        return count
+
+
+def default_store():
+    """
+    :returns store: the blob store for job classes that don't set
+        :code:`BLOB_STORE`, a :code:`MmapFileStore` in :code:`BLOB_DIR`
+    :rtype: :code:`MmapFileStore`
+    """
+    global _defaultStore
+    if _defaultStore is None:
+        _defaultStore = MmapFileStore(BLOB_DIR)
+
+    return _defaultStore
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Delete old blobs from a spacewalk blob directory"
+    )
+    parser.add_argument("--directory", default=BLOB_DIR,
+                        help="blob directory. Defaults to "
+                             "$SPACEWALK_BLOB_DIR")
+    parser.add_argument("--max-age", type=float, required=True,
+                        help="delete blobs written more than this many "
+                             "seconds ago")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    count = MmapFileStore(args.directory).sweep(args.max_age)
+    log.info("deleted %d blobs from %s", count, args.directory)
+
+
+if __name__ == '__main__':
+    main()
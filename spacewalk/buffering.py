@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Write-behind buffering of a job's datastore writes, so jobs that update
+their completeness or log in a tight loop write each of their documents
+once per flush rather than once per call.
+"""
+import copy
+import threading
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class WriteBehindDatastore(object):
+    """
+    Wraps a datastore and holds copies of the documents passed to
+    :code:`set` in memory, keeping only the last value for each key, until
+    the buffer is flushed. Reads of a buffered key with :code:`get` or
+    :code:`get_multi` return a copy of the buffered value, so they see
+    every earlier write, and deleting a buffered key drops its pending
+    write.
+
+    The buffer is flushed by a timer :code:`interval` seconds after the
+    first write it holds, so no write is held longer than that, or once
+    :code:`size` writes are buffered, or by calling :code:`flush`. Calls to
+    any other datastore method flush the buffer first, so they see every
+    earlier write. Call :code:`close` when done with it, to flush the
+    buffer and stop the timer.
+
+    The timer flushes from its own thread, so every use of the wrapped
+    datastore holds a lock, and a read or delete waits for a flush that
+    has started to finish.
+    """
+    def __init__(self, datastore, interval=1.0, size=50):
+        """
+        :param datastore: the datastore
+        :type datastore: zerog datastore
+
+        :param interval: most seconds a write is buffered before it's
+            flushed
+        :type interval: float
+
+        :param size: most writes that are buffered before a flush
+        :type size: int
+        """
+        self.wrapped = datastore
+        self.interval = interval
+        self.size = size
+        self.pending = {}
+        self.numWrites = 0
+        self.lastFlush = time.monotonic()
+        self.lock = threading.RLock()
+        self.timer = None
+
+    def set(self, key, value):
+        with self.lock:
+            # copied, like a write to the datastore, so changes to the
+            # value after the call don't change what's written
+            self.pending[key] = copy.deepcopy(value)
+            self.numWrites += 1
+
+            if (
+                self.numWrites >= self.size or
+                time.monotonic() - self.lastFlush >= self.interval
+            ):
+                self.flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.interval, self.flush_due)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def get(self, key):
+        with self.lock:
+            if key in self.pending:
+                return copy.deepcopy(self.pending[key])
+
+            return self.wrapped.get(key)
+
+    def get_multi(self, keys):
+        with self.lock:
+            unbuffered = [key for key in keys if key not in self.pending]
+            if not unbuffered:
+                docs = {}
+            elif hasattr(self.wrapped, "get_multi"):
+                docs = self.wrapped.get_multi(unbuffered)
+            else:
+                docs = {key: self.wrapped.get(key) for key in unbuffered}
+
+            for key in keys:
+                if key in self.pending:
+                    docs[key] = copy.deepcopy(self.pending[key])
+
+            return docs
+
+    def delete(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+            return self.wrapped.delete(key)
+
+    def flush(self):
+        """
+        write the buffered documents, with one bulk call if the datastore
+        supports it
+        """
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+
+            pending = self.pending
+            self.pending = {}
+            self.numWrites = 0
+            self.lastFlush = time.monotonic()
+
+            if not pending:
+                return
+
+            setMulti = getattr(self.wrapped, "set_multi", None)
+            if setMulti is None:
+                for key, value in pending.items():
+                    self.wrapped.set(key, value)
+            else:
+                setMulti(pending)
+
+    def flush_due(self):
+        """
+        flush the buffer when its timer fires. Errors are logged, since
+        there's no caller to raise them to
+        """
+        try:
+            self.flush()
+        except Exception:
+            log.exception("timed flush of buffered writes failed")
+
+    def close(self):
+        """
+        flush the buffer and stop its timer
+        """
+        self.flush()
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        def flushed(*args, **kwargs):
+            with self.lock:
+                self.flush()
+                return attr(*args, **kwargs)
+
+        return flushed
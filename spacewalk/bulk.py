@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Bulk datastore and queue calls for backends that only have single-item
+calls, like zerog's :code:`CouchbaseDatastore` and :code:`BeanstalkdQueue`.
+
+The single-item calls are made concurrently from a thread pool, so a bulk
+call waits for about one round trip per thread rather than one per item.
+Backends with their own bulk calls are used as they are.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+# concurrent calls made by each bulk call
+BULK_THREADS = 8
+
+_executor = None
+_executorLock = threading.Lock()
+
+
+def get_executor():
+    """
+    :returns executor: the thread pool shared by all bulk calls, made when
+        it's first needed
+    :rtype: :code:`concurrent.futures.ThreadPoolExecutor`
+    """
+    global _executor
+    with _executorLock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=BULK_THREADS, thread_name_prefix="spacewalk-bulk"
+            )
+
+    return _executor
+
+
+def split(items, count):
+    """
+    :returns slices: :code:`items` in at most :code:`count` slices of
+        nearly equal length, in order
+    :rtype: list of list
+    """
+    size = -(-len(items) // count) if items else 1
+    return [items[start:start + size] for start in range(0, len(items), size)]
+
+
+def wait_all(futures):
+    """
+    wait for all the futures, then raise the first of their exceptions,
+    if any
+    """
+    futures = list(futures)
+    errors = [f.exception() for f in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+
+
+class BulkDatastore(object):
+    """
+    Wraps a datastore that lacks :code:`get_multi` or :code:`set_multi`,
+    and makes them with concurrent calls to its :code:`get` or
+    :code:`set`. The datastore's own bulk calls are used if it has them.
+    The datastore's client MUST be thread-safe, as the Couchbase SDK is.
+    """
+    def __init__(self, datastore):
+        """
+        :param datastore: the datastore
+        :type datastore: zerog datastore
+        """
+        self.wrapped = datastore
+
+    def get_multi(self, keys):
+        """
+        :param keys: document keys
+        :type keys: list of str
+
+        :returns docs: dictionary that maps each key to its document, or
+            None if there is no document for the key
+        :rtype: dict
+        """
+        getMulti = getattr(self.wrapped, "get_multi", None)
+        if getMulti is not None:
+            return getMulti(keys)
+
+        def get_docs(keys):
+            return [(key, self.wrapped.get(key)) for key in keys]
+
+        slices = split(list(keys), BULK_THREADS)
+        if len(slices) == 1:
+            return dict(get_docs(slices[0]))
+
+        futures = [get_executor().submit(get_docs, s) for s in slices]
+        wait_all(futures)
+        return dict(item for f in futures for item in f.result())
+
+    def set_multi(self, docs):
+        """
+        :param docs: dictionary that maps each key to its document
+        :type docs: dict
+        """
+        setMulti = getattr(self.wrapped, "set_multi", None)
+        if setMulti is not None:
+            return setMulti(docs)
+
+        def set_docs(items):
+            for key, value in items:
+                self.wrapped.set(key, value)
+
+        slices = split(list(docs.items()), BULK_THREADS)
+        if len(slices) == 1:
+            return set_docs(slices[0])
+
+        wait_all(get_executor().submit(set_docs, s) for s in slices)
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+class BulkQueue(object):
+    """
+    Wraps a queue that has no :code:`put_multi`, and puts the messages of
+    a :code:`put_multi` over several connections at once, made by
+    :code:`makeQueue` when they're first needed. The messages are put in
+    order over each connection, but not across connections.
+    """
+    def __init__(self, queue, makeQueue):
+        """
+        :param queue: the queue, which is also the first connection
+        :type queue: zerog queue
+
+        :param makeQueue: function that makes another connection to the
+            same queue
+        :type makeQueue: callable
+        """
+        self.wrapped = queue
+        self.makeQueue = makeQueue
+        self.connections = [queue]
+        self.lock = threading.Lock()
+
+    def put_multi(self, messages, **kwargs):
+        """
+        :param messages: queue messages
+        :type messages: list of str
+
+        :param `**kwargs`: keyword arguments passed to each :code:`put`,
+            such as :code:`priority`
+        """
+        def put_messages(queue, messages):
+            for message in messages:
+                queue.put(message, **kwargs)
+
+        slices = split(list(messages), BULK_THREADS)
+        if len(slices) == 1:
+            return put_messages(self.wrapped, slices[0])
+
+        # a connection is only used by one thread at a time
+        with self.lock:
+            while len(self.connections) < len(slices):
+                self.connections.append(self.makeQueue())
+
+            wait_all(
+                get_executor().submit(put_messages, queue, s)
+                for queue, s in zip(self.connections, slices)
+            )
+
+    def __getattr__(self, name):
+        return getattr(self.wrapped, name)
+
+
+def bulk_datastore(datastore):
+    """
+    :returns datastore: the datastore if it has :code:`get_multi` and
+        :code:`set_multi`, otherwise a :code:`BulkDatastore` that wraps it
+    """
+    if hasattr(datastore, "get_multi") and hasattr(datastore, "set_multi"):
+        return datastore
+
+    return BulkDatastore(datastore)
+
+
+def bulk_queue(queue, makeQueue):
+    """
+    :returns queue: the queue if it has :code:`put_multi`, otherwise a
+        :code:`BulkQueue` that wraps it
+    """
+    if hasattr(queue, "put_multi"):
+        return queue
+
+    return BulkQueue(queue, makeQueue)
@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+zerog datastores with the extra calls that Spacewalk uses when they're
+available: writes with a datastore TTL, and inserts that only succeed if
+the key is absent, which make idempotency keys atomic across processes.
+"""
+import datetime
+
+from couchbase.exceptions import DocumentExistsException
+try:
+    from couchbase.options import InsertOptions, UpsertOptions
+except ImportError:
+    # Couchbase SDK before 3.2
+    from couchbase.collection import InsertOptions, UpsertOptions
+import zerog
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class CouchbaseDatastore(zerog.CouchbaseDatastore):
+    """
+    zerog's Couchbase datastore, with :code:`insert` and :code:`upsert`
+    calls that set the document's expiry. Make the server's datastore with
+    this class to share idempotency keys safely between processes.
+    """
+    def insert(self, key, value, ttl=None):
+        """
+        Write a document only if there is none for its key.
+
+        :param ttl: seconds until Couchbase deletes the document, or None
+            to keep it
+        :type ttl: float
+
+        :returns inserted: False if the key already had a document
+        :rtype: bool
+        """
+        try:
+            self.collection.insert(key, value, InsertOptions(**expiry(ttl)))
+        except DocumentExistsException:
+            return False
+
+        return True
+
+    def upsert(self, key, value, ttl=None):
+        """
+        Write a document, replacing any document for its key.
+
+        :param ttl: seconds until Couchbase deletes the document, or None
+            to keep it
+        :type ttl: float
+        """
+        self.collection.upsert(key, value, UpsertOptions(**expiry(ttl)))
+
+
+def expiry(ttl):
+    if ttl is None:
+        return {}
+
+    return dict(expiry=datetime.timedelta(seconds=max(ttl, 1)))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Response formats, chosen by a request's :code:`Accept` header, and the
+codecs that encode them and decode request bodies.
+
+Pretty-printed JSON is for people, so it's what a request gets if it
+doesn't ask for anything in particular. Clients that ask for
+:code:`application/json` get compact JSON, and clients that ask for
+:code:`application/msgpack` get MessagePack, if the :code:`msgpack`
+package is installed.
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+import logging
+log = logging.getLogger(__name__)
+
+PRETTY = "pretty"
+COMPACT = "compact"
+MSGPACK = "msgpack"
+
+JSON_TYPE = "application/json"
+MSGPACK_TYPE = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK_TYPE, "application/x-msgpack")
+
+# media types that get the default format
+WILDCARD_TYPES = ("*/*", "application/*", "text/*", "text/plain")
+
+CONTENT_TYPES = {
+    PRETTY: "%s; charset=UTF-8" % JSON_TYPE,
+    COMPACT: "%s; charset=UTF-8" % JSON_TYPE,
+    MSGPACK: MSGPACK_TYPE
+}
+
+
+class JsonCodec(object):
+    """
+    Encodes and decodes JSON with the standard library. Pass a subclass
+    with a faster encoder to :code:`spacewalk.Server` as
+    :code:`jsonCodec` to use it instead.
+    """
+    def dumps(self, obj, pretty=False):
+        """
+        :param obj: JSON-serializable object
+        :type obj: any
+
+        :param pretty: if True, indent the encoding for people to read
+        :type pretty: bool
+
+        :returns encoded:
+        :rtype: str or bytes
+        """
+        if pretty:
+            return json.dumps(obj, indent=4)
+
+        return json.dumps(obj, separators=(",", ":"))
+
+    def loads(self, data):
+        """
+        :param data: a JSON document
+        :type data: str or bytes
+
+        :returns obj:
+
+        :raises ValueError: if data isn't valid JSON
+        """
+        return json.loads(data)
+
+
+def msgpack_dumps(obj):
+    return msgpack.packb(obj, use_bin_type=True)
+
+
+def msgpack_loads(data):
+    try:
+        return msgpack.unpackb(data, raw=False)
+    except Exception as e:
+        # msgpack raises several exception types for bad data
+        raise ValueError(str(e))
+
+
+def parse_accept(header):
+    """
+    :param header: an :code:`Accept` header
+    :type header: str
+
+    :returns mediaTypes: the acceptable media types, most preferred first,
+        each with its parameters other than :code:`q`
+    :rtype: list of (str, dict)
+    """
+    accepted = []
+    for index, item in enumerate(header.split(",")):
+        mediaType, *params = [part.strip() for part in item.split(";")]
+        if not mediaType:
+            continue
+
+        quality = 1.0
+        kwargs = {}
+        for param in params:
+            name, _, value = param.partition("=")
+            name = name.strip().lower()
+            if name == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+            else:
+                kwargs[name] = value.strip()
+
+        if quality > 0:
+            accepted.append((-quality, index, mediaType.lower(), kwargs))
+
+    accepted.sort()
+    return [(mediaType, kwargs) for _, _, mediaType, kwargs in accepted]
+
+
+def negotiate(header, default=PRETTY):
+    """
+    :param header: a request's :code:`Accept` header, or None
+    :type header: str
+
+    :param default: the format for requests that will take anything
+    :type default: str
+
+    :returns format: :code:`PRETTY`, :code:`COMPACT` or :code:`MSGPACK`.
+        :code:`application/json` gets :code:`COMPACT`, unless the request
+        asks for an :code:`indent`. Requests that accept nothing that's
+        available get the default.
+    :rtype: str
+    """
+    for mediaType, params in parse_accept(header or ""):
+        if mediaType == JSON_TYPE:
+            return PRETTY if "indent" in params else COMPACT
+
+        if mediaType in MSGPACK_TYPES and msgpack is not None:
+            return MSGPACK
+
+        if mediaType in WILDCARD_TYPES:
+            return default
+
+    return default
+
+
+def body_format(contentType):
+    """
+    :returns format: :code:`MSGPACK` for a request body with a MessagePack
+        :code:`Content-Type`, otherwise :code:`COMPACT`, for JSON
+    :rtype: str
+    """
+    mediaType = (contentType or "").split(";")[0].strip().lower()
+    if mediaType in MSGPACK_TYPES:
+        return MSGPACK
+
+    return COMPACT
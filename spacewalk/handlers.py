@@ -7,10 +7,22 @@ Request handlers and endpoints for the auto-generated Spacewalk API
 
 import zerog
 
+import asyncio
+import hashlib
 import json
+from tornado.iostream import StreamClosedError
+from tornado.routing import Router
 from tornado.web import HTTPError
+from uuid import uuid4
 
-from spacewalk.structure import NotLeafError
+from spacewalk import formats
+from spacewalk.idempotency import IDEMPOTENCY_HEADER, params_digest
+from spacewalk import joblogs
+from spacewalk import metrics
+from spacewalk import outputs
+from spacewalk.profiling import decode_stats, profile_key, PROFILE_PARAM
+from spacewalk.structure import Branch, Leaf
+from spacewalk.watchers import FINAL_EVENTS
 
 import logging
 log = logging.getLogger(__name__)
@@ -21,21 +33,254 @@ BRANCHES = "branches"
 LEAVES = "leaves"
 POST_SCHEMA = "post-schema"
 RUN_JOB = "job"
+RUN_JOBS = "jobs"
 
+# most jobs that can be submitted in one batch
+MAX_BATCH = 1000
 
-class BranchHandler(zerog.BaseHandler):
+# most jobs whose progress can be requested at once
+MAX_PROGRESS_UUIDS = 500
+
+# seconds between keepalive comments on an idle progress stream
+STREAM_KEEPALIVE = 15
+
+# number of a job's latest log events returned by /info
+INFO_LOG_EVENTS = 20
+
+# default and most log events returned by one /logs request
+LOG_PAGE_SIZE = 100
+MAX_LOG_PAGE_SIZE = 1000
+
+# default and most streamed output items returned by one /data request
+DATA_PAGE_SIZE = 1000
+MAX_DATA_PAGE_SIZE = 10000
+
+NDJSON_TYPE = "application/x-ndjson"
+
+# seconds that caches may keep the responses for a finished job
+FINISHED_JOB_MAX_AGE = 365 * 86400
+
+
+def job_etag(doc, *parts):
+    """
+    Make an ETag for a representation of a job resource from the job
+    document's version: its CAS, if the datastore put one in it, or else a
+    digest of the document. Its :code:`updatedAt` isn't used, since it
+    only has second resolution, and a job may be updated several times a
+    second.
+
+    :param doc: the job document
+    :type doc: dict
+
+    :param `*parts`: whatever else the representation depends on, like
+        the response format and query arguments
+    :type `*parts`: str or int
+
+    :returns etag: the ETag
+    :rtype: str
+    """
+    version = doc.get("cas")
+    if version is None:
+        version = hashlib.blake2b(
+            json.dumps(doc, sort_keys=True, default=str).encode("utf-8"),
+            digest_size=12
+        ).hexdigest()
+
+    return '"%s"' % "-".join(str(part) for part in (version,) + parts)
+
+
+class FormatMixin(object):
+    """
+    Sends responses in the format negotiated from the request's
+    :code:`Accept` header: pretty-printed JSON by default, compact JSON for
+    :code:`application/json`, or MessagePack for
+    :code:`application/msgpack`. Pass :code:`?compact=true` for compact
+    JSON whatever the header says.
+
+    Decodes JSON or MessagePack request bodies by their
+    :code:`Content-Type`.
+    """
+    def response_format(self):
+        if self.get_argument("compact", "false") == "true":
+            return formats.COMPACT
+
+        return formats.negotiate(self.request.headers.get("Accept"))
+
+    def complete_obj(self, code, obj):
+        """
+        Complete the request with an object encoded in the negotiated
+        format.
+
+        :param code: the HTTP status code
+        :type code: int
+
+        :param obj: the response
+        :type obj: JSON-serializable object
+        """
+        responseFormat = self.response_format()
+        if responseFormat == formats.MSGPACK:
+            body = formats.msgpack_dumps(obj)
+        else:
+            body = self.application.jsonCodec.dumps(
+                obj, pretty=responseFormat == formats.PRETTY
+            )
+
+        self.set_header("Content-Type", formats.CONTENT_TYPES[responseFormat])
+        self.set_header("Vary", "Accept")
+        self.complete(code, output=body)
+
+    def decode_body(self, default=None):
+        """
+        :param default: what an empty body decodes to. If None, an empty
+            body is invalid.
+
+        :returns obj: the decoded request body
+
+        :raises HTTPError: 400 if the body can't be decoded, or 415 for a
+            MessagePack body if MessagePack isn't available
+        """
+        body = self.request.body
+        if not body and default is not None:
+            return default
+
+        contentType = self.request.headers.get("Content-Type")
+        if formats.body_format(contentType) == formats.MSGPACK:
+            if formats.msgpack is None:
+                raise HTTPError(415, "MessagePack is not supported")
+
+            name, loads = "MessagePack", formats.msgpack_loads
+        else:
+            name, loads = "JSON", self.application.jsonCodec.loads
+
+        try:
+            return loads(body)
+        except ValueError:
+            raise HTTPError(400, "request body is not valid %s" % name)
+
+
+class ConditionalMixin(object):
+    """
+    Answers conditional GETs with a 304 before building the response, for
+    resources whose ETag is known up front.
+    """
+    def not_modified(self, etag, cacheControl=None):
+        """
+        Set the response's ETag and Cache-Control headers, and complete the
+        request with a 304 if its :code:`If-None-Match` header matches.
+
+        :param etag: the ETag of the response, or None if it has none
+        :type etag: str
+
+        :param cacheControl: the Cache-Control header, if any
+        :type cacheControl: str
+
+        :returns notModified: True if the request was completed
+        :rtype: bool
+        """
+        if cacheControl is not None:
+            self.set_header("Cache-Control", cacheControl)
+
+        if etag is None:
+            return False
+
+        self.set_header("Etag", etag)
+        if not self.check_etag_header():
+            return False
+
+        self.set_status(304)
+        self.finish()
+        return True
+
+    def job_not_modified(self, doc, *parts):
+        """
+        :code:`not_modified` for a job resource. Finished jobs don't change,
+        so caches may keep their responses for a long time. Others must be
+        revalidated each time.
+
+        :param doc: the job document
+        :type doc: dict
+
+        :param `*parts`: whatever else the representation depends on
+        :type `*parts`: str or int
+        """
+        self.set_header("Vary", "Accept")
+
+        if doc.get("resultCode") is None:
+            cacheControl = "no-cache"
+        else:
+            cacheControl = "public, max-age=%d, immutable" % (
+                FINISHED_JOB_MAX_AGE
+            )
+
+        return self.not_modified(job_etag(doc, *parts), cacheControl)
+
+
+class StructureHandler(ConditionalMixin, FormatMixin, zerog.BaseHandler):
+    """
+    Base class for handlers of resources under a Branch or Leaf. The
+    :code:`StructureRouter` resolves the request path and passes the
+    Branch or Leaf in as :code:`target`.
+    """
+    def initialize(self, target=None, path=None, **kwargs):
+        super().initialize(**kwargs)
+        self.target = target
+        self.path = path
+
+    def get_branch(self):
+        if not isinstance(self.target, Branch):
+            raise HTTPError(404, "No branch for %s" % self.path)
+
+        return self.target
+
+    def get_leaf(self):
+        if self.target is None:
+            raise HTTPError(404, "No job for %s" % self.path)
+
+        if not isinstance(self.target, Leaf):
+            raise HTTPError(400, "%s is a branch, not a job" % self.path)
+
+        return self.target
+
+    def complete_encoded(self, encoded):
+        """
+        Complete the request with a pre-encoded response body, in the
+        negotiated format. A gzipped JSON body is sent if the client
+        accepts it. A request whose :code:`If-None-Match` has the
+        encoding's ETag gets a 304.
+
+        :param encoded: the response
+        :type encoded: :code:`spacewalk.structure.EncodedResponse`
+        """
+        responseFormat = self.response_format()
+        self.set_header("Content-Type", formats.CONTENT_TYPES[responseFormat])
+        self.set_header("Vary", "Accept, Accept-Encoding")
+
+        if responseFormat == formats.MSGPACK:
+            if not self.not_modified(encoded.etag(msgpack=True)):
+                self.complete(200, output=encoded.get_msgpack())
+            return
+
+        compact = responseFormat == formats.COMPACT
+        gzipped = "gzip" in self.request.headers.get("Accept-Encoding", "")
+        if self.not_modified(encoded.etag(compact, gzipped)):
+            return
+
+        body, gzipped = encoded.get_body(compact, gzipped)
+        if gzipped:
+            self.set_header("Content-Encoding", "gzip")
+
+        self.complete(200, output=body)
+
+
+class BranchHandler(StructureHandler):
     """
     Returns a list of sub-branches or leaves for a branch. Must be
-    subclassed and subclass must override the :code:`get_collection` method
+    subclassed and subclass must override the :code:`get_encoded` method
     """
     def get(self):
-        info = self.get_collection()
-        self.complete(
-            200,
-            output=json.dumps(info, indent=4)
-        )
+        self.complete_encoded(self.get_encoded())
 
-    def get_collection(self):
+    def get_encoded(self):
         # subclass this
         pass
 
@@ -44,104 +289,718 @@ class SubBranchesHandler(BranchHandler):
     """
     Returns a list of info dictionaries for each sub-branch of a branch
     """
-    def get_collection(self):
-        # strip the resource request from the path
-        path = self.request.path.replace("/%s" % BRANCHES, "")
-
-        try:
-            info = self.application.structure.get_sub_branches(path)
-        except KeyError:
-            raise HTTPError(404, "No branch for %s" % path)
-
-        return info
+    def get_encoded(self):
+        return self.get_branch().encodedBranches
 
 
 class LeavesHandler(BranchHandler):
     """
     Returns a list of info dictionaries for each leaf in a branch
     """
-    def get_collection(self):
-        # strip the resource request from the path
-        path = self.request.path.replace("/%s" % LEAVES, "")
+    def get_encoded(self):
+        return self.get_branch().encodedLeaves
+
+
+class PostSchemaHandler(StructureHandler):
+    """
+    Returns a JSONSchema of the parameters to pass for a POST to a leaf
+    endpoint
+    """
+    def get(self):
+        self.complete_encoded(self.get_leaf().encodedPostschema)
+
+
+class RunJobHandler(StructureHandler):
+    """
+    Starts a zerog job for a particular endpoint.
+
+    Arguments are validated against the leaf's Params before anything else
+    is done, and invalid arguments get a 400 response with the field
+    errors. Arguments that name the job's own fields, like :code:`uuid` or
+    :code:`blobs`, are dropped.
+
+    If the request has an :code:`Idempotency-Key` header, the key is
+    claimed for the new job's uuid before the job is created, so of several
+    requests with the same key for this endpoint, only one creates a job,
+    and the others get its uuid. A request that reuses a key with
+    different params gets a 422.
+
+    For a :code:`DETERMINISTIC` job class, a recent job with the same
+    params is reused the same way.
+    """
+    params = None
+
+    def prepare(self):
+        super().prepare()
+        if self.request.method != "POST":
+            return
+
+        leaf = self.get_leaf()
+        self.params = self.decode_body(default={})
+
+        errors = leaf.validate(self.params)
+        if errors:
+            self.complete_obj(400, dict(errors=errors))
+
+    def post(self):
+        leaf = self.get_leaf()
+        cls = leaf.cls
+        key = self.request.headers.get(IDEMPOTENCY_HEADER)
+        keys = self.application.idempotencyKeys
+
+        # a profiled job has to actually run
+        profiled = self.params.get(PROFILE_PARAM) is True
+        reuse = cls.DETERMINISTIC and not profiled
+        digest = None
+        if key or reuse:
+            digest = params_digest(leaf, self.params)
+
+        params = cls.request_params(self.params)
+        if key:
+            params = dict(params, uuid=str(uuid4()))
+            record = keys.claim(
+                cls.JOB_TYPE, key, params['uuid'], paramsDigest=digest
+            )
+            if record is not None:
+                self.replay(record, digest)
+                return
+
+        if reuse:
+            uuid = self.reusable_job(cls, digest)
+            if uuid is not None:
+                if key:
+                    keys.set(cls.JOB_TYPE, key, uuid, paramsDigest=digest)
+
+                self.set_header("Reused-Result", "true")
+                self.complete_obj(201, dict(uuid=uuid))
+                return
 
         try:
-            info = self.application.structure.get_leaves(path)
-        except KeyError:
-            raise HTTPError(404, "No branch for %s" % path)
+            job = self.application.make_jobs(cls, [params])[0]
+        except Exception:
+            # let a retry with the same key create the job
+            if key:
+                keys.delete(cls.JOB_TYPE, key)
+
+            raise
+
+        if reuse:
+            self.application.resultIndex.set(
+                cls.JOB_TYPE, digest, job.uuid, ttl=cls.REUSE_MAX_AGE
+            )
+
+        self.complete_obj(201, dict(uuid=job.uuid))
+
+    def replay(self, record, digest):
+        """
+        respond with the job created by an earlier request with the same
+        :code:`Idempotency-Key`, if it had the same params
+        """
+        recorded = record.get("paramsDigest")
+        if recorded is not None and recorded != digest:
+            raise HTTPError(
+                422,
+                "%s was already used with different params" %
+                IDEMPOTENCY_HEADER
+            )
 
-        return info
+        self.set_header("Idempotent-Replayed", "true")
+        self.complete_obj(201, dict(uuid=record['uuid']))
 
+    def reusable_job(self, cls, digest):
+        """
+        :returns uuid: uuid of a recent job with the same params digest
+            that is still running or finished successfully, or None
+        """
+        uuid = self.application.resultIndex.get(cls.JOB_TYPE, digest)
+        if uuid is None:
+            return None
 
-class PostSchemaHandler(zerog.BaseHandler):
+        doc = self.application.read_jobs([uuid])[uuid]
+        if doc is None:
+            return None
+
+        resultCode = doc.get("resultCode")
+        if resultCode is not None and not 200 <= resultCode < 300:
+            return None
+
+        return uuid
+
+
+class RunJobsHandler(StructureHandler):
     """
-    Returns a JSONSchema of the parameters to pass for a POST to a leaf
-    endpoint
+    Starts a batch of zerog jobs for a particular endpoint.
+
+    The request body is a JSON array of parameter objects, one per job.
+    Every item is validated against the leaf's Params before any job is
+    created, then the valid jobs are created in bulk. The response has an
+    entry per item, in order: :code:`{"uuid": ...}` for a job that was
+    created, or :code:`{"errors": ...}` for an item that failed validation.
+    It's a 400 only if every item failed, so an empty batch is a 201 with
+    no jobs.
+    """
+    def post(self):
+        leaf = self.get_leaf()
+        paramsList = self.decode_body()
+
+        if not isinstance(paramsList, list):
+            raise HTTPError(400, "request body must be a list of params")
+
+        if len(paramsList) > MAX_BATCH:
+            raise HTTPError(
+                400, "batch is larger than the maximum of %d" % MAX_BATCH
+            )
+
+        results = []
+        valid = []
+        for item in paramsList:
+            errors = leaf.validate(item)
+            if errors:
+                results.append(dict(errors=errors))
+            else:
+                results.append(None)
+                valid.append(leaf.cls.request_params(item))
+
+        jobs = iter(self.application.make_jobs(leaf.cls, valid))
+        results = [r or dict(uuid=next(jobs).uuid) for r in results]
+
+        code = 400 if results and not valid else 201
+        self.complete_obj(code, dict(jobs=results))
+
+
+class MultiProgressHandler(FormatMixin, zerog.BaseHandler):
+    """
+    Returns the progress of several jobs at once, from a single bulk
+    datastore read.
+
+    Pass the uuids as repeated :code:`uuid` query arguments to a GET, or as
+    a JSON array in the body of a POST. The response maps each uuid to its
+    job's completeness and result, or to null if there is no such job.
     """
     def get(self):
-        path = self.request.path.replace("/%s" % POST_SCHEMA, "")
+        self.complete_progress(self.get_arguments("uuid"))
+
+    def post(self):
+        uuids = self.decode_body()
+
+        if (
+            not isinstance(uuids, list) or
+            not all(isinstance(uuid, str) for uuid in uuids)
+        ):
+            raise HTTPError(400, "request body must be a list of uuids")
+
+        self.complete_progress(uuids)
+
+    def complete_progress(self, uuids):
+        if len(uuids) > MAX_PROGRESS_UUIDS:
+            raise HTTPError(
+                400,
+                "more than the maximum of %d uuids" % MAX_PROGRESS_UUIDS
+            )
+
+        progress = {}
+        for uuid, doc in self.application.read_jobs(uuids).items():
+            if doc is None:
+                progress[uuid] = None
+            else:
+                progress[uuid] = dict(
+                    completeness=doc.get("completeness"),
+                    result=doc.get("resultCode")
+                )
+
+        self.complete_obj(200, progress)
+
+
+class ProgressHandler(FormatMixin, zerog.ProgressHandler):
+    """
+    Returns a job's completeness and result.
+    """
+    def get(self, uuid):
+        doc = self.application.read_jobs([uuid])[uuid]
+        if doc is None:
+            raise HTTPError(404, "No job for %s" % uuid)
+
+        self.complete_obj(
+            200,
+            dict(
+                completeness=doc.get("completeness"),
+                result=doc.get("resultCode")
+            )
+        )
+
+
+class ProgressStreamHandler(zerog.BaseHandler):
+    """
+    Streams a job's progress as server-sent events, instead of the client
+    polling the progress endpoint.
+
+    Starts with a :code:`log` event with the job's events so far. Sends a
+    :code:`progress` event with completeness and result when the
+    completeness changes, a :code:`log` event with a list of new job
+    events, and a final :code:`result` event when the job finishes. Sends
+    :code:`not-found` and ends if there is no job for the uuid.
+    """
+    queue = None
+
+    async def get(self, uuid):
+        self.set_header("Content-Type", "text/event-stream")
+        self.set_header("Cache-Control", "no-cache")
+
+        watchers = self.application.watchers
+        self.queue = watchers.subscribe(uuid)
 
         try:
-            schema = self.application.structure.get_post_schema(path)
-        except KeyError:
-            raise HTTPError(404, "No job for %s" % path)
-        except NotLeafError:
-            raise HTTPError(400, "%s is a branch, not a job" % path)
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(
+                        self.queue.get(), STREAM_KEEPALIVE
+                    )
+                except asyncio.TimeoutError:
+                    self.write(": keepalive\n\n")
+                    await self.flush()
+                    continue
+
+                if event is None:
+                    # connection closed
+                    return
+
+                self.write(
+                    "event: %s\ndata: %s\n\n" % (event, json.dumps(data))
+                )
+                await self.flush()
+
+                if event in FINAL_EVENTS:
+                    break
+        except StreamClosedError:
+            return
+        finally:
+            watchers.unsubscribe(uuid, self.queue)
+
+        self.finish()
+
+    def on_connection_close(self):
+        if self.queue is not None:
+            self.queue.put_nowait((None, None))
+
+
+class MetricsHandler(zerog.BaseHandler):
+    """
+    Returns this process's metrics in the Prometheus text format
+    """
+    def get(self):
+        self.set_header("Content-Type", metrics.CONTENT_TYPE)
+        self.complete(200, output=metrics.REGISTRY.render())
+
+
+class ProfileHandler(FormatMixin, zerog.BaseHandler):
+    """
+    Returns the profile of a job that ran with profiling on: a summary of
+    the functions with the most cumulative time. Pass :code:`?raw=true` to
+    download the raw stats in pstats file format instead.
+    """
+    def get(self, uuid):
+        key = profile_key(uuid)
+        docs = self.application.read_jobs([uuid, key])
+        doc = docs[uuid]
+        if doc is None:
+            raise HTTPError(404, "No job for %s" % uuid)
+
+        # jobs from before profile documents kept the profile in the job
+        profile = docs[key] or doc.get("profile")
+        if not profile:
+            raise HTTPError(404, "No profile for job %s" % uuid)
+
+        if self.get_argument("raw", "false") == "true":
+            self.set_header("Content-Type", "application/octet-stream")
+            self.set_header(
+                "Content-Disposition", "attachment; filename=%s.prof" % uuid
+            )
+            self.complete(200, output=decode_stats(profile['stats']))
+            return
+
+        self.complete_obj(200, dict(summary=profile['summary']))
+
+
+class InfoHandler(ConditionalMixin, FormatMixin, zerog.InfoHandler):
+    """
+    Returns a job's completeness and result, and the last
+    :code:`INFO_LOG_EVENTS` events of its chunked log, with the warnings
+    and errors among them. Jobs that keep their log in the job document
+    get all of its events.
+
+    Responses have an ETag made from the job's version and the length of
+    its log, so a conditional GET of an unchanged job gets a 304.
+    """
+    def get(self, uuid):
+        headKey = joblogs.head_key(uuid)
+        docs = self.application.read_jobs([uuid, headKey])
+        doc, head = docs[uuid], docs[headKey]
+        if doc is None:
+            raise HTTPError(404, "No job for %s" % uuid)
+
+        if head is None:
+            events = doc.get("events") or []
+            if self.job_not_modified(
+                doc, "doc", len(events), self.response_format()
+            ):
+                return
+
+            self.complete_obj(200, job_info(doc, events))
+            return
+
+        if self.job_not_modified(doc, head['count'], self.response_format()):
+            return
+
+        events = joblogs.tail_events(
+            self.application.read_jobs, uuid, head, INFO_LOG_EVENTS
+        )
+        self.complete_obj(200, job_info(doc, events, logCount=head['count']))
+
+
+def job_info(doc, events, **extra):
+    """
+    :returns info: a job's /info response, with its completeness, result,
+        and log events, and the warnings and errors among them
+    :rtype: dict
+    """
+    return dict(
+        completeness=doc.get("completeness"),
+        result=doc.get("resultCode"),
+        events=events,
+        errors=[e for e in events if e['level'] == joblogs.ERROR],
+        warnings=[e for e in events if e['level'] == joblogs.WARNING],
+        **extra
+    )
+
+
+def get_page_arguments(handler, pageSize, maxPageSize):
+    """
+    :returns offset, limit: the request's :code:`offset` and :code:`limit`
+        query arguments
+
+    :raises HTTPError: 400 if they're not integers in range
+    """
+    try:
+        offset = int(handler.get_argument("offset", "0"))
+        limit = int(handler.get_argument("limit", str(pageSize)))
+    except ValueError:
+        raise HTTPError(400, "offset and limit must be integers")
+
+    if offset < 0 or not 0 < limit <= maxPageSize:
+        raise HTTPError(
+            400,
+            "offset must be at least 0, and limit from 1 to %d" % maxPageSize
+        )
+
+    return offset, limit
+
+
+class LogsHandler(ConditionalMixin, FormatMixin, zerog.BaseHandler):
+    """
+    Returns a page of a job's log, from its chunks or its job document.
+    Pass :code:`offset` (or the :code:`next` cursor from the previous page)
+    and :code:`limit` query arguments. :code:`next` is null on the last
+    page.
 
-        self.complete(
+    Pages have ETags like the /info response.
+    """
+    def get(self, uuid):
+        offset, limit = get_page_arguments(
+            self, LOG_PAGE_SIZE, MAX_LOG_PAGE_SIZE
+        )
+
+        headKey = joblogs.head_key(uuid)
+        docs = self.application.read_jobs([uuid, headKey])
+        doc, head = docs[uuid], docs[headKey]
+        if doc is None:
+            raise HTTPError(404, "No job for %s" % uuid)
+
+        if head is None:
+            docEvents = doc.get("events") or []
+            total = len(docEvents)
+        else:
+            total = head['count']
+
+        representation = (offset, limit, self.response_format())
+        if self.job_not_modified(doc, total, *representation):
+            return
+
+        if head is None:
+            events = docEvents[offset:offset + limit]
+        else:
+            events = joblogs.read_events(
+                self.application.read_jobs, uuid, head, offset, offset + limit
+            )
+        nextOffset = offset + len(events)
+
+        self.complete_obj(
             200,
-            output=json.dumps(dict(postSchema=schema), indent=4)
+            dict(
+                events=events,
+                offset=offset,
+                total=total,
+                next=nextOffset if nextOffset < total else None
+            )
         )
 
 
-class RunJobHandler(zerog.RunJobHandler):
+class DataHandler(ConditionalMixin, FormatMixin, zerog.GetDataHandler):
     """
-    Starts a zerog job for a particular endpoint.
+    Returns a job's data. Values the job stored in blobs, and the items of
+    a job class's :code:`STREAM_FIELD`, are read as they are sent, with
+    chunked transfer encoding, so the whole response is never built in
+    memory. The data of other jobs is sent in the negotiated format. Jobs
+    of a type this server doesn't know are handled by zerog.
 
-    Arguments are validated by attempting to create the job.
+    The streamed response is one JSON object, or newline-delimited JSON if
+    the request accepts :code:`application/x-ndjson` or passes
+    :code:`?format=ndjson`: a line with the rest of the data, then a line
+    per streamed item.
+
+    Pass :code:`offset` and :code:`limit` query arguments to get one page
+    of the streamed items instead, with the paging fields :code:`offset`,
+    :code:`total` and :code:`next` added to the data.
+
+    Responses have an ETag made from the job's version and the amount of
+    its streamed output, so a conditional GET of unchanged data gets a
+    304, and a finished job's data may be cached for a long time.
+
+    A job whose blob is missing, because it was swept, gets a 404.
     """
-    def derive_job_type(self, data, *args, **kwargs):
-        path = self.request.path.replace("/%s" % RUN_JOB, "")
+    async def get(self, uuid):
+        headKey = outputs.head_key(uuid)
+        docs = self.application.read_jobs([uuid, headKey])
+        doc, head = docs[uuid], docs[headKey]
+        if doc is None:
+            raise HTTPError(404, "No job for %s" % uuid)
+
+        cls = self.application.structure.get_job_class(doc['jobType'])
+        if cls is None:
+            if not self.job_not_modified(doc, "zerog"):
+                super(DataHandler, self).get(uuid)
+            return
 
+        if cls.STREAM_FIELD is None and not doc.get("blobs"):
+            if not self.job_not_modified(doc, "doc", self.response_format()):
+                job = cls(self.application.datastore, None, **doc)
+                self.complete_obj(200, job.get_data())
+            return
+
+        # open the blobs before anything is sent, so a missing one gets an
+        # error status rather than a truncated 200
+        store = cls.get_blob_store()
+        members = []
         try:
-            return self.application.structure.get_job_type(path)
-        except KeyError:
-            raise HTTPError(404, "No job for %s" % path)
-        except NotLeafError:
-            raise HTTPError(400, "%s is a branch, not a job" % path)
+            for name, ref in (doc.get("blobs") or {}).items():
+                try:
+                    members.append((name, store.open(ref['key'])))
+                except KeyError:
+                    raise HTTPError(
+                        404, "No blob for %s of job %s" % (name, uuid)
+                    )
+
+            await self.send_data(uuid, doc, head, cls, members)
+        finally:
+            for _, reader in members:
+                reader.close()
+
+    async def send_data(self, uuid, doc, head, cls, members):
+        """
+        :param members: the job's open blobs, by field name
+        :type members: list of (str, :code:`spacewalk.blobs.BlobReader`)
+        """
+        field = cls.STREAM_FIELD
+        arguments = self.request.arguments
+        paged = field is not None and (
+            "offset" in arguments or "limit" in arguments
+        )
+        ndjson = field is not None and not paged and (
+            self.get_argument("format", None) == "ndjson" or
+            NDJSON_TYPE in self.request.headers.get("Accept", "")
+        )
+
+        if paged:
+            offset, limit = get_page_arguments(
+                self, DATA_PAGE_SIZE, MAX_DATA_PAGE_SIZE
+            )
+            representation = ("page", offset, limit)
+        else:
+            representation = ("ndjson" if ndjson else "json",)
+
+        total = head['count'] if head else 0
+        if self.job_not_modified(doc, total, *representation):
+            return
+
+        job = cls(self.application.datastore, None, **doc)
+        data = job.get_data()
+        for name, _ in members:
+            data.pop(name, None)
+
+        if field is None:
+            await self.write_pieces(outputs.encode_object(data, members))
+            return
+
+        data.pop(field, None)
+
+        if paged:
+            items = outputs.read_items(
+                self.application.read_jobs, uuid, head, offset, offset + limit
+            )
+            nextOffset = offset + len(items)
+
+            data[field] = items
+            data.update(
+                offset=offset,
+                total=total,
+                next=nextOffset if nextOffset < total else None
+            )
+            await self.write_pieces(outputs.encode_object(data, members))
+            return
+
+        batches = outputs.iter_items(self.application.read_jobs, uuid, head)
+        if ndjson:
+            pieces = outputs.encode_ndjson(data, batches, members)
+            await self.write_pieces(pieces, NDJSON_TYPE)
+        else:
+            members = members + [(field, outputs.encode_list(batches))]
+            await self.write_pieces(outputs.encode_object(data, members))
+
+    async def write_pieces(
+        self, pieces, contentType="application/json; charset=UTF-8"
+    ):
+        """
+        send a response a piece at a time, flushing each one
+        """
+        self.set_header("Content-Type", contentType)
+
+        try:
+            for piece in pieces:
+                self.write(piece)
+                await self.flush()
+        except StreamClosedError:
+            return
+
+        self.finish()
+
+
+class DumpHandler(FormatMixin, zerog.DumpHandler):
+    """
+    Returns a full dump of a job, without its log events unless
+    :code:`?showLogs=true` is passed. Then the events of the job's chunked
+    log are added to the dump's :code:`events`, after any kept in the job
+    document.
+    """
+    def get(self, uuid):
+        headKey = joblogs.head_key(uuid)
+        docs = self.application.read_jobs([uuid, headKey])
+        doc, head = docs[uuid], docs[headKey]
+        if doc is None:
+            raise HTTPError(404, "No job for %s" % uuid)
+
+        dump = dict(doc)
+        if self.get_argument("showLogs", "false") != "true":
+            dump.pop("events", None)
+        elif head is not None:
+            dump['events'] = (doc.get("events") or []) + joblogs.read_events(
+                self.application.read_jobs, uuid, head, 0, head['count']
+            )
+
+        self.complete_obj(200, dump)
+
+
+class StructureRouter(Router):
+    """
+    Routes every Branch and Leaf resource request for a structure.
+
+    A Tornado route per resource per node means a linear scan through
+    thousands of regexes for a large tree. Instead, this router splits the
+    resource name off the end of the request path, and finds the Branch or
+    Leaf for the rest of the path by walking the structure's path trie.
+
+    The router needs the application to create request handlers, so it
+    MUST be bound to the application with :code:`bind`. A
+    :code:`spacewalk.Server` does this automatically.
+    """
+    RESOURCES = {
+        BRANCHES: SubBranchesHandler,
+        LEAVES: LeavesHandler,
+        POST_SCHEMA: PostSchemaHandler,
+        RUN_JOB: RunJobHandler,
+        RUN_JOBS: RunJobsHandler
+    }
+
+    def __init__(self, structure):
+        """
+        :param structure: the structure to route requests for
+        :type structure: spacewalk.Structure
+        """
+        self.structure = structure
+        self.application = None
+
+    def bind(self, application):
+        self.application = application
+
+    def find_handler(self, request, **kwargs):
+        # returning None lets the application try its other routes
+        path, _, resource = request.path.rpartition("/")
+        handlerClass = self.RESOURCES.get(resource)
+        if handlerClass is None:
+            return None
+
+        target = self.structure.get_target(path)
+        if target is None:
+            return None
+
+        return self.application.get_handler_delegate(
+            request,
+            handlerClass,
+            target_kwargs=dict(target=target, path=path)
+        )
 
 
 def make_handlers(structure):
     """
     makes a list of endpoint -> request handler tuples for use by the
     Spacewalk Tornado server
-    """
-    handlers = []
-
-    # for each branch make endpoints for the SubBranchesHandler and the
-    # LeavesHandler
-    for path in structure.get_branch_paths():
-        handlers.append(("%s/%s" % (path, BRANCHES), SubBranchesHandler))
-        handlers.append(("%s/%s" % (path, LEAVES), LeavesHandler))
 
-    # make SchemaHandler and RunJobHandler endpoints for all the leaves
-    for path in structure.get_leaf_paths():
-        handlers.append(("%s/%s" % (path, POST_SCHEMA), PostSchemaHandler))
-        handlers.append(("%s/%s" % (path, RUN_JOB), RunJobHandler))
+    All the Branch and Leaf endpoints are served by a single
+    :code:`StructureRouter`, so the number of routes doesn't grow with the
+    size of the tree. It comes first, so a branch or leaf named like one of
+    the job endpoints, such as :code:`data`, still gets its resources. Any
+    other request falls through to the job endpoints.
+    """
+    rootPath = structure.get_root_path()
 
-    handlers += [
+    return [
         (
-            "%s/progress/%s" % (structure.get_root_path(), UUID_PATT),
-            zerog.ProgressHandler
+            "%s/.*" % rootPath,
+            StructureRouter(structure)
         ), (
-            "%s/info/%s" % (structure.get_root_path(), UUID_PATT),
-            zerog.InfoHandler
+            "%s/metrics" % rootPath,
+            MetricsHandler
         ), (
-            "%s/data/%s" % (structure.get_root_path(), UUID_PATT),
-            zerog.GetDataHandler
+            "%s/progress" % rootPath,
+            MultiProgressHandler
         ), (
-            "%s/dump/%s" % (structure.get_root_path(), UUID_PATT),
-            zerog.DumpHandler
+            "%s/progress/%s" % (rootPath, UUID_PATT),
+            ProgressHandler
+        ), (
+            "%s/progress/%s/stream" % (rootPath, UUID_PATT),
+            ProgressStreamHandler
+        ), (
+            "%s/profile/%s" % (rootPath, UUID_PATT),
+            ProfileHandler
+        ), (
+            "%s/info/%s" % (rootPath, UUID_PATT),
+            InfoHandler
+        ), (
+            "%s/logs/%s" % (rootPath, UUID_PATT),
+            LogsHandler
+        ), (
+            "%s/data/%s" % (rootPath, UUID_PATT),
+            DataHandler
+        ), (
+            "%s/dump/%s" % (rootPath, UUID_PATT),
+            DumpHandler
         )
     ]
-
-    return handlers
@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Records that map keys to job uuids, so a retried job submission, or a
+submission with the same params as an earlier deterministic job, returns
+the job that was already created instead of starting another one.
+"""
+import collections
+import hashlib
+import json
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class UuidIndex(object):
+    """
+    Maps keys to job uuids for a limited time. Keys are saved in the
+    datastore, so they're shared between processes, and recently used keys
+    are also kept in an in-process LRU cache.
+
+    Records are written with the datastore's :code:`upsert` and
+    :code:`insert` if it has them, like
+    :code:`spacewalk.datastores.CouchbaseDatastore`, which give them a
+    datastore TTL and make :code:`claim` atomic across processes.
+    Otherwise they're written with :code:`set`, expired records are
+    deleted when they're read, and :code:`claim` is only atomic within a
+    process.
+
+    Subclasses MUST override :code:`PREFIX`
+    """
+    PREFIX = None
+
+    def __init__(self, datastore, ttl=86400, maxsize=10000):
+        """
+        :param datastore: datastore for the key records
+        :type datastore: zerog datastore
+
+        :param ttl: default seconds that a key is remembered
+        :type ttl: float
+
+        :param maxsize: most keys kept in the in-process cache
+        :type maxsize: int
+        """
+        self.datastore = datastore
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.cache = collections.OrderedDict()
+
+    def get(self, scope, key):
+        """
+        :param scope: namespace for the key, such as a job type
+        :type scope: str
+
+        :param key: the key
+        :type key: str
+
+        :returns uuid: uuid of the job created with this key, or None if
+            the key hasn't been used, or has expired
+        :rtype: str
+        """
+        record = self.get_record(scope, key)
+        return None if record is None else record['uuid']
+
+    def get_record(self, scope, key):
+        """
+        :returns record: the key's record, with the job's :code:`uuid` and
+            any other fields it was saved with, or None if the key hasn't
+            been used, or has expired
+        :rtype: dict
+        """
+        rkey = self.record_key(scope, key)
+        record = self.cache.get(rkey)
+        if record is None:
+            record = self.datastore.get(rkey)
+
+        if record is None:
+            return None
+
+        if record['expires'] < time.time():
+            self.forget(rkey)
+            return None
+
+        self.remember(rkey, record)
+        return record
+
+    def set(self, scope, key, uuid, ttl=None, **fields):
+        """
+        record the uuid of the job that was created with a key, with any
+        other fields, for :code:`ttl` seconds, or the default ttl if it's
+        None
+        """
+        rkey, record, ttl = self.make_record(scope, key, uuid, ttl, fields)
+
+        upsert = getattr(self.datastore, "upsert", None)
+        if upsert is None:
+            self.datastore.set(rkey, record)
+        else:
+            upsert(rkey, record, ttl=ttl)
+
+        self.remember(rkey, record)
+
+    def claim(self, scope, key, uuid, ttl=None, **fields):
+        """
+        Record the uuid of a job that's about to be created with a key,
+        only if the key has no record yet, so that only one of several
+        concurrent requests with the same key creates a job.
+
+        :returns record: the key's existing record, or None if the key was
+            claimed for this uuid
+        :rtype: dict
+        """
+        rkey, record, ttl = self.make_record(scope, key, uuid, ttl, fields)
+
+        insert = getattr(self.datastore, "insert", None)
+        if insert is None:
+            existing = self.get_record(scope, key)
+            if existing is not None:
+                return existing
+
+            self.datastore.set(rkey, record)
+        elif not insert(rkey, record, ttl=ttl):
+            self.cache.pop(rkey, None)
+            existing = self.get_record(scope, key)
+            if existing is not None:
+                return existing
+
+            # the record had expired, and get_record deleted it
+            if not insert(rkey, record, ttl=ttl):
+                return self.get_record(scope, key) or record
+
+        self.remember(rkey, record)
+        return None
+
+    def delete(self, scope, key):
+        """
+        delete a key's record, such as one claimed for a job that couldn't
+        be created
+        """
+        self.forget(self.record_key(scope, key))
+
+    def make_record(self, scope, key, uuid, ttl, fields):
+        if ttl is None:
+            ttl = self.ttl
+
+        record = dict(fields, uuid=uuid, expires=time.time() + ttl)
+        return self.record_key(scope, key), record, ttl
+
+    def record_key(self, scope, key):
+        return "%s_%s_%s" % (self.PREFIX, scope, key)
+
+    def remember(self, rkey, record):
+        self.cache[rkey] = record
+        self.cache.move_to_end(rkey)
+
+        while len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+
+    def forget(self, rkey):
+        self.cache.pop(rkey, None)
+
+        delete = getattr(self.datastore, "delete", None)
+        if delete is not None:
+            delete(rkey)
+
+
+class IdempotencyKeys(UuidIndex):
+    """
+    Maps :code:`Idempotency-Key` header values to the jobs they created
+    """
+    PREFIX = "idempotency"
+
+
+class ResultIndex(UuidIndex):
+    """
+    Maps digests of deterministic jobs' params to the jobs that computed
+    them
+    """
+    PREFIX = "result"
+
+
+def params_digest(leaf, params):
+    """
+    Digest of a leaf's job type and normalized params. Params are
+    normalized by loading and dumping them with the leaf's validator, so
+    defaults are filled in and fields that aren't params are dropped.
+
+    :param leaf: the leaf
+    :type leaf: :code:`spacewalk.structure.Leaf`
+
+    :param params: valid job params
+    :type params: dict
+
+    :returns digest: hex digest
+    :rtype: str
+    """
+    validator = leaf.validator
+    normalized = validator.dump(validator.load(params))
+
+    return hashlib.sha256(
+        json.dumps(
+            [leaf.cls.JOB_TYPE, normalized], sort_keys=True, default=str
+        ).encode()
+    ).hexdigest()
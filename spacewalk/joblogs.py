@@ -0,0 +1,194 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Job log events stored in fixed-size chunk documents, apart from the job's
+own document, so a long-running job's log doesn't bloat every read of the
+job, and a page of the log is read without reading all of it.
+
+A job's log is a head document with the number of events and the chunk
+size, and chunk documents that each hold :code:`chunkSize` events. Other
+long lists a job writes, like its streamed output, are stored the same way
+under their own :code:`kind` of key.
+"""
+import datetime
+
+import logging
+log = logging.getLogger(__name__)
+
+INFO = "info"
+WARNING = "warning"
+ERROR = "error"
+
+# kind of chunked list that holds a job's log
+LOG = "log"
+
+# events per chunk document
+LOG_CHUNK_SIZE = 500
+
+
+def head_key(uuid, kind=LOG):
+    return "%s_%s" % (uuid, kind)
+
+
+def chunk_key(uuid, index, kind=LOG):
+    return "%s_%s_%d" % (uuid, kind, index)
+
+
+def make_event(level, msg):
+    return dict(
+        level=level,
+        msg=msg,
+        timeStamp=datetime.datetime.utcnow().isoformat()
+    )
+
+
+class JobLog(object):
+    """
+    Appends a job's log events to its chunk documents. Keeps the last
+    chunk in memory, so each append writes one chunk and the head.
+
+    Subclasses set :code:`KIND` to keep other lists in chunks.
+    """
+    KIND = LOG
+
+    def __init__(self, uuid, chunkSize=LOG_CHUNK_SIZE):
+        self.uuid = uuid
+        self.chunkSize = chunkSize
+        self.count = None
+        self.chunk = None
+
+    def load(self, datastore):
+        head = datastore.get(head_key(self.uuid, self.KIND))
+        if head is None:
+            self.count = 0
+            self.chunk = []
+            return
+
+        # an existing log keeps the chunk size it was written with
+        self.count = head['count']
+        self.chunkSize = head['chunkSize']
+
+        chunk = None
+        if self.count % self.chunkSize:
+            chunk = datastore.get(
+                chunk_key(self.uuid, self.count // self.chunkSize, self.KIND)
+            )
+        self.chunk = chunk['events'] if chunk else []
+
+    def append(self, datastore, event):
+        """
+        :param datastore: datastore to write the log to
+        :type datastore: zerog datastore
+
+        :param event: the log event
+        :type event: dict
+        """
+        self.extend(datastore, [event])
+
+    def extend(self, datastore, events):
+        """
+        Append several events, writing each chunk they fill once, then the
+        head.
+
+        :param datastore: datastore to write the log to
+        :type datastore: zerog datastore
+
+        :param events: the log events
+        :type events: iterable of dict
+        """
+        if self.count is None:
+            self.load(datastore)
+
+        count = self.count
+        for event in events:
+            if self.count % self.chunkSize == 0:
+                self.chunk = []
+
+            self.chunk.append(event)
+            self.count += 1
+
+            if self.count % self.chunkSize == 0:
+                self.write_chunk(datastore)
+
+        if self.count == count:
+            return
+
+        if self.count % self.chunkSize:
+            self.write_chunk(datastore)
+
+        datastore.set(
+            head_key(self.uuid, self.KIND),
+            dict(count=self.count, chunkSize=self.chunkSize)
+        )
+
+    def write_chunk(self, datastore):
+        """
+        write the last chunk
+        """
+        datastore.set(
+            chunk_key(
+                self.uuid, (self.count - 1) // self.chunkSize, self.KIND
+            ),
+            dict(events=self.chunk)
+        )
+
+
+def read_events(readDocs, uuid, head, start, end, kind=LOG):
+    """
+    :param readDocs: function that bulk reads documents, like
+        :code:`spacewalk.Server.read_jobs`
+    :type readDocs: callable
+
+    :param uuid: job's uuid
+    :type uuid: str
+
+    :param head: the log's head document, or None if the job has no log
+    :type head: dict
+
+    :param start: index of the first event
+    :type start: int
+
+    :param end: index after the last event
+    :type end: int
+
+    :param kind: kind of chunked list to read
+    :type kind: str
+
+    :returns events: the log events from :code:`start` up to :code:`end`
+    :rtype: list of dict
+    """
+    if head is None:
+        return []
+
+    end = min(end, head['count'])
+    if start >= end:
+        return []
+
+    chunkSize = head['chunkSize']
+    first = start // chunkSize
+    keys = [
+        chunk_key(uuid, index, kind)
+        for index in range(first, (end - 1) // chunkSize + 1)
+    ]
+    chunks = readDocs(keys)
+
+    events = []
+    for key in keys:
+        events += (chunks.get(key) or {}).get("events", [])
+
+    offset = first * chunkSize
+    return events[start - offset:end - offset]
+
+
+def tail_events(readDocs, uuid, head, n):
+    """
+    :returns events: the last :code:`n` log events
+    :rtype: list of dict
+    """
+    if head is None:
+        return []
+
+    return read_events(
+        readDocs, uuid, head, max(0, head['count'] - n), head['count']
+    )
@@ -6,9 +6,24 @@ BaseJob and BaseJobSchema for building out a Spacewalk job processing
 service
 """
 
-from marshmallow import Schema
+import asyncio
+import contextlib
+import functools
+import json
+from marshmallow import fields, Schema
+import time
+import uuid
 import zerog
 
+from spacewalk import blobs
+from spacewalk.buffering import WriteBehindDatastore
+from spacewalk import joblogs
+from spacewalk.metrics import JOB_SECONDS
+from spacewalk import outputs
+from spacewalk.profiling import (
+    async_lock, profile_key, PROFILE_PARAM, RunProfile
+)
+
 import logging
 log = logging.getLogger(__name__)
 
@@ -23,8 +38,168 @@ def schema_name(branch, leaf):
     return "%s%sSchema" % (branch.capitalize(), leaf.capitalize())
 
 
+def queue_name(serviceName, cls):
+    """
+    :param serviceName: name of the service, which names its default queue
+    :type serviceName: str
+
+    :param cls: job class
+    :type cls: :code:`spacewalk.BaseJob` subclass
+
+    :returns queueName: name of the queue that the class's jobs go through
+    :rtype: str
+    """
+    if cls.QUEUE is None:
+        return serviceName
+
+    return "%s-%s" % (serviceName, cls.QUEUE)
+
+
+def queue_message(uuid):
+    """
+    :param uuid: job's uuid
+    :type uuid: str
+
+    :returns body: the body of the queue message that enqueues the job,
+        which is the bare uuid, as zerog's :code:`BaseJob.enqueue` puts
+        it, so any zerog worker can read it
+    :rtype: str
+    """
+    return uuid
+
+
+def message_uuid(body):
+    """
+    :param body: queue message body, which is either a job uuid, as made
+        by :code:`queue_message`, or a JSON object with a :code:`uuid`, as
+        earlier versions of Spacewalk put for batches
+    :type body: str or bytes
+
+    :returns uuid: the job's uuid
+    :rtype: str
+    """
+    try:
+        return json.loads(body)['uuid']
+    except (ValueError, TypeError, KeyError):
+        return body
+
+
+def job_outcome(result):
+    """
+    outcome label for a job's run() return value, which is a
+    :code:`(resultCode, ...)` tuple
+    """
+    try:
+        return str(result[0])
+    except (TypeError, IndexError, KeyError):
+        return "unknown"
+
+
+def is_async(cls):
+    """
+    :returns isAsync: True if a job class's run() is a coroutine function
+    :rtype: bool
+    """
+    return asyncio.iscoroutinefunction(getattr(cls, "run", None))
+
+
+async def run_blocking(func, *args, **kwargs):
+    """
+    Call a blocking function, such as a datastore call, in the event loop's
+    default executor, so it doesn't hold up other coroutines.
+    """
+    return await asyncio.get_event_loop().run_in_executor(
+        None, functools.partial(func, *args, **kwargs)
+    )
+
+
+def instrument_run(run):
+    """
+    Decorate a job's run() to record its duration and outcome in the job
+    metrics, and to profile it if profiling is on for the job. Only the
+    outermost run() is instrumented when subclasses call their parent's
+    run().
+
+    If the job buffers its writes, they're buffered while run() runs, and
+    flushed when it returns or raises.
+
+    An async run() gets an async wrapper. Its profile includes whatever
+    else runs on the event loop while the job is awaiting. Profiled async
+    jobs on the same event loop run one at a time, because cProfile can
+    only profile one of them at a time.
+    """
+    def start_run(self):
+        self._runInstrumented = True
+        if self.BUFFER_WRITES:
+            self.datastore = WriteBehindDatastore(
+                self.datastore, self.FLUSH_INTERVAL, self.FLUSH_SIZE
+            )
+
+        return RunProfile(self.PROFILE_TOP_N) if self.profiling else None
+
+    def record_run(self, profile, start, outcome):
+        self._runInstrumented = False
+        JOB_SECONDS.observe(
+            time.perf_counter() - start, self.JOB_TYPE, outcome
+        )
+        if profile is not None:
+            self.profile = profile.profile
+            self.datastore.set(profile_key(self.uuid), self.profile)
+
+        if isinstance(self.datastore, WriteBehindDatastore):
+            self.datastore.close()
+            self.datastore = self.datastore.wrapped
+
+    if asyncio.iscoroutinefunction(run):
+        @functools.wraps(run)
+        async def wrapper(self, *args, **kwargs):
+            if getattr(self, "_runInstrumented", False):
+                return await run(self, *args, **kwargs)
+
+            if self.profiling:
+                async with async_lock():
+                    return await instrumented(self, *args, **kwargs)
+
+            return await instrumented(self, *args, **kwargs)
+
+        async def instrumented(self, *args, **kwargs):
+            profile = start_run(self)
+            start = time.perf_counter()
+            outcome = "exception"
+            try:
+                with profile or contextlib.nullcontext():
+                    result = await run(self, *args, **kwargs)
+
+                outcome = job_outcome(result)
+                return result
+            finally:
+                record_run(self, profile, start, outcome)
+
+        return wrapper
+
+    @functools.wraps(run)
+    def wrapper(self, *args, **kwargs):
+        if getattr(self, "_runInstrumented", False):
+            return run(self, *args, **kwargs)
+
+        profile = start_run(self)
+        start = time.perf_counter()
+        outcome = "exception"
+        try:
+            with profile or contextlib.nullcontext():
+                result = run(self, *args, **kwargs)
+
+            outcome = job_outcome(result)
+            return result
+        finally:
+            record_run(self, profile, start, outcome)
+
+    return wrapper
+
+
 class BaseJobSchema(zerog.BaseJobSchema):
-    pass
+    profiling = fields.Boolean()
+    blobs = fields.Dict()
 
 
 class BaseJob(zerog.BaseJob):
@@ -58,9 +233,82 @@ class BaseJob(zerog.BaseJob):
         class as shown here, or defined outside the job class and assigned
         as a class attribute.
 
+    :cvar bool DETERMINISTIC: Set True if the job's result depends only on
+        its Params. A POST to the /job endpoint with the same Params as a
+        recent job that is finished successfully, or still running, returns
+        that job's uuid instead of starting a new job. You MAY override this
+        attribute for a branch or leaf.
+
+    :cvar float REUSE_MAX_AGE: For a DETERMINISTIC job, how many seconds
+        after it is submitted that a job may be reused. You MAY override
+        this attribute for a branch or leaf.
+
+    :cvar bool PROFILE: Set True to run every job under cProfile and save
+        a profile document, where the /profile endpoint can get it.
+        Profiling can also be turned on for one job by POSTing a
+        :code:`_profile` field set to true. You MAY override this attribute
+        for a branch or leaf.
+
+    :cvar int PROFILE_TOP_N: Number of functions in a profile's summary.
+        You MAY override this attribute for a branch or leaf.
+
+    :cvar bool BUFFER_WRITES: Set True to buffer the job's datastore writes
+        while it runs, so repeated updates of its completeness and logs are
+        coalesced into one write per flush. Buffered writes are flushed
+        every FLUSH_INTERVAL seconds or FLUSH_SIZE writes, whichever comes
+        first, and when run() returns or raises. You MAY override this
+        attribute for a branch or leaf.
+
+    :cvar float FLUSH_INTERVAL: Most seconds a write is buffered before
+        it's flushed. You MAY override this attribute for a branch or leaf.
+
+    :cvar int FLUSH_SIZE: Most writes that are buffered before a flush.
+        You MAY override this attribute for a branch or leaf.
+
+    :cvar int LOG_CHUNK_SIZE: Set to store log events from
+        ``job_log_info()``, ``job_log_warning()`` and ``job_log_error()``
+        apart from the job, in documents of this many events, such as
+        ``joblogs.LOG_CHUNK_SIZE``, so a long log doesn't bloat the job.
+        Each event then writes its chunk and the log's head instead of the
+        job, and /info returns only the latest events. None, the default,
+        stores them in the job, as zerog does. You MAY override this
+        attribute for a branch or leaf.
+
+    :cvar str STREAM_FIELD: Name of a large list field of the job's data
+        whose items are written with ``append_output()``, stored apart from
+        the job in documents of STREAM_CHUNK_SIZE items, and streamed by
+        the /data endpoint instead of being built into one response. The
+        field SHOULD NOT also be saved in the job or returned by
+        ``get_data()``. None for no streamed output. You MAY override this
+        attribute for a leaf.
+
+    :cvar int STREAM_CHUNK_SIZE: Number of output items per document.
+        You MAY override this attribute for a branch or leaf.
+
+    :cvar BlobStore BLOB_STORE: Where ``store_blob()`` writes large result
+        values, which are kept out of the job's document. None uses the
+        default :code:`spacewalk.blobs.MmapFileStore`. You MAY override
+        this attribute for a branch or leaf.
+
+    :cvar str QUEUE: Name of a separate queue for the job's branch or leaf,
+        so its jobs don't wait behind those of other branches and leaves.
+        The queue is named :code:`<service name>-<QUEUE>`. None uses the
+        service's default queue. You MAY override this attribute for a
+        branch or leaf.
+
+    :cvar int PRIORITY: Queue priority of the job, where lower numbers are
+        more urgent, as in beanstalkd. None uses the queue's default
+        priority. You MAY override this attribute for a branch or leaf.
+
     Subclasses MUST
 
         - override the ``run()`` method
+
+    ``run()`` MAY be an ``async def`` method, for jobs that spend most of
+    their time waiting on I/O. The worker runs async jobs concurrently on
+    an event loop. They SHOULD use the ``_async`` variants of the methods
+    that save the job, such as ``add_to_completeness_async()`` and
+    ``job_log_info_async()``, which don't block the event loop.
     """
     NAME = NOT_OVERRIDDEN
     BRANCH_NAME = NOT_OVERRIDDEN
@@ -69,10 +317,35 @@ class BaseJob(zerog.BaseJob):
 
     BASE_SCHEMA = BaseJobSchema
 
+    DETERMINISTIC = False
+    REUSE_MAX_AGE = 3600
+
+    PROFILE = False
+    PROFILE_TOP_N = 25
+
+    BUFFER_WRITES = False
+    FLUSH_INTERVAL = 1.0
+    FLUSH_SIZE = 50
+
+    LOG_CHUNK_SIZE = None
+
+    STREAM_FIELD = None
+    STREAM_CHUNK_SIZE = outputs.STREAM_CHUNK_SIZE
+
+    BLOB_STORE = None
+
+    QUEUE = None
+    PRIORITY = None
+
     class Params(Schema):
         # Override this to define subclass-unique parameters
         pass
 
+    # set for each subclass by __init_subclass__
+    PARAMS_SCHEMA = None
+    PARAM_NAMES = ()
+    INTERNAL_FIELDS = frozenset()
+
     @classmethod
     def __init_subclass__(cls, **kwargs):
         # auto-override the zerog.BaseJob properties SCHEMA and JOB_TYPE
@@ -92,6 +365,20 @@ class BaseJob(zerog.BaseJob):
             {}
         )
 
+        # instantiating a marshmallow Schema is expensive, so make one
+        # Params instance per class and save its field names for __init__
+        cls.PARAMS_SCHEMA = cls.Params()
+        cls.PARAM_NAMES = tuple(cls.PARAMS_SCHEMA.fields)
+
+        # the job's own fields, which a request to create it can't set
+        cls.INTERNAL_FIELDS = frozenset(
+            cls.BASE_SCHEMA._declared_fields
+        ).difference(cls.PARAM_NAMES)
+
+        # record run() metrics and profiles
+        if "run" in cls.__dict__:
+            cls.run = instrument_run(cls.run)
+
         # have to run the parent's __init_subclass__ AFTER overriding
         # JOB_TYPE and SCHEMA.
         super().__init_subclass__(**kwargs)
@@ -126,6 +413,177 @@ class BaseJob(zerog.BaseJob):
         super(BaseJob, self).__init__(*args, **kwargs)
 
         # add Params to job
-        for key in self.Params().fields.keys():
+        for key in self.PARAM_NAMES:
             if key in kwargs:
                 setattr(self, key, kwargs[key])
+
+        self.profiling = kwargs.get("profiling", self.PROFILE)
+        self.profile = None
+        self.jobLog = None
+        self.jobOutput = None
+        self.blobs = kwargs.get("blobs") or {}
+
+        # zerog passes queueKwargs to the queue's put when the job is
+        # enqueued
+        if self.PRIORITY is not None:
+            self.queueKwargs = dict(getattr(self, "queueKwargs", None) or {})
+            self.queueKwargs.setdefault("priority", self.PRIORITY)
+
+    @classmethod
+    def request_params(cls, params):
+        """
+        :param params: the validated params of a request to create a job
+        :type params: dict
+
+        :returns params: the params without any of the job's own fields,
+            such as :code:`uuid` or :code:`blobs`, so a client can't set
+            them. A :code:`PROFILE_PARAM` of true turns on profiling.
+        :rtype: dict
+        """
+        jobParams = {
+            key: value for key, value in params.items()
+            if key not in cls.INTERNAL_FIELDS and key != PROFILE_PARAM
+        }
+        if params.get(PROFILE_PARAM) is True:
+            jobParams['profiling'] = True
+
+        return jobParams
+
+    def job_log_info(self, msg):
+        if self.LOG_CHUNK_SIZE is None:
+            return super(BaseJob, self).job_log_info(msg)
+
+        self.append_log(joblogs.INFO, msg)
+
+    def job_log_warning(self, msg):
+        if self.LOG_CHUNK_SIZE is None:
+            return super(BaseJob, self).job_log_warning(msg)
+
+        self.append_log(joblogs.WARNING, msg)
+
+    def job_log_error(self, msg):
+        if self.LOG_CHUNK_SIZE is None:
+            return super(BaseJob, self).job_log_error(msg)
+
+        self.append_log(joblogs.ERROR, msg)
+        self.update_attrs(errorCount=getattr(self, "errorCount", 0) + 1)
+
+    def append_log(self, level, msg):
+        """
+        append an event to the job's chunked log, without saving the job
+        """
+        if self.jobLog is None:
+            self.jobLog = joblogs.JobLog(self.uuid, self.LOG_CHUNK_SIZE)
+
+        self.jobLog.append(self.datastore, joblogs.make_event(level, msg))
+
+    def append_output(self, items):
+        """
+        Append items to the job's STREAM_FIELD output, without saving the
+        job. Items SHOULD be appended in batches rather than one at a time,
+        since each call writes the output's last chunk and head.
+
+        :param items: JSON-serializable output items
+        :type items: iterable
+        """
+        if self.STREAM_FIELD is None:
+            raise TypeError("%s has no STREAM_FIELD" % type(self).__name__)
+
+        if self.jobOutput is None:
+            self.jobOutput = outputs.JobOutput(
+                self.uuid, self.STREAM_CHUNK_SIZE
+            )
+
+        self.jobOutput.extend(self.datastore, items)
+
+    @classmethod
+    def get_blob_store(cls):
+        """
+        :returns store: the job class's blob store
+        :rtype: :code:`spacewalk.blobs.BlobStore`
+        """
+        if cls.BLOB_STORE is None:
+            return blobs.default_store()
+
+        return cls.BLOB_STORE
+
+    def store_blob(self, field, value):
+        """
+        Store a large result value in a blob, and save the job with a
+        reference to it. The /data endpoint returns the value as the
+        :code:`field` of the job's data, read from the blob as it is sent.
+
+        The field SHOULD NOT also be saved in the job or returned by
+        ``get_data()``.
+
+        :param field: name of the value in the job's data
+        :type field: str
+
+        :param value: JSON-serializable value
+        """
+        store = self.get_blob_store()
+        key = blobs.blob_key(self.uuid, field, uuid.uuid4().hex)
+        size = store.put(key, blobs.encode_chunks(value))
+
+        old = self.blobs.get(field)
+        self.update_attrs(
+            blobs=dict(self.blobs, **{field: blobs.make_ref(key, size)})
+        )
+
+        # the job no longer refers to the blob it replaced
+        if old is not None:
+            store.delete(old['key'])
+
+    def delete_blobs(self):
+        """
+        Delete the job's blobs, and save the job without references to
+        them. Call this when a finished job's results are no longer needed,
+        or before the job itself is deleted.
+        """
+        refs = self.blobs
+        if not refs:
+            return
+
+        self.update_attrs(blobs={})
+
+        store = self.get_blob_store()
+        for ref in refs.values():
+            store.delete(ref['key'])
+
+    def load_blob(self, field):
+        """
+        :returns value: a value stored with ``store_blob()``, read back
+            into memory
+
+        :raises KeyError: if there is no blob for the field
+        """
+        ref = self.blobs[field]
+        store = self.get_blob_store()
+        return json.loads(b"".join(store.read_chunks(ref['key'])))
+
+    # async variants of the zerog methods that save the job, for async
+    # run() methods
+
+    async def update_attrs_async(self, **kwargs):
+        await run_blocking(self.update_attrs, **kwargs)
+
+    async def add_to_completeness_async(self, delta):
+        await run_blocking(self.add_to_completeness, delta)
+
+    async def job_log_info_async(self, msg):
+        await run_blocking(self.job_log_info, msg)
+
+    async def job_log_warning_async(self, msg):
+        await run_blocking(self.job_log_warning, msg)
+
+    async def job_log_error_async(self, msg):
+        await run_blocking(self.job_log_error, msg)
+
+    async def append_output_async(self, items):
+        await run_blocking(self.append_output, items)
+
+    async def store_blob_async(self, field, value):
+        await run_blocking(self.store_blob, field, value)
+
+    async def record_result_async(self, resultCode, result=None):
+        await run_blocking(self.record_result, resultCode, result)
@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Lightweight counters and histograms, rendered in the Prometheus text
+exposition format by the /metrics endpoint.
+
+Recording a sample is a dictionary lookup and a bisect, so instrumenting
+a request costs microseconds.
+
+Job workers record job durations in their pool processes, which send them
+to the parent process, which serves them with :code:`start_http_server`.
+"""
+import bisect
+import functools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import time
+
+import logging
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+JOB_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value):
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\n", "\\n")
+        .replace('"', '\\"')
+    )
+
+
+def format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+
+    if not pairs:
+        return ""
+
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, escape(value)) for name, value in pairs
+    )
+
+
+class Counter(object):
+    TYPE = "counter"
+
+    def __init__(self, name, description, labelNames=()):
+        self.name = name
+        self.description = description
+        self.labelNames = tuple(labelNames)
+        self.values = {}
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        lines = []
+        for labels, value in sorted(self.values.items()):
+            lines.append(
+                "%s%s %s" %
+                (self.name, format_labels(self.labelNames, labels), value)
+            )
+        return lines
+
+
+class Histogram(object):
+    """
+    Samples are recorded under a lock, since a job worker records them
+    from several threads.
+    """
+    TYPE = "histogram"
+
+    def __init__(
+        self, name, description, labelNames=(), buckets=DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.description = description
+        self.labelNames = tuple(labelNames)
+        self.buckets = tuple(buckets)
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def counts(self, labels):
+        counts = self.values.get(labels)
+        if counts is None:
+            # one count per bucket, +Inf, then the sum
+            counts = self.values[labels] = [0] * (len(self.buckets) + 1)
+            counts.append(0.0)
+
+        return counts
+
+    def observe(self, value, *labels):
+        with self.lock:
+            counts = self.counts(labels)
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def drain(self):
+        """
+        :returns values: the counts recorded since the last drain, which
+            are cleared, for a pool process to send to its parent
+        :rtype: dict
+        """
+        with self.lock:
+            values = self.values
+            self.values = {}
+
+        return values
+
+    def merge(self, values):
+        """
+        add counts drained from the same histogram in another process
+        """
+        with self.lock:
+            for labels, other in values.items():
+                counts = self.counts(tuple(labels))
+                for i, count in enumerate(other):
+                    counts[i] += count
+
+    def render(self):
+        with self.lock:
+            values = {
+                labels: list(counts) for labels, counts in self.values.items()
+            }
+
+        lines = []
+        for labels, counts in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(
+                self.buckets + ("+Inf",), counts[:-1]
+            ):
+                cumulative += count
+                lines.append(
+                    "%s_bucket%s %d" % (
+                        self.name,
+                        format_labels(self.labelNames, labels, ("le", bound)),
+                        cumulative
+                    )
+                )
+
+            labelText = format_labels(self.labelNames, labels)
+            lines.append("%s_sum%s %r" % (self.name, labelText, counts[-1]))
+            lines.append("%s_count%s %d" % (self.name, labelText, cumulative))
+        return lines
+
+
+class Registry(object):
+    """
+    A set of metrics that are rendered together
+    """
+    def __init__(self):
+        self.metrics = {}
+
+    def add(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.add(Counter(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.add(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            lines.append("# HELP %s %s" % (name, metric.description))
+            lines.append("# TYPE %s %s" % (name, metric.TYPE))
+            lines += metric.render()
+
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "spacewalk_requests_total",
+    "HTTP requests by handler, branch or leaf path, and status code",
+    ("handler", "path", "code")
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "spacewalk_request_seconds",
+    "HTTP request latency by handler and branch or leaf path",
+    ("handler", "path")
+)
+DATASTORE_SECONDS = REGISTRY.histogram(
+    "spacewalk_datastore_seconds",
+    "datastore call latency by operation and method",
+    ("operation", "method")
+)
+QUEUE_SECONDS = REGISTRY.histogram(
+    "spacewalk_queue_seconds",
+    "queue call latency by method",
+    ("method",)
+)
+JOB_SECONDS = REGISTRY.histogram(
+    "spacewalk_job_run_seconds",
+    "job run() duration by job type and outcome",
+    ("jobType", "outcome"),
+    buckets=JOB_BUCKETS
+)
+
+READ_METHODS = ("get", "read")
+
+
+def timed_method(method, histogram, labels):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        finally:
+            histogram.observe(time.perf_counter() - start, *labels)
+
+    return wrapper
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """
+    Serves :code:`REGISTRY` in the Prometheus text format at any path
+    """
+    def do_GET(self):
+        body = REGISTRY.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        log.debug(format, *args)
+
+
+def start_http_server(port, address=""):
+    """
+    Serve this process's metrics from a thread, for processes such as the
+    job worker that don't run the API server
+
+    :param port: port to listen on
+    :type port: int
+
+    :param address: address to listen on. Defaults to all addresses.
+    :type address: str
+
+    :returns server: the server, which :code:`shutdown()` stops
+    :rtype: :code:`http.server.ThreadingHTTPServer`
+    """
+    server = ThreadingHTTPServer((address, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    threading.Thread(
+        target=server.serve_forever, name="metrics", daemon=True
+    ).start()
+
+    return server
+
+
+class TimedDatastore(object):
+    """
+    Wraps a datastore and records the latency of its method calls as
+    reads or writes. Each timed method is made on its first use and kept
+    on the instance, so later calls don't go through :code:`__getattr__`.
+    """
+    def __init__(self, datastore):
+        self.wrapped = datastore
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if not callable(attr) or name.startswith("_"):
+            return attr
+
+        operation = "read" if name.startswith(READ_METHODS) else "write"
+        method = timed_method(attr, DATASTORE_SECONDS, (operation, name))
+        setattr(self, name, method)
+        return method
+
+
+class TimedQueue(object):
+    """
+    Wraps a queue and records the latency of its put calls. Timed methods
+    are kept on the instance like :code:`TimedDatastore`'s.
+    """
+    def __init__(self, queue):
+        self.wrapped = queue
+
+    def __getattr__(self, name):
+        attr = getattr(self.wrapped, name)
+        if not name.startswith("put"):
+            return attr
+
+        method = timed_method(attr, QUEUE_SECONDS, (name,))
+        setattr(self, name, method)
+        return method
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+A job's streamed output: the items of one large list field of its data,
+stored in chunk documents like its log, so the data endpoint can send
+them a chunk at a time, or a page at a time, without ever holding the
+whole list.
+"""
+import json
+
+from spacewalk import joblogs
+
+import logging
+log = logging.getLogger(__name__)
+
+# kind of chunked list that holds a job's streamed output
+OUTPUT = "output"
+
+# items per chunk document
+STREAM_CHUNK_SIZE = 1000
+
+# chunk documents read by each bulk read while streaming
+CHUNKS_PER_READ = 4
+
+
+class JobOutput(joblogs.JobLog):
+    """
+    Appends the items of a job's streamed output field to its chunk
+    documents
+    """
+    KIND = OUTPUT
+
+
+def head_key(uuid):
+    return joblogs.head_key(uuid, OUTPUT)
+
+
+def read_items(readDocs, uuid, head, start, end):
+    """
+    :returns items: the output items from :code:`start` up to :code:`end`
+    :rtype: list
+    """
+    return joblogs.read_events(readDocs, uuid, head, start, end, OUTPUT)
+
+
+def iter_items(readDocs, uuid, head):
+    """
+    Read a job's output :code:`CHUNKS_PER_READ` chunks at a time.
+
+    :param readDocs: function that bulk reads documents, like
+        :code:`spacewalk.Server.read_jobs`
+    :type readDocs: callable
+
+    :param uuid: job's uuid
+    :type uuid: str
+
+    :param head: the output's head document, or None if there is no output
+    :type head: dict
+
+    :returns items: generator of lists of the output's items, in order
+    :rtype: generator
+    """
+    if head is None:
+        return
+
+    step = head['chunkSize'] * CHUNKS_PER_READ
+    for start in range(0, head['count'], step):
+        yield read_items(readDocs, uuid, head, start, start + step)
+
+
+def encode_object(data, members=()):
+    """
+    Encode a JSON object a piece at a time: the fields of :code:`data`,
+    then members whose values are already encoded, like a blob or a
+    streamed list.
+
+    :param data: fields to encode
+    :type data: dict
+
+    :param members: names of the other members, and the pieces of their
+        encoded values
+    :type members: iterable of (str, iterable of str or bytes)
+
+    :returns pieces: generator of the pieces of the JSON object
+    :rtype: generator of str or bytes
+    """
+    yield json.dumps(data)[:-1]
+
+    separator = ", " if data else ""
+    for name, pieces in members:
+        yield "%s%s: " % (separator, json.dumps(name))
+        yield from pieces
+        separator = ", "
+
+    yield "}"
+
+
+def encode_list(batches):
+    """
+    :param batches: lists of items, in order
+    :type batches: iterable of list
+
+    :returns pieces: generator of the pieces of one JSON array of the items
+    :rtype: generator of str
+    """
+    yield "["
+
+    first = True
+    for items in batches:
+        if not items:
+            continue
+
+        piece = ", ".join(json.dumps(item) for item in items)
+        yield piece if first else ", " + piece
+        first = False
+
+    yield "]"
+
+
+def encode_ndjson(data, batches, members=()):
+    """
+    Encode a job's data as newline-delimited JSON: a line with the rest of
+    the job's data, then a line per output item.
+
+    :returns pieces: generator of the pieces of the document
+    :rtype: generator of str or bytes
+    """
+    yield from encode_object(data, members)
+    yield "\n"
+
+    for items in batches:
+        if items:
+            yield "".join(json.dumps(item) + "\n" for item in items)
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Profile a job's run() and save a compact summary of its hottest functions,
+along with the raw stats, in a profile document apart from the job's own
+document, so the raw stats don't bloat every read of the job.
+"""
+import asyncio
+import base64
+import cProfile
+import marshal
+import pstats
+import weakref
+import zlib
+
+# reserved field in a POST to a leaf's /job endpoint that turns on
+# profiling for that job
+PROFILE_PARAM = "_profile"
+
+# kind of a job's profile document
+PROFILE = "profile"
+
+# lock per event loop that serializes profiled async jobs
+_asyncLocks = weakref.WeakKeyDictionary()
+
+
+def async_lock():
+    """
+    Only one cProfile profiler can be enabled at a time in a thread, so
+    async jobs that run concurrently on an event loop MUST hold this lock
+    while they're profiled.
+
+    :returns lock: the profiling lock of the running event loop
+    :rtype: asyncio.Lock
+    """
+    loop = asyncio.get_running_loop()
+    lock = _asyncLocks.get(loop)
+    if lock is None:
+        lock = _asyncLocks[loop] = asyncio.Lock()
+
+    return lock
+
+
+def profile_key(uuid):
+    return "%s_%s" % (uuid, PROFILE)
+
+
+def function_name(func):
+    filename, line, name = func
+    return "%s:%d(%s)" % (filename, line, name)
+
+
+def summarize(stats, topN):
+    """
+    :param stats: profile stats
+    :type stats: pstats.Stats
+
+    :param topN: number of functions to include
+    :type topN: int
+
+    :returns summary: the :code:`topN` functions with the most cumulative
+        time, with their call counts, own time and cumulative time
+    :rtype: list of dict
+    """
+    rows = sorted(
+        stats.stats.items(), key=lambda item: item[1][3], reverse=True
+    )
+
+    summary = []
+    for func, (_, ncalls, tottime, cumtime, _) in rows[:topN]:
+        summary.append(
+            dict(
+                function=function_name(func),
+                ncalls=ncalls,
+                tottime=round(tottime, 6),
+                cumtime=round(cumtime, 6)
+            )
+        )
+    return summary
+
+
+def encode_stats(stats):
+    """
+    :returns encoded: base64 of the zlib-compressed stats in pstats file
+        format
+    :rtype: str
+    """
+    return base64.b64encode(
+        zlib.compress(marshal.dumps(stats.stats))
+    ).decode("ascii")
+
+
+def decode_stats(encoded):
+    """
+    :returns raw: stats in pstats file format, which can be saved and
+        loaded with :code:`pstats.Stats(filename)`, snakeviz, etc.
+    :rtype: bytes
+    """
+    return zlib.decompress(base64.b64decode(encoded))
+
+
+class RunProfile(object):
+    """
+    Context manager that profiles its block with cProfile. On exit, even
+    if the block raised, :code:`profile` is set to a dictionary with a
+    :code:`summary` of the top functions and the encoded raw
+    :code:`stats`.
+    """
+    def __init__(self, topN):
+        self.topN = topN
+        self.profiler = cProfile.Profile()
+        self.profile = None
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        self.profiler.disable()
+
+        stats = pstats.Stats(self.profiler)
+        self.profile = dict(
+            summary=summarize(stats, self.topN),
+            stats=encode_stats(stats)
+        )
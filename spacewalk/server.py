@@ -4,25 +4,320 @@
 """
 Spacewalk Server class definition
 """
+import asyncio
+import functools
+import gc
+from tornado.httpserver import HTTPServer
+from tornado.ioloop import IOLoop
+from tornado.netutil import bind_sockets
+from tornado.process import fork_processes
 import zerog
 
+from spacewalk.bulk import bulk_datastore, bulk_queue
+from spacewalk.formats import JsonCodec
+from spacewalk.handlers import StructureRouter
+from spacewalk.idempotency import IdempotencyKeys, ResultIndex
+from spacewalk.jobs import queue_message, queue_name
+from spacewalk import metrics
+from spacewalk.snapshot import update_snapshot
+from spacewalk.watchers import JobWatchers
+
+import logging
+log = logging.getLogger(__name__)
+
+# number of leaves to warm up between yields to the IOLoop
+WARM_UP_BATCH = 50
+
+# most times that dead worker processes are restarted by serve_forked
+MAX_RESTARTS = 100
+
 
 class Server(zerog.Server):
     """
     Base Spacewalk server class
     """
-    def __init__(self, structure, *args, **kwargs):
+    def __init__(
+        self,
+        structure,
+        name,
+        makeDatastore,
+        makeQueue,
+        *args,
+        warmUp=False,
+        watchInterval=1.0,
+        idempotencyTTL=86400,
+        recordMetrics=True,
+        jsonCodec=None,
+        **kwargs
+    ):
         """
         :param structure: object that defines the tree and pathmap for
             an auto-generated spacewalk REST API
         :type structure: spacewalk.Structure
 
-        :param `*args`: positional arguments passed through to the
+        :param name: name of the service, which names its default queue
+        :type name: str
+
+        :param makeDatastore: function that makes a datastore
+        :type makeDatastore: callable
+
+        :param makeQueue: function that makes a queue from a queue name
+        :type makeQueue: callable
+
+        :param `*args`: other positional arguments passed through to the
             ``zerog.Server`` parent class
 
+        :param warmUp: if True, generate all the leaves' post-schemas in
+            the background once the server is listening, rather than when
+            each one is first requested
+        :type warmUp: bool
+
+        :param watchInterval: seconds between datastore reads of the jobs
+            whose progress is being streamed
+        :type watchInterval: float
+
+        :param idempotencyTTL: seconds that an :code:`Idempotency-Key`
+            for a job submission is remembered
+        :type idempotencyTTL: float
+
+        :param recordMetrics: if True, record request, datastore and queue
+            metrics for the /metrics endpoint
+        :type recordMetrics: bool
+
+        :param jsonCodec: encodes JSON responses and decodes JSON request
+            bodies. Defaults to the standard library's encoder.
+        :type jsonCodec: :code:`spacewalk.formats.JsonCodec`
+
         :param `**kwargs`: keyword arguments passed through to the
             ``zerog.Server`` parent class
         """
-        super(Server, self).__init__(*args, **kwargs)
+        super(Server, self).__init__(
+            name, makeDatastore, makeQueue, *args, **kwargs
+        )
 
         self.structure = structure
+        self.serviceName = name
+        self.makeQueue = makeQueue
+        self.warmUp = warmUp
+        self.recordMetrics = recordMetrics
+        self.jsonCodec = jsonCodec or JsonCodec()
+
+        self.datastore = bulk_datastore(self.datastore)
+        self.queue = bulk_queue(
+            self.queue, functools.partial(makeQueue, name)
+        )
+        if recordMetrics:
+            self.datastore = metrics.TimedDatastore(self.datastore)
+            self.queue = metrics.TimedQueue(self.queue)
+
+        # queues of branches and leaves with their own QUEUE, by name
+        self.queues = {name: self.queue}
+
+        self.watchers = JobWatchers(self.read_jobs, watchInterval)
+        self.idempotencyKeys = IdempotencyKeys(self.datastore, idempotencyTTL)
+        self.resultIndex = ResultIndex(self.datastore)
+
+        # structure routers create their request handlers through the
+        # application, so they need a reference to it
+        for rule in self.wildcard_router.rules:
+            if isinstance(rule.target, StructureRouter):
+                rule.target.bind(self)
+
+    def log_request(self, handler):
+        super(Server, self).log_request(handler)
+
+        if self.recordMetrics:
+            handlerName = type(handler).__name__
+            path = getattr(handler, "path", None) or ""
+            metrics.REQUESTS.inc(handlerName, path, handler.get_status())
+            metrics.REQUEST_SECONDS.observe(
+                handler.request.request_time(), handlerName, path
+            )
+
+    def listen(self, *args, **kwargs):
+        server = super(Server, self).listen(*args, **kwargs)
+
+        if self.warmUp:
+            IOLoop.current().spawn_callback(self.warm_up)
+
+        return server
+
+    def make_jobs(self, cls, paramsList):
+        """
+        Create and enqueue several jobs of the same class at once. The job
+        documents are written with one bulk datastore call, and the jobs
+        are enqueued with one bulk queue call.
+
+        :param cls: job class
+        :type cls: :code:`spacewalk.BaseJob` subclass
+
+        :param paramsList: each job's parameters
+        :type paramsList: list of dict
+
+        :returns jobs: the new jobs, in the same order as their parameters
+        :rtype: list of :code:`spacewalk.BaseJob`
+        """
+        queue = self.get_queue(cls)
+        jobs = [
+            cls(self.datastore, queue, **params)
+            for params in paramsList
+        ]
+        self.save_jobs(jobs)
+        self.enqueue_jobs(jobs)
+
+        return jobs
+
+    def get_queue(self, cls):
+        """
+        :returns queue: the queue for a job class, chosen by its QUEUE
+        """
+        queueName = queue_name(self.serviceName, cls)
+        queue = self.queues.get(queueName)
+        if queue is None:
+            queue = bulk_queue(
+                self.makeQueue(queueName),
+                functools.partial(self.makeQueue, queueName)
+            )
+            if self.recordMetrics:
+                queue = metrics.TimedQueue(queue)
+
+            self.queues[queueName] = queue
+
+        return queue
+
+    def save_jobs(self, jobs):
+        self.datastore.set_multi({job.uuid: job.dump() for job in jobs})
+
+    def enqueue_jobs(self, jobs):
+        """
+        enqueue jobs of the same class, which go through the same queue
+        with the same :code:`queueKwargs`, with the same messages as
+        zerog's :code:`BaseJob.enqueue`. A single job is enqueued by its
+        own :code:`enqueue`, which also records its queue job id.
+        """
+        if not jobs:
+            return
+
+        if len(jobs) == 1:
+            return jobs[0].enqueue()
+
+        jobs[0].queue.put_multi(
+            [queue_message(job.uuid) for job in jobs],
+            **getattr(jobs[0], "queueKwargs", {})
+        )
+
+    def read_jobs(self, uuids):
+        """
+        Read several job documents with one bulk datastore call.
+
+        :param uuids: job uuids
+        :type uuids: list of str
+
+        :returns docs: dictionary that maps each uuid to its job document,
+            or None if there is no job for the uuid
+        :rtype: dict
+        """
+        docs = self.datastore.get_multi(uuids)
+        return {uuid: docs.get(uuid) for uuid in uuids}
+
+    async def warm_up(self):
+        """
+        Warm up the structure's post-schemas in batches, yielding to the
+        IOLoop between batches so requests are still served.
+        """
+        leaves = self.structure.get_leaf_targets()
+        for start in range(0, len(leaves), WARM_UP_BATCH):
+            self.structure.warm_up(leaves[start:start + WARM_UP_BATCH])
+            await asyncio.sleep(0)
+
+        log.info("warmed up %d post-schemas" % len(leaves))
+
+
+def serve_forked(
+    structure,
+    port,
+    *args,
+    processes=None,
+    address=None,
+    maxRestarts=MAX_RESTARTS,
+    metricsPort=None,
+    snapshotFile=None,
+    **kwargs
+):
+    """
+    Serve a Spacewalk API from several pre-forked processes that share one
+    listening socket.
+
+    The structure is warmed up and the socket is bound once in the parent,
+    which then forks the workers and restarts any that die. The workers
+    share the prebuilt tree and its encoded responses with the parent
+    copy-on-write. Each worker makes its own :code:`Server`, and so its
+    own datastore and queue connections, after it's forked.
+
+    Each worker also has its own metrics, so the /metrics endpoint on the
+    shared port shows whichever worker took the request. With
+    :code:`metricsPort`, worker :code:`n` (from 0) also serves its
+    metrics on port :code:`metricsPort + n`, for Prometheus to scrape each
+    worker as its own target.
+
+    This must be called before an IOLoop is started, and doesn't return.
+
+    :param structure: object that defines the tree and pathmap for
+        an auto-generated spacewalk REST API
+    :type structure: spacewalk.Structure
+
+    :param port: port to listen on
+    :type port: int
+
+    :param `*args`: positional arguments passed through to
+        :code:`Server`
+
+    :param processes: number of worker processes. Defaults to the number
+        of CPUs.
+    :type processes: int
+
+    :param address: address to listen on. Defaults to all interfaces.
+    :type address: str
+
+    :param maxRestarts: most times that dead workers are restarted before
+        the parent gives up
+    :type maxRestarts: int
+
+    :param metricsPort: first of the ports that the workers serve their
+        metrics on, one each, or None to only serve them on /metrics
+    :type metricsPort: int
+
+    :param snapshotFile: structure snapshot file. The parent saves the
+        warmed-up structure to it, unless it's up to date already, so the
+        next start can load it with :code:`spacewalk.cached_structure`
+        instead of building it, and so can job workers started with
+        :code:`--snapshot`.
+    :type snapshotFile: str
+
+    :param `**kwargs`: keyword arguments passed through to
+        :code:`Server`
+    """
+    structure.warm_up()
+    if snapshotFile is not None:
+        try:
+            update_snapshot(structure, snapshotFile)
+        except OSError as e:
+            log.warning("can't save structure snapshot %s: %s" %
+                        (snapshotFile, e))
+
+    sockets = bind_sockets(port, address)
+
+    # keep the garbage collector from touching, and so un-sharing, the
+    # pages that hold the objects made so far
+    gc.freeze()
+
+    taskId = fork_processes(processes, max_restarts=maxRestarts)
+
+    server = Server(structure, *args, **kwargs)
+    HTTPServer(server).add_sockets(sockets)
+
+    if metricsPort is not None:
+        metrics.start_http_server(metricsPort + taskId, address or "")
+
+    log.info("worker %d serving on port %d" % (taskId, port))
+    IOLoop.current().start()
@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Save a built Spacewalk Structure to a snapshot file, and load it in other
+processes instead of rebuilding it.
+
+The snapshot keeps the tree's encoded discovery and post-schema
+responses, so loading it doesn't generate or encode any of them again.
+
+A snapshot is keyed by a fingerprint of the job classes in the tree and
+their Params schemas, so a snapshot made from different job code is stale
+and gets rebuilt.
+"""
+import functools
+import gzip
+import hashlib
+import inspect
+import json
+import os
+import sys
+import tempfile
+
+from marshmallow import fields, Schema
+import marshmallow_jsonschema
+import zerog
+
+from spacewalk.structure import (
+    auto_tree, Branch, EncodedResponse, Leaf, Structure
+)
+
+import logging
+log = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 2
+
+# fields that can have schemas nested in them
+CONTAINER_FIELDS = (fields.Nested, fields.List, fields.Tuple, fields.Mapping)
+
+
+class StaleSnapshotError(Exception):
+    pass
+
+
+def class_key(cls):
+    return "%s:%s" % (cls.__module__, cls.__qualname__)
+
+
+def nested_schemas(field):
+    """
+    :returns schemas: generator of the schema classes nested in a field,
+        including those of list, dict and tuple items
+    :rtype: generator
+    """
+    nested = getattr(field, "nested", None)
+    if isinstance(nested, Schema):
+        nested = type(nested)
+
+    if isinstance(nested, type) and issubclass(nested, Schema):
+        yield nested
+
+    inner = list(getattr(field, "tuple_fields", ()))
+    inner.append(getattr(field, "inner", None))
+    inner.append(getattr(field, "value_field", None))
+    for f in inner:
+        if f is not None:
+            yield from nested_schemas(f)
+
+
+@functools.lru_cache(maxsize=None)
+def is_container(fieldCls):
+    return issubclass(fieldCls, CONTAINER_FIELDS)
+
+
+def schema_classes(schemaCls, found):
+    """
+    Add the classes that shape a Params schema's JSON schema to
+    :code:`found`: the schema, the schemas it inherits from, the schemas
+    nested in its fields, and the fields' own classes.
+
+    :param schemaCls: marshmallow schema class
+    :type schemaCls: class
+
+    :param found: classes found so far
+    :type found: set
+    """
+    for cls in inspect.getmro(schemaCls):
+        if cls in found or not issubclass(cls, Schema):
+            continue
+
+        found.add(cls)
+        for field in cls._declared_fields.values():
+            fieldCls = type(field)
+            found.add(fieldCls)
+            if is_container(fieldCls):
+                for nested in nested_schemas(field):
+                    schema_classes(nested, found)
+
+
+def fingerprint(rootcls, path):
+    """
+    Fingerprint the job classes in a tree. The fingerprint changes if any
+    class is added, removed or renamed, or if any module that defines a job
+    class, or a class that shapes a job's Params schema, changes. Modules
+    are compared by the size and modification time of their files, which
+    is much quicker than reading them.
+
+    :param rootcls: the root job class
+    :type rootcls: :code:`spacewalk.BaseJob` subclass
+
+    :param path: root path for all the URIs in the tree
+    :type path: str
+
+    :returns fingerprint: hex digest
+    :rtype: str
+    """
+    classes = [rootcls] + zerog.find_subclasses(rootcls)
+    digest = hashlib.sha256()
+
+    digest.update(
+        json.dumps([
+            SNAPSHOT_VERSION,
+            getattr(marshmallow_jsonschema, "__version__", None),
+            path,
+            sorted(class_key(cls) for cls in classes)
+        ]).encode()
+    )
+
+    found = set(classes)
+    for cls in classes:
+        params = getattr(cls, "Params", None)
+        if params is not None:
+            schema_classes(params, found)
+
+    sources = set()
+    for moduleName in {cls.__module__ for cls in found}:
+        # builtin modules have no file
+        source = getattr(sys.modules.get(moduleName), "__file__", None)
+        if source:
+            sources.add(source)
+
+    for source in sorted(sources):
+        stat = os.stat(source)
+        digest.update(
+            json.dumps([source, stat.st_size, stat.st_mtime_ns]).encode()
+        )
+
+    return digest.hexdigest()
+
+
+def dump_tree(branch):
+    return dict(
+        cls=class_key(branch.cls),
+        path=branch.path,
+        jobType=branch.cls.JOB_TYPE,
+        name=branch.cls.NAME,
+        description=branch.cls.DESCRIPTION,
+        encodedBranches=branch.encodedBranches.to_data(),
+        encodedLeaves=branch.encodedLeaves.to_data(),
+        branches=[dump_tree(b) for b in branch.branches.values()],
+        leaves=[
+            dict(
+                cls=class_key(leaf.cls),
+                path=leaf.path,
+                jobType=leaf.cls.JOB_TYPE,
+                name=leaf.cls.NAME,
+                description=leaf.cls.DESCRIPTION,
+                encodedPostschema=leaf.encodedPostschema.to_data()
+            )
+            for leaf in branch.leaves.values()
+        ]
+    )
+
+
+def snapshot_class(nodeData, classes):
+    """
+    :returns cls: the job class of a snapshot's branch or leaf
+
+    :raises StaleSnapshotError: if the class is missing, or its job type,
+        name or description aren't the ones in the snapshot, which can
+        change without the source changing, such as when they're read
+        from the environment
+    """
+    try:
+        cls = classes[nodeData['cls']]
+    except KeyError:
+        raise StaleSnapshotError("no class %s" % nodeData['cls'])
+
+    checked = (
+        ("JOB_TYPE", "jobType"),
+        ("NAME", "name"),
+        ("DESCRIPTION", "description")
+    )
+    for attr, key in checked:
+        if getattr(cls, attr) != nodeData[key]:
+            raise StaleSnapshotError(
+                "%s of %s changed" % (attr, nodeData['cls'])
+            )
+
+    return cls
+
+
+def load_tree(data, classes):
+    """
+    rebuild a tree from its snapshot data
+
+    :param classes: dictionary that maps class keys to job classes
+    :type classes: dict
+
+    :raises StaleSnapshotError: if a class is missing or has changed
+    """
+    leaves = []
+    for leafData in data['leaves']:
+        leaf = Leaf(snapshot_class(leafData, classes), data['path'])
+        leaf._encodedPostschema = EncodedResponse.from_data(
+            leafData['encodedPostschema']
+        )
+        leaves.append(leaf)
+
+    cls = snapshot_class(data, classes)
+
+    branch = Branch(
+        cls,
+        [load_tree(b, classes) for b in data['branches']],
+        leaves,
+        data['path']
+    )
+    branch.encodedBranches = EncodedResponse.from_data(
+        data['encodedBranches']
+    )
+    branch.encodedLeaves = EncodedResponse.from_data(data['encodedLeaves'])
+
+    return branch
+
+
+def save_snapshot(structure, filename, fingerprint):
+    """
+    Write a structure's snapshot. Generates and encodes any post-schemas
+    that haven't been generated yet.
+
+    The file is replaced atomically, so processes reading it never see a
+    partial snapshot.
+
+    :param structure: the structure to save
+    :type structure: :code:`spacewalk.Structure`
+
+    :param filename: snapshot file path
+    :type filename: str
+
+    :param fingerprint: fingerprint of the structure's job classes
+    :type fingerprint: str
+    """
+    data = dict(
+        version=SNAPSHOT_VERSION,
+        fingerprint=fingerprint,
+        encoding=structure.encoding,
+        tree=dump_tree(structure.tree)
+    )
+    encoded = gzip.compress(json.dumps(data, separators=(",", ":")).encode())
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmpname = tempfile.mkstemp(dir=dirname, prefix=".spacewalk-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(encoded)
+        os.replace(tmpname, filename)
+    except BaseException:
+        os.unlink(tmpname)
+        raise
+
+
+def read_snapshot(filename):
+    """
+    :returns data: the snapshot file's contents
+    :rtype: dict
+
+    :raises OSError, ValueError: if the snapshot can't be read
+    """
+    with open(filename, "rb") as f:
+        return json.loads(gzip.decompress(f.read()))
+
+
+def load_snapshot(rootcls, filename, fingerprint, **kwargs):
+    """
+    Load a structure from a snapshot.
+
+    :param rootcls: the root job class
+    :type rootcls: :code:`spacewalk.BaseJob` subclass
+
+    :param filename: snapshot file path
+    :type filename: str
+
+    :param fingerprint: fingerprint of the current job classes
+    :type fingerprint: str
+
+    :param `**kwargs`: keyword arguments passed through to
+        :code:`spacewalk.Structure`
+
+    :returns structure:
+    :rtype: :code:`spacewalk.Structure`
+
+    :raises StaleSnapshotError: if the snapshot doesn't match the
+        fingerprint or the current job classes, or its responses weren't
+        encoded the way the structure's are
+    :raises OSError, ValueError: if the snapshot can't be read
+    """
+    data = read_snapshot(filename)
+
+    if (
+        data.get('version') != SNAPSHOT_VERSION or
+        data.get('fingerprint') != fingerprint
+    ):
+        raise StaleSnapshotError("fingerprint mismatch")
+
+    classes = {
+        class_key(cls): cls
+        for cls in [rootcls] + zerog.find_subclasses(rootcls)
+    }
+    structure = Structure(load_tree(data['tree'], classes), **kwargs)
+    if structure.encoding != data['encoding']:
+        raise StaleSnapshotError("response encodings changed")
+
+    return structure
+
+
+def cached_structure(rootcls, path, filename, **kwargs):
+    """
+    Load a structure from a snapshot file if the snapshot matches the
+    current job classes. Otherwise build the structure and save a new
+    snapshot.
+
+    :param rootcls: the root job class
+    :type rootcls: :code:`spacewalk.BaseJob` subclass
+
+    :param path: root path for all the URIs in the tree
+    :type path: str
+
+    :param filename: snapshot file path
+    :type filename: str
+
+    :param `**kwargs`: keyword arguments passed through to
+        :code:`spacewalk.Structure`
+
+    :returns structure:
+    :rtype: :code:`spacewalk.Structure`
+    """
+    currentFingerprint = fingerprint(rootcls, path)
+
+    try:
+        return load_snapshot(rootcls, filename, currentFingerprint, **kwargs)
+    except FileNotFoundError:
+        log.info("no structure snapshot at %s" % filename)
+    except (StaleSnapshotError, OSError, ValueError, KeyError) as e:
+        log.info("rebuilding structure snapshot %s: %s" % (filename, e))
+
+    structure = Structure(auto_tree(rootcls, path), **kwargs)
+    try:
+        save_snapshot(structure, filename, currentFingerprint)
+    except OSError as e:
+        log.warning("can't save structure snapshot %s: %s" % (filename, e))
+
+    return structure
+
+
+def structure_fingerprint(structure):
+    """
+    :returns fingerprint: the fingerprint of a structure's job classes, as
+        :code:`cached_structure` would compute it for the structure
+    :rtype: str
+    """
+    # the root's path is the tree's path followed by the root's name
+    path = structure.get_root_path().rpartition("/")[0]
+    return fingerprint(structure.tree.cls, path)
+
+
+def update_snapshot(structure, filename):
+    """
+    Save a structure's snapshot, unless the snapshot file already has an
+    up-to-date snapshot of it, so other processes can load it with
+    :code:`cached_structure`.
+
+    :param structure: the structure to save
+    :type structure: :code:`spacewalk.Structure`
+
+    :param filename: snapshot file path
+    :type filename: str
+
+    :returns saved: False if the snapshot was up to date
+    :rtype: bool
+    """
+    currentFingerprint = structure_fingerprint(structure)
+
+    try:
+        data = read_snapshot(filename)
+    except (OSError, ValueError):
+        data = {}
+
+    current = (SNAPSHOT_VERSION, currentFingerprint, structure.encoding)
+    if (
+        data.get('version'), data.get('fingerprint'), data.get('encoding')
+    ) == current:
+        return False
+
+    save_snapshot(structure, filename, currentFingerprint)
+    log.info("saved structure snapshot %s" % filename)
+    return True
@@ -4,18 +4,194 @@
 """
 Spacewalk tools for auto-generating a REST API structure
 """
+import base64
+import functools
+import gzip
+import hashlib
+import json
+from marshmallow import EXCLUDE
 from marshmallow_jsonschema import JSONSchema
 
+from spacewalk import formats
 from spacewalk.jobs import NOT_OVERRIDDEN
 
 import logging
 log = logging.getLogger(__name__)
 
 
+# key for a trie node's Branch or Leaf. Can't collide with a path segment.
+TARGET = None
+
+
 class NotLeafError(Exception):
     pass
 
 
+class EncodedResponse(object):
+    """
+    A JSON response body that is encoded once and then served as bytes.
+
+    The pretty-printed encoding is always made. Compact and gzipped
+    variants are optional. A MessagePack encoding is made the first time
+    it's requested. Each encoding has a strong ETag, made from a digest
+    of the response that is computed once.
+
+    A response loaded from a snapshot decodes each encoding from the
+    snapshot the first time it's served. The snapshot only keeps the
+    gzipped copy of an encoding that has one, which is much smaller, and
+    the encoding is decompressed from it.
+    """
+    def __init__(self, obj, compact=False, compress=False):
+        """
+        :param obj: JSON-serializable response object
+        :type obj: dict or list
+
+        :param compact: also encode without whitespace
+        :type compact: bool
+
+        :param compress: also make gzipped copies of the encodings
+        :type compress: bool
+        """
+        self.bodies = {(False, False): json.dumps(obj, indent=4).encode()}
+
+        if compact:
+            self.bodies[(True, False)] = json.dumps(
+                obj, separators=(",", ":")
+            ).encode()
+
+        if compress:
+            for isCompact, _ in list(self.bodies):
+                self.bodies[(isCompact, True)] = gzip.compress(
+                    self.bodies[(isCompact, False)]
+                )
+
+        self.msgpackBody = None
+        self.digest = hashlib.sha1(self.bodies[(False, False)]).hexdigest()
+
+    def to_data(self):
+        """
+        :returns data: the encodings and digest, as JSON-serializable data
+            that :code:`from_data` makes the response from again without
+            re-encoding it
+        :rtype: dict
+        """
+        return dict(
+            digest=self.digest,
+            bodies=[
+                [
+                    compact,
+                    gzipped,
+                    base64.b64encode(self.body((compact, gzipped))).decode()
+                ]
+                for compact, gzipped in self.bodies
+                if gzipped or (compact, True) not in self.bodies
+            ]
+        )
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        :param data: data made by :code:`to_data`
+        :type data: dict
+
+        :returns response:
+        :rtype: :code:`EncodedResponse`
+        """
+        response = cls.__new__(cls)
+        response.bodies = {}
+        for compact, gzipped, body in data['bodies']:
+            response.bodies[(compact, gzipped)] = functools.partial(
+                base64.b64decode, body
+            )
+            if gzipped:
+                response.bodies[(compact, False)] = functools.partial(
+                    response.decompress, compact
+                )
+
+        response.msgpackBody = None
+        response.digest = data['digest']
+        return response
+
+    def body(self, variant):
+        """
+        :param variant: whether the encoding is compact, and gzipped
+        :type variant: tuple of (bool, bool)
+
+        :returns body: the encoding
+        :rtype: bytes
+        """
+        body = self.bodies[variant]
+        if callable(body):
+            # loaded from a snapshot, and decoded the first time it's needed
+            body = self.bodies[variant] = body()
+
+        return body
+
+    def decode(self):
+        """
+        decode all the encodings that haven't been decoded since they were
+        loaded from a snapshot
+        """
+        for variant in list(self.bodies):
+            self.body(variant)
+
+    def decompress(self, compact):
+        return gzip.decompress(self.body((compact, True)))
+
+    def get_object(self):
+        """
+        :returns obj: the response object, decoded from its encoding
+        :rtype: dict or list
+        """
+        return json.loads(self.body((False, False)))
+
+    def closest(self, compact=False, gzipped=False):
+        """
+        :returns compact, gzipped: the closest available encoding to the one
+            requested
+        :rtype: tuple of (bool, bool)
+        """
+        compact = compact and (True, False) in self.bodies
+        gzipped = gzipped and (compact, True) in self.bodies
+        return compact, gzipped
+
+    def get_body(self, compact=False, gzipped=False):
+        """
+        Get the closest available encoding to the one requested.
+
+        :returns body, gzipped: the encoded body, and whether it is gzipped
+        :rtype: tuple of (bytes, bool)
+        """
+        compact, gzipped = self.closest(compact, gzipped)
+        return self.body((compact, gzipped)), gzipped
+
+    def etag(self, compact=False, gzipped=False, msgpack=False):
+        """
+        :returns etag: the ETag of the encoding that :code:`get_body` or
+            :code:`get_msgpack` returns
+        :rtype: str
+        """
+        if msgpack:
+            variant = "msgpack"
+        else:
+            compact, gzipped = self.closest(compact, gzipped)
+            variant = "compact" if compact else "pretty"
+            if gzipped:
+                variant += "-gzip"
+
+        return '"%s-%s"' % (self.digest, variant)
+
+    def get_msgpack(self):
+        """
+        :returns body: the MessagePack encoding
+        :rtype: bytes
+        """
+        if self.msgpackBody is None:
+            self.msgpackBody = formats.msgpack_dumps(self.get_object())
+
+        return self.msgpackBody
+
+
 class Branch():
     """
     A branch node in a Spacewalk tree. Saves the associated job class, REST
@@ -45,12 +221,52 @@ class Branch():
         self.branches = {b.cls.BRANCH_NAME: b for b in branches}
         self.leaves = {l.cls.LEAF_NAME: l for l in leaves}
 
+        # set when the Branch's Structure is built
+        self.encodedBranches = None
+        self.encodedLeaves = None
+
+    def sub_branch_info(self):
+        """
+        :returns sub branches: list of dictionaries for each sub branch.
+            Dictionary keys are 'path', 'name', 'description'
+        """
+        info = []
+        for sub in self.branches.values():
+            info.append(
+                dict(
+                    path=sub.path,
+                    name=sub.cls.NAME,
+                    description=sub.cls.DESCRIPTION
+                )
+            )
+        return info
+
+    def leaf_info(self):
+        """
+        :returns leaves: list of dictionaries for each leaf
+            Dictionary keys are 'path', 'jobType', 'name', 'description'
+        """
+        info = []
+        for leaf in self.leaves.values():
+            info.append(
+                dict(
+                    path=leaf.path,
+                    jobType=leaf.cls.JOB_TYPE,
+                    name=leaf.cls.NAME,
+                    description=leaf.cls.DESCRIPTION
+                )
+            )
+        return info
+
 
 class Leaf():
     """
     An end node in a Spacewalk tree. Saves the associated job class, REST
     path, and the json schema for the job's parameters.
 
+    The json schema is generated the first time it's needed, so building a
+    large tree doesn't pay for generating every leaf's schema up front.
+
     Leaf jobs are the jobs that actually run.
     """
     def __init__(self, cls, path):
@@ -63,7 +279,59 @@ class Leaf():
         """
         self.cls = cls
         self.path = path + "/%s" % cls.LEAF_NAME
-        self.postschema = JSONSchema().dump(cls.Params())
+        self._postschema = None
+        self._encodedPostschema = None
+        self._validator = None
+
+        # set when the Leaf's Structure is built
+        self.encoding = dict(compact=False, compress=False)
+
+    @property
+    def postschema(self):
+        if self._postschema is None and self._encodedPostschema is not None:
+            # loaded from a snapshot with only the encoded response
+            self._postschema = self._encodedPostschema.get_object()[
+                'postSchema'
+            ]
+
+        if self._postschema is None:
+            self._postschema = JSONSchema().dump(self.cls.Params())
+
+        return self._postschema
+
+    @property
+    def validator(self):
+        # fields that aren't params are passed through to the job, so
+        # they aren't validation errors
+        if self._validator is None:
+            self._validator = self.cls.Params(unknown=EXCLUDE)
+
+        return self._validator
+
+    def validate(self, params):
+        """
+        Validate the parameters for a POST to this leaf.
+
+        :param params: job parameters
+        :type params: dict
+
+        :returns errors: dictionary of validation errors, which is empty if
+            the parameters are valid
+        :rtype: dict
+        """
+        if not isinstance(params, dict):
+            return {"_schema": ["params must be an object"]}
+
+        return self.validator.validate(params)
+
+    @property
+    def encodedPostschema(self):
+        if self._encodedPostschema is None:
+            self._encodedPostschema = EncodedResponse(
+                dict(postSchema=self.postschema), **self.encoding
+            )
+
+        return self._encodedPostschema
 
 
 def auto_tree(rootcls, path):
@@ -120,6 +388,60 @@ def make_path_map(rootbranch, pathmap):
     return pathmap
 
 
+def make_path_trie(pathmap):
+    """
+    Build a trie of nested dictionaries, keyed by path segment, from a
+    pathmap. The Branch or Leaf for a path is stored in its trie node under
+    the :code:`TARGET` key.
+
+    :param pathmap: dictionary that maps paths to Branches or Leaves
+    :type pathmap: dict
+
+    :returns trie:
+    :rtype: dict
+    """
+    trie = {}
+    for path, target in pathmap.items():
+        node = trie
+        for segment in path.strip("/").split("/"):
+            node = node.setdefault(segment, {})
+
+        node[TARGET] = target
+
+    return trie
+
+
+def encode_responses(pathmap, compact, compress):
+    """
+    The tree doesn't change once it's built, so encode the discovery
+    responses for every Branch and Leaf up front, other than those that
+    were loaded already encoded from a snapshot.
+
+    :param pathmap: dictionary that maps paths to Branches or Leaves
+    :type pathmap: dict
+
+    :param compact: also encode without whitespace
+    :type compact: bool
+
+    :param compress: also make gzipped copies of the encodings
+    :type compress: bool
+    """
+    for target in pathmap.values():
+        if isinstance(target, Branch):
+            if target.encodedBranches is not None:
+                continue
+
+            target.encodedBranches = EncodedResponse(
+                target.sub_branch_info(), compact, compress
+            )
+            target.encodedLeaves = EncodedResponse(
+                target.leaf_info(), compact, compress
+            )
+        else:
+            # post-schemas are generated & encoded on first use
+            target.encoding = dict(compact=compact, compress=compress)
+
+
 def is_branch(cls):
     return len(cls.__subclasses__()) > 0 or cls.LEAF_NAME == NOT_OVERRIDDEN
 
@@ -136,13 +458,43 @@ class Structure(object):
     Spacewalk structure class which contains a tree and a pathmap, and
     methods to extract useful things from the structure.
     """
-    def __init__(self, tree):
+    def __init__(self, tree, compact=True, compress=True):
         """
         :param tree: root of Spacewalk tree
         :type tree: :code:`Branch`
+
+        :param compact: also pre-encode discovery responses without
+            whitespace
+        :type compact: bool
+
+        :param compress: also pre-encode gzipped discovery responses
+        :type compress: bool
         """
         self.tree = tree
+        self.encoding = dict(compact=compact, compress=compress)
         self.pathmap = make_path_map(tree, {})
+        self.pathtrie = make_path_trie(self.pathmap)
+        self.jobClasses = {
+            leaf.cls.JOB_TYPE: leaf.cls for leaf in self.get_leaf_targets()
+        }
+        encode_responses(self.pathmap, compact, compress)
+
+    def warm_up(self, leaves=None):
+        """
+        Generate and cache the post-schemas, their encoded responses, and
+        the params validators, which are otherwise made the first time
+        they're needed. Encoded responses loaded from a snapshot are
+        decoded, so processes forked afterwards share them.
+
+        :param leaves: the leaves to warm up. Defaults to all of them.
+        :type leaves: list of :code:`Leaf`
+        """
+        if leaves is None:
+            leaves = self.get_leaf_targets()
+
+        for leaf in leaves:
+            leaf.encodedPostschema.decode()
+            leaf.validator
 
     def get_root_path(self):
         """
@@ -151,6 +503,35 @@ class Structure(object):
         """
         return self.tree.path
 
+    def get_target(self, path):
+        """
+        Find the Branch or Leaf for a path by walking the path trie, so the
+        cost depends on the depth of the path, not on the size of the tree.
+
+        :param path: path portion of a Branch's or Leaf's URI
+        :type path: str
+
+        :returns target: the Branch or Leaf, or None if there isn't one
+        :rtype: :code:`Branch` or :code:`Leaf`
+        """
+        node = self.pathtrie
+        for segment in path.strip("/").split("/"):
+            node = node.get(segment)
+            if node is None:
+                return None
+
+        return node.get(TARGET)
+
+    def get_job_class(self, jobType):
+        """
+        :param jobType: a leaf's job type
+        :type jobType: str
+
+        :returns cls: the leaf's job class, or None if there isn't one
+        :rtype: :code:`spacewalk.BaseJob` subclass
+        """
+        return self.jobClasses.get(jobType)
+
     def get_branch_paths(self):
         """
         :returns paths: list of paths to branches
@@ -165,6 +546,13 @@ class Structure(object):
         """
         return targets_by_type(self.pathmap, Leaf)
 
+    def get_leaf_targets(self):
+        """
+        :returns leaves: list of all the leaves
+        :rtype: list of :code:`Leaf`
+        """
+        return [self.pathmap[path] for path in self.get_leaf_paths()]
+
     def get_sub_branches(self, path):
         """
         Return all the sub branches associated with a path.
@@ -177,17 +565,7 @@ class Structure(object):
 
         :raises KeyError: if there is no branch for the path
         """
-        branch = self.pathmap[path]
-        info = []
-        for sub in branch.branches.values():
-            info.append(
-                dict(
-                    path=sub.path,
-                    name=sub.cls.NAME,
-                    description=sub.cls.DESCRIPTION
-                )
-            )
-        return info
+        return self.pathmap[path].sub_branch_info()
 
     def get_leaves(self, path):
         """
@@ -201,18 +579,7 @@ class Structure(object):
 
         :raises KeyError: if there is no branch for the path
         """
-        branch = self.pathmap[path]
-        info = []
-        for leaf in branch.leaves.values():
-            info.append(
-                dict(
-                    path=leaf.path,
-                    jobType=leaf.cls.JOB_TYPE,
-                    name=leaf.cls.NAME,
-                    description=leaf.cls.DESCRIPTION
-                )
-            )
-        return info
+        return self.pathmap[path].leaf_info()
 
     def get_post_schema(self, path):
         """
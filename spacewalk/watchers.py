@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Shared watchers that push job progress to streaming clients.
+
+There is one watcher per watched job, however many clients are watching
+it, and every watched job, and the head of its chunked log, is read with a
+single bulk datastore read per polling interval.
+"""
+import asyncio
+from tornado.ioloop import IOLoop
+
+from spacewalk import joblogs
+
+import logging
+log = logging.getLogger(__name__)
+
+PROGRESS = "progress"
+LOG = "log"
+RESULT = "result"
+NOT_FOUND = "not-found"
+
+# events after which a stream ends
+FINAL_EVENTS = (RESULT, NOT_FOUND)
+
+
+class JobWatcher(object):
+    """
+    Tracks one job's progress and sends changes to each subscriber's
+    queue as :code:`(event, data)` tuples.
+    """
+    def __init__(self, uuid):
+        self.uuid = uuid
+        self.subscribers = set()
+        self.doc = None
+        self.head = None
+        self.logCount = 0
+
+    def subscribe(self, history=None):
+        """
+        :param history: the job's log events sent so far, which a
+            subscriber to a job that is already watched gets first, like
+            the first subscriber did
+        :type history: list of dict
+
+        :returns queue: queue that receives :code:`(event, data)` tuples
+        :rtype: asyncio.Queue
+        """
+        queue = asyncio.Queue()
+        self.subscribers.add(queue)
+
+        # a new subscriber starts with the current state
+        if self.doc is not None:
+            if history:
+                queue.put_nowait((LOG, history))
+            queue.put_nowait((PROGRESS, self.progress(self.doc)))
+
+        return queue
+
+    def history(self, readJobs):
+        """
+        :param readJobs: function that bulk reads job documents
+        :type readJobs: callable
+
+        :returns events: the log events sent to subscribers so far
+        :rtype: list of dict
+        """
+        if self.doc is None:
+            return []
+
+        if self.logCount:
+            return joblogs.read_events(
+                readJobs, self.uuid, self.head, 0, self.logCount
+            )
+
+        return self.doc.get("events", [])
+
+    def unsubscribe(self, queue):
+        self.subscribers.discard(queue)
+
+    def progress(self, doc):
+        return dict(
+            completeness=doc.get("completeness"),
+            result=doc.get("resultCode")
+        )
+
+    def update(self, doc, newEvents=None):
+        """
+        compare a freshly read job document with the last one, and send
+        any changes
+
+        :param newEvents: events added to the job's chunked log since the
+            last update, if it has one
+        :type newEvents: list of dict
+
+        :returns finished: True if the job is finished or doesn't exist
+        """
+        if doc is None:
+            self.send(NOT_FOUND, dict(uuid=self.uuid))
+            return True
+
+        old = self.doc or {}
+        self.doc = doc
+
+        if newEvents:
+            self.send(LOG, newEvents)
+        else:
+            oldEvents = old.get("events", [])
+            events = doc.get("events", [])
+            if len(events) > len(oldEvents):
+                self.send(LOG, events[len(oldEvents):])
+
+        if doc.get("resultCode") is not None:
+            self.send(RESULT, self.progress(doc))
+            return True
+
+        if doc.get("completeness") != old.get("completeness"):
+            self.send(PROGRESS, self.progress(doc))
+
+        return False
+
+    def send(self, event, data):
+        for queue in self.subscribers:
+            queue.put_nowait((event, data))
+
+
+class JobWatchers(object):
+    """
+    All the job watchers for a server. Polls while any job is watched.
+    """
+    def __init__(self, readJobs, interval=1.0):
+        """
+        :param readJobs: function that bulk reads job documents, like
+            :code:`spacewalk.Server.read_jobs`
+        :type readJobs: callable
+
+        :param interval: seconds between polls
+        :type interval: float
+        """
+        self.readJobs = readJobs
+        self.interval = interval
+        self.watchers = {}
+        self.polling = False
+
+    def subscribe(self, uuid):
+        """
+        Start receiving a job's progress.
+
+        :param uuid: job's uuid
+        :type uuid: str
+
+        :returns queue: queue that receives :code:`(event, data)` tuples
+        :rtype: asyncio.Queue
+        """
+        watcher = self.watchers.get(uuid)
+        if watcher is None:
+            watcher = self.watchers[uuid] = JobWatcher(uuid)
+
+        queue = watcher.subscribe(watcher.history(self.readJobs))
+
+        if not self.polling:
+            self.polling = True
+            IOLoop.current().spawn_callback(self.poll)
+
+        return queue
+
+    def unsubscribe(self, uuid, queue):
+        watcher = self.watchers.get(uuid)
+        if watcher is None:
+            return
+
+        watcher.unsubscribe(queue)
+        if not watcher.subscribers:
+            del self.watchers[uuid]
+
+    def poll_once(self):
+        uuids = list(self.watchers)
+        docs = self.readJobs(
+            uuids + [joblogs.head_key(uuid) for uuid in uuids]
+        )
+
+        for uuid in uuids:
+            watcher = self.watchers.get(uuid)
+            if watcher is None:
+                continue
+
+            head = docs.get(joblogs.head_key(uuid))
+            newEvents = None
+            if head is not None and head['count'] > watcher.logCount:
+                newEvents = joblogs.read_events(
+                    self.readJobs, uuid, head, watcher.logCount, head['count']
+                )
+                watcher.head = head
+                watcher.logCount = head['count']
+
+            if watcher.update(docs.get(uuid), newEvents):
+                # finished jobs don't change, so stop watching them
+                del self.watchers[uuid]
+
+    async def poll(self):
+        try:
+            while self.watchers:
+                try:
+                    self.poll_once()
+                except Exception:
+                    log.exception("error polling watched jobs")
+
+                await asyncio.sleep(self.interval)
+        finally:
+            self.polling = False
@@ -0,0 +1,682 @@
+#!/usr/bin/env python
+# encoding: utf-8
+# Copyright (c) 2021 MotiveMetrics. All rights reserved.
+"""
+Job worker that runs a Spacewalk tree's leaf jobs in a pool of processes.
+
+One parent process reserves jobs from the tree's queues, most urgent job
+first, and hands their uuids to the pool, keeping the number of running
+jobs under each branch or leaf within its configured concurrency. Pool
+processes load, run, and record the jobs with their own datastore and queue
+connections. Jobs with an async run() are run concurrently on an event loop
+in a thread of the parent process instead. The parent collects the jobs'
+run metrics, and serves them if it's given a metrics port.
+
+    $ python -m spacewalk.worker example:BaseExampleJob myService \\
+        --datastore example:make_datastore --queue example:make_queue \\
+        --processes 8 --concurrency /examples/waste_time=2 \\
+        --metrics-port 9100
+"""
+import argparse
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import importlib
+import multiprocessing
+import signal
+import threading
+import time
+
+from spacewalk.jobs import is_async, message_uuid, queue_name, run_blocking
+from spacewalk import metrics
+from spacewalk.snapshot import cached_structure
+from spacewalk.structure import auto_tree, Structure
+
+import logging
+log = logging.getLogger(__name__)
+
+# seconds to wait for a job from the queue before checking on running jobs
+RESERVE_TIMEOUT = 1
+
+# seconds before a job that was over its concurrency limit is retried
+RETRY_DELAY = 1
+
+# seconds that running jobs are given to finish on shutdown before they're
+# requeued
+SHUTDOWN_TIMEOUT = 30
+
+# seconds before a job whose run couldn't be recorded is retried
+FAILED_RETRY_DELAY = 60
+
+# seconds between touches of running jobs' reservations, which keep
+# beanstalkd from handing them to another worker once their time-to-run
+# is up. Must be less than the queue's time-to-run.
+TOUCH_INTERVAL = 10
+
+# seconds between checks on running jobs when every pool process is busy,
+# or between polls of the queues when they're all empty
+POLL_INTERVAL = 0.05
+
+# beanstalkd's default priority, for ordering queues with no PRIORITY
+DEFAULT_PRIORITY = 2 ** 31
+
+# most async jobs that run at once on the event loop
+ASYNC_CONCURRENCY = 100
+
+# set in each pool process by init_process
+_datastore = None
+_makeQueue = None
+_serviceName = None
+_queues = {}
+_classes = None
+
+
+def init_process(makeDatastore, makeQueue, serviceName, classes):
+    global _datastore, _makeQueue, _serviceName, _classes
+
+    # the parent handles shutdown, and terminates the pool when it's done
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+
+    _datastore = makeDatastore()
+    _makeQueue = makeQueue
+    _serviceName = serviceName
+    _classes = classes
+
+
+def process_queue(cls):
+    queueName = queue_name(_serviceName, cls)
+    if queueName not in _queues:
+        _queues[queueName] = _makeQueue(queueName)
+
+    return _queues[queueName]
+
+
+def run_job(uuid):
+    """
+    load, run, and record the result of a job in a pool process
+
+    :returns resultCode, jobSeconds: the job's result code, and the job
+        duration metrics recorded in this process since the last job, for
+        the parent process to serve
+    :rtype: tuple
+    """
+    doc = _datastore.get(uuid)
+    cls = _classes[doc['jobType']]
+    job = cls(_datastore, process_queue(cls), **doc)
+
+    try:
+        resultCode, result = job.run()
+    except Exception:
+        log.exception("job %s failed" % uuid)
+        resultCode, result = 500, None
+
+    job.record_result(resultCode, result)
+    return resultCode, metrics.JOB_SECONDS.drain()
+
+
+def pool_result(future):
+    """
+    collect the metrics of a pool job that has finished
+
+    :returns resultCode: the job's result code
+    :rtype: int
+
+    :raises: the job's exception, if it failed
+    """
+    resultCode, jobSeconds = future.result()
+    metrics.JOB_SECONDS.merge(jobSeconds)
+    return resultCode
+
+
+class AsyncRunner(object):
+    """
+    Runs jobs with an async run() concurrently on an event loop in its own
+    thread. Their blocking datastore calls are made in the loop's default
+    executor.
+    """
+    def __init__(self, makeDatastore, makeQueue, serviceName, classes):
+        self.makeDatastore = makeDatastore
+        self.makeQueue = makeQueue
+        self.serviceName = serviceName
+        self.classes = classes
+        self.queues = {}
+        self.datastore = None
+        self.loop = None
+        self.thread = None
+
+    def start(self):
+        self.datastore = self.makeDatastore()
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(
+            target=self.loop.run_forever, name="async-jobs", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+
+    def submit(self, uuid):
+        """
+        :returns future: the job's result code, once it has run
+        :rtype: concurrent.futures.Future
+        """
+        return asyncio.run_coroutine_threadsafe(self.run_job(uuid), self.loop)
+
+    def get_queue(self, cls):
+        queueName = queue_name(self.serviceName, cls)
+        if queueName not in self.queues:
+            self.queues[queueName] = self.makeQueue(queueName)
+
+        return self.queues[queueName]
+
+    async def run_job(self, uuid):
+        doc = await run_blocking(self.datastore.get, uuid)
+        cls = self.classes[doc['jobType']]
+        job = cls(self.datastore, self.get_queue(cls), **doc)
+
+        try:
+            resultCode, result = await job.run()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            log.exception("job %s failed" % uuid)
+            resultCode, result = 500, None
+
+        await job.record_result_async(resultCode, result)
+        return resultCode
+
+
+class Worker(object):
+    """
+    Runs the leaf jobs of a Spacewalk tree in a process pool, and those with
+    an async run() on an event loop
+    """
+    def __init__(
+        self,
+        rootcls,
+        name,
+        makeDatastore,
+        makeQueue,
+        processes=None,
+        asyncConcurrency=ASYNC_CONCURRENCY,
+        concurrency=None,
+        queueNames=None,
+        reserveTimeout=RESERVE_TIMEOUT,
+        shutdownTimeout=SHUTDOWN_TIMEOUT,
+        metricsPort=None,
+        snapshotFile=None
+    ):
+        """
+        :param rootcls: root job class of the tree
+        :type rootcls: :code:`spacewalk.BaseJob` subclass
+
+        :param name: name of the service, which names its queues
+        :type name: str
+
+        :param makeDatastore: function that makes a datastore
+        :type makeDatastore: callable
+
+        :param makeQueue: function that makes a queue from a queue name
+        :type makeQueue: callable
+
+        :param processes: number of pool processes. Defaults to the number
+            of CPUs.
+        :type processes: int
+
+        :param asyncConcurrency: most async jobs that run at once on the
+            event loop
+        :type asyncConcurrency: int
+
+        :param concurrency: most jobs that may run at once under each
+            branch or leaf path. Paths that aren't listed aren't limited,
+            other than by the number of processes.
+        :type concurrency: dict
+
+        :param queueNames: names of the queues to take jobs from. Defaults
+            to all the queues of the tree's leaves, so a separate worker can
+            be dedicated to the queues of latency-sensitive leaves.
+        :type queueNames: list of str
+
+        :param reserveTimeout: seconds to wait for a job from the queue
+        :type reserveTimeout: float
+
+        :param shutdownTimeout: seconds that running jobs are given to
+            finish on shutdown before they're requeued
+        :type shutdownTimeout: float
+
+        :param metricsPort: port to serve the worker's job metrics on, in
+            the Prometheus text format, or None to not serve them
+        :type metricsPort: int
+
+        :param snapshotFile: structure snapshot file to load the tree
+            from, or to save it to if the snapshot is missing or stale, as
+            :code:`spacewalk.cached_structure` does. The worker's tree has
+            no base path, so it can share the snapshot of a server whose
+            tree has none either.
+        :type snapshotFile: str
+        """
+        if snapshotFile is None:
+            self.structure = Structure(auto_tree(rootcls, ""))
+        else:
+            self.structure = cached_structure(rootcls, "", snapshotFile)
+        self.classes = {
+            leaf.cls.JOB_TYPE: leaf.cls
+            for leaf in self.structure.get_leaf_targets()
+        }
+        self.name = name
+        self.makeDatastore = makeDatastore
+        self.makeQueue = makeQueue
+        self.processes = processes or multiprocessing.cpu_count()
+        self.asyncConcurrency = asyncConcurrency
+        self.asyncTypes = {
+            jobType for jobType, cls in self.classes.items() if is_async(cls)
+        }
+        self.reserveTimeout = reserveTimeout
+        self.shutdownTimeout = shutdownTimeout
+        self.metricsPort = metricsPort
+        self.metricsServer = None
+
+        self.limits = dict(concurrency or {})
+        for path in self.limits:
+            if self.structure.get_target(path) is None:
+                raise ValueError("no branch or leaf at %s" % path)
+
+        self.limitedPaths = {
+            leaf.cls.JOB_TYPE: self.limited_paths(leaf.path)
+            for leaf in self.structure.get_leaf_targets()
+        }
+        self.counts = {path: 0 for path in self.limits}
+
+        # most urgent queues first
+        priorities = {}
+        for cls in self.classes.values():
+            queueName = queue_name(name, cls)
+            priority = cls.PRIORITY
+            if priority is None:
+                priority = DEFAULT_PRIORITY
+
+            priorities[queueName] = min(
+                priority, priorities.get(queueName, priority)
+            )
+
+        if queueNames is None:
+            queueNames = priorities
+
+        self.queueNames = sorted(
+            queueNames,
+            key=lambda queueName: priorities.get(queueName, DEFAULT_PRIORITY)
+        )
+
+        self.datastore = None
+        self.queues = {}
+        self.reserver = None
+        self.pool = None
+        self.asyncRunner = None
+        self.running = {}
+        self.stopping = False
+        self.lastTouch = time.monotonic()
+
+        # number of running jobs in the pool, and on the event loop
+        self.numRunning = {False: 0, True: 0}
+        self.capacity = {False: self.processes, True: asyncConcurrency}
+
+    def limited_paths(self, leafPath):
+        """
+        :returns paths: the limited paths that a leaf's jobs count against,
+            which are the leaf's own path and those of its branches
+        :rtype: list of str
+        """
+        return [
+            path for path in self.limits
+            if leafPath == path or leafPath.startswith(path + "/")
+        ]
+
+    def can_start(self, jobType):
+        isAsync = jobType in self.asyncTypes
+        return self.numRunning[isAsync] < self.capacity[isAsync] and all(
+            self.counts[path] < self.limits[path]
+            for path in self.limitedPaths[jobType]
+        )
+
+    def has_capacity(self):
+        return self.numRunning[False] < self.capacity[False] or (
+            bool(self.asyncTypes) and
+            self.numRunning[True] < self.capacity[True]
+        )
+
+    def start(self):
+        """
+        Run jobs until SIGTERM or SIGINT, then shut down gracefully.
+        """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.datastore = self.makeDatastore()
+        self.queues = {
+            queueName: self.makeQueue(queueName)
+            for queueName in self.queueNames
+        }
+        if len(self.queueNames) > 1:
+            self.reserver = self.watch_queues()
+
+        self.pool = self.make_pool()
+        if self.metricsPort is not None:
+            self.metricsServer = metrics.start_http_server(self.metricsPort)
+
+        if self.asyncTypes:
+            self.asyncRunner = AsyncRunner(
+                self.makeDatastore, self.makeQueue, self.name, self.classes
+            )
+            self.asyncRunner.start()
+
+        log.info(
+            "worker running %d job types from %s in %d processes, and %d "
+            "async job types" % (
+                len(self.classes) - len(self.asyncTypes),
+                ", ".join(self.queueNames),
+                self.processes,
+                len(self.asyncTypes)
+            )
+        )
+
+        while not self.stopping:
+            self.reap()
+            self.touch()
+
+            if not self.has_capacity():
+                time.sleep(POLL_INTERVAL)
+                continue
+
+            reserved = self.reserve()
+            if reserved is not None:
+                self.dispatch(*reserved)
+
+        self.shutdown()
+
+    def make_pool(self):
+        """
+        :returns pool: a new pool of processes to run jobs in. If one of
+            its processes dies, the futures of all its jobs fail with
+            :code:`BrokenProcessPool`, and it can't run any more jobs.
+        :rtype: :code:`concurrent.futures.ProcessPoolExecutor`
+        """
+        return ProcessPoolExecutor(
+            self.processes,
+            initializer=init_process,
+            initargs=(
+                self.makeDatastore, self.makeQueue, self.name, self.classes
+            )
+        )
+
+    def watch_queues(self):
+        """
+        Make a queue connection that watches all the worker's queues, if
+        the queues have a :code:`watch(queueName)` method, like beanstalkd
+        tubes. beanstalkd then hands out the most urgent job of any of
+        them, by the priority it was put with.
+
+        :returns reserver: the connection, or None if the queues can't
+            watch more than one queue, and have to be polled
+        """
+        reserver = self.makeQueue(self.queueNames[0])
+        watch = getattr(reserver, "watch", None)
+        if watch is None:
+            log.warning("queues can't watch several queues at once, so "
+                        "the worker will poll them")
+            return None
+
+        for queueName in self.queueNames[1:]:
+            watch(queueName)
+
+        return reserver
+
+    def reserve(self):
+        """
+        :returns queue, queueJob: the most urgent job, and the queue
+            connection that reserved it, which must delete, release or
+            touch it, or None if there are no jobs
+        :rtype: tuple
+        """
+        queue = self.reserver
+        if queue is None and len(self.queueNames) == 1:
+            queue = self.queues[self.queueNames[0]]
+
+        if queue is not None:
+            queueJob = queue.reserve(timeout=self.reserveTimeout)
+            return None if queueJob is None else (queue, queueJob)
+
+        # poll the queues, most urgent first
+        for queueName in self.queueNames:
+            queue = self.queues[queueName]
+            queueJob = queue.reserve(timeout=0)
+            if queueJob is not None:
+                return queue, queueJob
+
+        time.sleep(POLL_INTERVAL)
+        return None
+
+    def stop(self, *args):
+        self.stopping = True
+
+    def dispatch(self, queue, queueJob):
+        uuid = message_uuid(queueJob.body)
+        doc = self.datastore.get(uuid)
+
+        if doc is None:
+            log.warning("deleting queued job %s with no document" % uuid)
+            queue.delete(queueJob)
+            return
+
+        jobType = doc['jobType']
+        if jobType not in self.classes:
+            log.warning("releasing job %s of unknown type %s" %
+                        (uuid, jobType))
+            queue.release(queueJob, delay=RETRY_DELAY)
+            return
+
+        if not self.can_start(jobType):
+            queue.release(
+                queueJob,
+                delay=RETRY_DELAY,
+                **self.release_kwargs(jobType)
+            )
+            return
+
+        isAsync = jobType in self.asyncTypes
+        self.numRunning[isAsync] += 1
+        for path in self.limitedPaths[jobType]:
+            self.counts[path] += 1
+
+        if isAsync:
+            future = self.asyncRunner.submit(uuid)
+        else:
+            future = self.pool.submit(run_job, uuid)
+
+        self.running[queueJob.id] = (queue, queueJob, jobType, future)
+
+    def release_kwargs(self, jobType):
+        # beanstalkd resets a released job's priority unless it's given
+        priority = self.classes[jobType].PRIORITY
+        return {} if priority is None else dict(priority=priority)
+
+    def reap(self):
+        """
+        Delete finished jobs from the queue, release those whose run
+        couldn't be recorded, and free their concurrency. If a pool
+        process died, which fails all the pool's running jobs, the jobs are
+        released and the pool is replaced.
+        """
+        broken = False
+        for queueJobId, (queue, queueJob, jobType, future) in list(
+            self.running.items()
+        ):
+            if not future.done():
+                continue
+
+            # record_result or loading the job failed, or its process died,
+            # so the job has no result yet, and is retried later
+            error = future.exception()
+            if error is None:
+                if jobType not in self.asyncTypes:
+                    pool_result(future)
+
+                queue.delete(queueJob)
+            else:
+                broken = broken or isinstance(error, BrokenProcessPool)
+                log.error("job %s was not recorded, retrying in %ds: %r" %
+                          (queueJobId, FAILED_RETRY_DELAY, error))
+                queue.release(
+                    queueJob,
+                    delay=FAILED_RETRY_DELAY,
+                    **self.release_kwargs(jobType)
+                )
+
+            self.finish(queueJobId)
+
+        if broken and not self.stopping:
+            log.error("a pool process died, so the pool is replaced")
+            self.pool.shutdown(wait=False)
+            self.pool = self.make_pool()
+
+    def touch(self):
+        """
+        Touch the reservations of running jobs every
+        :code:`TOUCH_INTERVAL` seconds, so they outlast the queue's
+        time-to-run
+        """
+        now = time.monotonic()
+        if now - self.lastTouch < TOUCH_INTERVAL:
+            return
+
+        self.lastTouch = now
+        for queue, queueJob, jobType, future in self.running.values():
+            if not future.done():
+                queue.touch(queueJob)
+
+    def finish(self, queueJobId):
+        queue, queueJob, jobType, future = self.running.pop(queueJobId)
+        self.numRunning[jobType in self.asyncTypes] -= 1
+        for path in self.limitedPaths[jobType]:
+            self.counts[path] -= 1
+
+    def shutdown(self):
+        """
+        Give running jobs :code:`shutdownTimeout` seconds to finish, then
+        requeue the rest and stop the pool.
+        """
+        log.info("worker shutting down with %d running jobs" %
+                 len(self.running))
+        self.pool.shutdown(wait=False)
+
+        deadline = time.time() + self.shutdownTimeout
+        self.reap()
+        while self.running and time.time() < deadline:
+            time.sleep(POLL_INTERVAL)
+            self.reap()
+            self.touch()
+
+        for queueJobId in list(self.running):
+            log.info("requeueing job %s" % queueJobId)
+            queue, queueJob, jobType, future = self.running[queueJobId]
+            if jobType in self.asyncTypes:
+                future.cancel()
+
+            queue.release(queueJob, **self.release_kwargs(jobType))
+            self.finish(queueJobId)
+
+        terminate_pool(self.pool)
+        if self.asyncRunner is not None:
+            self.asyncRunner.stop()
+        if self.metricsServer is not None:
+            self.metricsServer.shutdown()
+
+
+def terminate_pool(pool):
+    """
+    Kill the processes of a pool that has been shut down, with the jobs
+    they're still running, and wait for them to exit
+    """
+    # Python 3.14 has its own call for this
+    terminateWorkers = getattr(pool, "terminate_workers", None)
+    if terminateWorkers is not None:
+        return terminateWorkers()
+
+    processes = list((pool._processes or {}).values())
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        process.join()
+
+
+def load_object(spec):
+    """
+    :param spec: object as :code:`module:name`
+    :type spec: str
+    """
+    moduleName, _, name = spec.partition(":")
+    return getattr(importlib.import_module(moduleName), name)
+
+
+def parse_concurrency(values):
+    concurrency = {}
+    for value in values:
+        path, _, limit = value.rpartition("=")
+        concurrency[path] = int(limit)
+
+    return concurrency
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("root", help="root job class as module:ClassName")
+    parser.add_argument("name", help="service name, which names its queue")
+    parser.add_argument("--datastore", required=True,
+                        help="datastore factory as module:function")
+    parser.add_argument("--queue", required=True,
+                        help="queue factory as module:function")
+    parser.add_argument("--processes", type=int,
+                        help="pool processes. Defaults to the number of CPUs")
+    parser.add_argument("--queue-name", action="append",
+                        help="queue to take jobs from. May be repeated. "
+                             "Defaults to all the tree's queues")
+    parser.add_argument("--async-concurrency", type=int,
+                        default=ASYNC_CONCURRENCY,
+                        help="most async jobs that run at once")
+    parser.add_argument("--concurrency", action="append", default=[],
+                        help="most running jobs under a path, as path=N. "
+                             "May be repeated")
+    parser.add_argument("--shutdown-timeout", type=float,
+                        default=SHUTDOWN_TIMEOUT,
+                        help="seconds to let running jobs finish on "
+                             "shutdown before requeueing them")
+    parser.add_argument("--metrics-port", type=int,
+                        help="port to serve job metrics on for Prometheus")
+    parser.add_argument("--snapshot",
+                        help="structure snapshot file to load the tree "
+                             "from, or to save it to if it's stale")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    Worker(
+        load_object(args.root),
+        args.name,
+        load_object(args.datastore),
+        load_object(args.queue),
+        processes=args.processes,
+        asyncConcurrency=args.async_concurrency,
+        concurrency=parse_concurrency(args.concurrency),
+        queueNames=args.queue_name,
+        shutdownTimeout=args.shutdown_timeout,
+        metricsPort=args.metrics_port,
+        snapshotFile=args.snapshot
+    ).start()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+import os
+import pdb
+import pytest
+import time
+
+from spacewalk import blobs
+from . import classes
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = blobs.MmapFileStore(str(tmp_path))
+    monkeypatch.setattr(blobs, "_defaultStore", store)
+    return store
+
+
+def test_put_read(store):
+    size = store.put("job_table", [b"abc", b"defg"])
+
+    assert size == 7
+    assert list(store.read_chunks("job_table", chunkSize=3)) == [
+        b"abc", b"def", b"g"
+    ]
+
+
+def test_incomplete_store():
+    class PutOnlyStore(blobs.BlobStore):
+        def put(self, key, chunks):
+            return 0
+
+    with pytest.raises(TypeError):
+        PutOnlyStore()
+
+
+def test_put_replaces(store):
+    store.put("job_table", [b"first"])
+    store.put("job_table", [b"second"])
+
+    assert b"".join(store.read_chunks("job_table")) == b"second"
+    assert os.listdir(store.directory) == ["job_table"]
+
+
+def test_empty_blob(store):
+    store.put("job_table", [])
+
+    assert list(store.read_chunks("job_table")) == []
+
+
+def test_missing_blob(store):
+    with pytest.raises(KeyError):
+        store.open("nope")
+
+    with pytest.raises(KeyError):
+        list(store.read_chunks("nope"))
+
+    store.delete("nope")
+
+
+def test_delete(store):
+    store.put("job_table", [b"abc"])
+    store.delete("job_table")
+
+    with pytest.raises(KeyError):
+        list(store.read_chunks("job_table"))
+
+
+def test_open(store):
+    store.put("job_table", [b"abcdefg"])
+
+    with store.open("job_table", chunkSize=4) as reader:
+        assert list(reader) == [b"abcd", b"efg"]
+
+    assert reader.map.closed
+    assert reader.file.closed
+
+
+def test_sweep(store):
+    store.put("old", [b"abc"])
+    store.put("new", [b"abc"])
+    past = time.time() - 3600
+    os.utime(store.path("old"), (past, past))
+
+    assert store.sweep(60) == 1
+    assert os.listdir(store.directory) == ["new"]
+
+
+def test_invalid_key(store):
+    with pytest.raises(ValueError):
+        store.put("../job_table", [b"abc"])
+
+
+def test_store_blob(store, make_datastore, make_queue):
+    job = classes.BlobLeaf(make_datastore(), make_queue("testService"))
+    job.save()
+    job.run()
+
+    doc = job.datastore.get(job.uuid)
+    assert "table" not in doc
+    assert doc['blobs']['table']['key'].startswith(
+        "%s_table_" % job.uuid
+    )
+
+    job = classes.BlobLeaf(make_datastore(), make_queue("testService"), **doc)
+    assert job.load_blob("table") == [[i, str(i)] for i in range(100)]
+
+
+def test_store_blob_replaces(store, make_datastore, make_queue):
+    job = classes.BlobLeaf(make_datastore(), make_queue("testService"))
+    job.store_blob("table", [1])
+    job.store_blob("table", [2])
+
+    assert os.listdir(store.directory) == [job.blobs['table']['key']]
+    assert job.load_blob("table") == [2]
+
+
+def test_delete_blobs(store, make_datastore, make_queue):
+    job = classes.BlobLeaf(make_datastore(), make_queue("testService"))
+    job.store_blob("table", [1])
+    job.delete_blobs()
+
+    assert os.listdir(store.directory) == []
+    assert job.datastore.get(job.uuid)['blobs'] == {}
@@ -0,0 +1,223 @@
+import pdb
+import pytest
+import threading
+import time
+
+from spacewalk.buffering import WriteBehindDatastore
+from spacewalk.jobs import BaseJob
+
+
+class CountingDatastore(object):
+    def __init__(self, datastore=None):
+        self.wrapped = datastore
+        self.docs = {}
+        self.writes = 0
+
+    def set(self, key, value):
+        self.writes += 1
+        self.docs[key] = value
+        if self.wrapped is not None:
+            self.wrapped.set(key, value)
+
+    def get(self, key):
+        return self.docs.get(key)
+
+    def delete(self, key):
+        self.docs.pop(key, None)
+
+    def keys(self):
+        return list(self.docs)
+
+
+class ChattyRoot(BaseJob):
+    NAME = "chatty"
+    BRANCH_NAME = "chatty"
+    DESCRIPTION = "jobs that update themselves a lot"
+
+    BUFFER_WRITES = True
+    FLUSH_INTERVAL = 3600
+    FLUSH_SIZE = 50
+
+
+class ChattyLeaf(ChattyRoot):
+    NAME = "chatty leaf"
+    LEAF_NAME = "leaf"
+    DESCRIPTION = "job that adds to its completeness 100 times"
+
+    def run(self):
+        for _ in range(100):
+            self.add_to_completeness(0.01)
+
+        return 200, None
+
+
+class FailingLeaf(ChattyRoot):
+    NAME = "failing leaf"
+    LEAF_NAME = "failing"
+    DESCRIPTION = "job that fails after adding to its completeness"
+
+    def run(self):
+        self.add_to_completeness(0.5)
+        raise RuntimeError("failed")
+
+
+def test_coalesce():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=3600, size=100)
+
+    for i in range(10):
+        buffered.set("doc", i)
+
+    assert datastore.writes == 0
+    assert buffered.get("doc") == 9
+
+    buffered.flush()
+
+    assert datastore.writes == 1
+    assert datastore.get("doc") == 9
+
+
+def test_flush_size():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=3600, size=5)
+
+    for i in range(5):
+        buffered.set("doc", i)
+
+    assert datastore.writes == 1
+    assert buffered.pending == {}
+
+
+def test_flush_interval():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=0, size=100)
+
+    buffered.set("doc", 1)
+
+    assert datastore.writes == 1
+
+
+def test_flush_timer():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=0.05, size=100)
+
+    buffered.set("doc", 1)
+    assert datastore.writes == 0
+
+    deadline = time.monotonic() + 5
+    while datastore.writes == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert datastore.writes == 1
+    assert datastore.get("doc") == 1
+    assert buffered.timer is None
+
+
+def test_close_stops_timer():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=3600, size=100)
+
+    buffered.set("doc", 1)
+    timer = buffered.timer
+    buffered.close()
+
+    assert datastore.writes == 1
+    assert buffered.timer is None
+    assert timer.finished.is_set()
+
+
+def test_flush_before_other_calls():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=3600, size=100)
+
+    buffered.set("doc", 1)
+
+    assert buffered.keys() == ["doc"]
+    assert datastore.writes == 1
+
+
+def test_read_after_write():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=3600, size=100)
+    datastore.set("other", dict(n=0))
+
+    doc = dict(n=1)
+    buffered.set("doc", doc)
+    doc['n'] = 2
+
+    assert buffered.get("doc") == dict(n=1)
+    buffered.get("doc")['n'] = 3
+    assert buffered.get_multi(["doc", "other"]) == dict(
+        doc=dict(n=1), other=dict(n=0)
+    )
+
+    buffered.flush()
+    assert datastore.get("doc") == dict(n=1)
+
+
+def test_delete_after_write():
+    datastore = CountingDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=3600, size=100)
+    datastore.set("doc", 0)
+    datastore.writes = 0
+
+    buffered.set("doc", 1)
+    buffered.delete("doc")
+
+    assert buffered.get("doc") is None
+    buffered.flush()
+    assert datastore.writes == 0
+    assert datastore.get("doc") is None
+
+
+def test_read_during_flush():
+    flushing = threading.Event()
+    release = threading.Event()
+
+    class SlowDatastore(CountingDatastore):
+        def set(self, key, value):
+            flushing.set()
+            release.wait(5)
+            super().set(key, value)
+
+    datastore = SlowDatastore()
+    buffered = WriteBehindDatastore(datastore, interval=3600, size=100)
+    buffered.set("doc", 1)
+
+    flusher = threading.Thread(target=buffered.flush)
+    flusher.start()
+    flushing.wait(5)
+
+    reads = []
+    reader = threading.Thread(target=lambda: reads.append(buffered.get("doc")))
+    reader.start()
+    release.set()
+    flusher.join()
+    reader.join()
+
+    assert reads == [1]
+
+
+def test_buffered_job(make_datastore, make_queue):
+    datastore = CountingDatastore(make_datastore())
+    job = ChattyLeaf(datastore, make_queue("testService"))
+    job.save()
+    datastore.writes = 0
+
+    job.run()
+
+    assert job.datastore is datastore
+    assert datastore.writes <= 3
+    assert datastore.get(job.uuid)['completeness'] == pytest.approx(1.0)
+
+
+def test_buffered_job_flushes_on_error(make_datastore, make_queue):
+    datastore = CountingDatastore(make_datastore())
+    job = FailingLeaf(datastore, make_queue("testService"))
+    job.save()
+
+    with pytest.raises(RuntimeError):
+        job.run()
+
+    assert job.datastore is datastore
+    assert datastore.get(job.uuid)['completeness'] == 0.5
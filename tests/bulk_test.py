@@ -0,0 +1,140 @@
+import pdb
+import pytest
+import zerog
+
+import spacewalk
+from spacewalk import bulk
+from spacewalk.jobs import queue_message
+from . import classes
+
+
+class Datastore(object):
+    def __init__(self):
+        self.docs = {}
+
+    def set(self, key, value):
+        self.docs[key] = value
+
+    def get(self, key):
+        return self.docs.get(key)
+
+
+class Queue(object):
+    def __init__(self):
+        self.messages = []
+
+    def put(self, message, **kwargs):
+        self.messages.append((message, kwargs))
+
+
+def test_split():
+    assert bulk.split([1, 2, 3, 4, 5], 2) == [[1, 2, 3], [4, 5]]
+    assert bulk.split([1, 2], 4) == [[1], [2]]
+    assert bulk.split([], 4) == []
+
+
+def test_bulk_datastore():
+    datastore = Datastore()
+    buffered = bulk.bulk_datastore(datastore)
+    docs = {"doc-%d" % i: i for i in range(100)}
+
+    buffered.set_multi(docs)
+
+    assert datastore.docs == docs
+    assert buffered.get("doc-5") == 5
+
+
+def test_bulk_datastore_get_multi():
+    datastore = Datastore()
+    datastore.docs = {"doc-%d" % i: i for i in range(100)}
+    keys = ["doc-%d" % i for i in range(0, 200, 2)]
+
+    docs = bulk.bulk_datastore(datastore).get_multi(keys)
+
+    assert docs == {key: datastore.docs.get(key) for key in keys}
+    assert docs["doc-150"] is None
+
+
+def test_bulk_datastore_own_calls():
+    class GetMultiDatastore(Datastore):
+        def get_multi(self, keys):
+            return {key: "multi" for key in keys}
+
+    wrapped = bulk.bulk_datastore(GetMultiDatastore())
+
+    assert isinstance(wrapped, bulk.BulkDatastore)
+    assert wrapped.get_multi(["a", "b"]) == dict(a="multi", b="multi")
+
+
+def test_bulk_datastore_unwrapped():
+    class MultiDatastore(Datastore):
+        def get_multi(self, keys):
+            return {key: self.docs.get(key) for key in keys}
+
+        def set_multi(self, docs):
+            self.docs.update(docs)
+
+    datastore = MultiDatastore()
+    assert bulk.bulk_datastore(datastore) is datastore
+
+
+def test_bulk_queue():
+    connections = []
+
+    def make_queue():
+        connections.append(Queue())
+        return connections[-1]
+
+    queue = Queue()
+    bulkQueue = bulk.bulk_queue(queue, make_queue)
+    messages = ["message-%d" % i for i in range(100)]
+
+    bulkQueue.put_multi(messages, priority=10)
+    bulkQueue.put_multi(messages[:1])
+
+    assert len(connections) == bulk.BULK_THREADS - 1
+    put = queue.messages + sum((q.messages for q in connections), [])
+    assert sorted(m for m, _ in put) == sorted(messages + messages[:1])
+    assert sum(kwargs == dict(priority=10) for _, kwargs in put) == 100
+    assert queue.messages[-1] == (messages[0], {})
+
+
+def test_bulk_queue_error():
+    class FailingQueue(Queue):
+        def put(self, message, **kwargs):
+            raise IOError("disconnected")
+
+    bulkQueue = bulk.BulkQueue(Queue(), FailingQueue)
+
+    with pytest.raises(IOError):
+        bulkQueue.put_multi(["a", "b", "c"])
+
+
+def test_server_enqueue_jobs(make_structure, make_datastore):
+    queues = []
+
+    def make_queue(queueName):
+        queues.append(Queue())
+        return queues[-1]
+
+    server = spacewalk.Server(
+        make_structure(classes.QueuedRoot, ""),
+        "testService",
+        make_datastore,
+        make_queue,
+        zerog.registry.find_subclasses(classes.QueuedRoot),
+        [],
+        recordMetrics=False
+    )
+    jobs = server.make_jobs(classes.InteractiveLeaf, [{}] * 20)
+
+    put = sum((q.messages for q in queues[1:]), [])
+    assert sorted(message for message, _ in put) == sorted(
+        queue_message(job.uuid) for job in jobs
+    )
+    assert all(
+        putKwargs == jobs[0].queueKwargs for _, putKwargs in put
+    )
+    assert jobs[0].queueKwargs['priority'] == (
+        classes.InteractiveLeaf.PRIORITY
+    )
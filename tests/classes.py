@@ -1,6 +1,8 @@
+import asyncio
 from marshmallow import Schema, fields
 import time
 
+from spacewalk import joblogs
 from spacewalk.jobs import BaseJob
 
 
@@ -56,6 +58,7 @@ class DevLeaf1(DevBranch):
     NAME = "fake run"
     LEAF_NAME = "fake-run"
     DESCRIPTION = "job that pretends to run & updates completeness"
+    LOG_CHUNK_SIZE = joblogs.LOG_CHUNK_SIZE
 
     # worker doesn't seem to be running in the test environment -- need
     # to figure that out
@@ -72,6 +75,21 @@ class DevLeaf2(DevBranch):
     DESCRIPTION = "job that needs more testing"
 
 
+class DeterministicLeaf(DevBranch):
+    NAME = "deterministic"
+    LEAF_NAME = "deterministic"
+    DESCRIPTION = "job whose result only depends on its params"
+
+    DETERMINISTIC = True
+
+    class Params(Schema):
+        n = fields.Integer(missing=10)
+        label = fields.String()
+
+    def run(self):
+        return 200, None
+
+
 class ExpLeaf1(DevExpBranch):
     NAME = "new thing"
     LEAF_NAME = "new-thing"
@@ -90,9 +108,91 @@ class EmptyBranch(ProdBranch):
     DESCRIPTION = "branch with no leaves in it"
 
 
+class QueuedRoot(BaseJob):
+    NAME = "queued"
+    BRANCH_NAME = "queued"
+    DESCRIPTION = "jobs with their own queues"
+
+
+class BatchLeaf(QueuedRoot):
+    NAME = "batch"
+    LEAF_NAME = "batch"
+    DESCRIPTION = "slow batch job"
+    QUEUE = "batch"
+    PRIORITY = 1000
+
+
+class InteractiveLeaf(QueuedRoot):
+    NAME = "interactive"
+    LEAF_NAME = "interactive"
+    DESCRIPTION = "fast interactive job"
+    QUEUE = "interactive"
+    PRIORITY = 10
+
+
+class DefaultLeaf(QueuedRoot):
+    NAME = "default"
+    LEAF_NAME = "default"
+    DESCRIPTION = "job in the default queue"
+
+
+class AsyncLeaf(QueuedRoot):
+    NAME = "async"
+    LEAF_NAME = "async"
+    DESCRIPTION = "job that waits on I/O"
+
+    async def run(self):
+        await asyncio.sleep(0)
+        await self.add_to_completeness_async(0.5)
+        return 200, None
+
+
+
+class StreamedLeaf(QueuedRoot):
+    NAME = "streamed"
+    LEAF_NAME = "streamed"
+    DESCRIPTION = "job with a large streamed output"
+    STREAM_FIELD = "rows"
+    STREAM_CHUNK_SIZE = 10
+
+    def run(self):
+        self.append_output([dict(row=i) for i in range(25)])
+        return 200, None
+
+    def get_data(self):
+        data = super().get_data()
+        data['name'] = "streamed"
+        return data
+
+
+class BlobLeaf(QueuedRoot):
+    NAME = "blob"
+    LEAF_NAME = "blob"
+    DESCRIPTION = "job with a large result kept in a blob"
+
+    def run(self):
+        self.store_blob("table", [[i, str(i)] for i in range(100)])
+        return 200, None
+
+
+
+class ReservedRoot(BaseJob):
+    NAME = "reserved"
+    BRANCH_NAME = "reserved"
+    DESCRIPTION = "jobs named like the job endpoints"
+
+
+class DataLeaf(ReservedRoot):
+    NAME = "data"
+    LEAF_NAME = "data"
+    DESCRIPTION = "leaf named like the data endpoint"
+
+
+
 BRANCH_CLASSES = [Root, ProdBranch, DevBranch, DevExpBranch, EmptyBranch]
 LEAF_CLASSES = [
-    ProdLeaf1, ProdLeaf2, ProdLeaf3, DevLeaf1, DevLeaf2, ExpLeaf1, ExpLeaf2
+    ProdLeaf1, ProdLeaf2, ProdLeaf3, DevLeaf1, DevLeaf2, DeterministicLeaf,
+    ExpLeaf1, ExpLeaf2
 ]
 
 EXPECTED_ROOT_BRANCH_COUNT = 2
@@ -108,6 +208,7 @@ EXPECTED_MAPPINGS = {
     "/root/prod/super-useful": ProdLeaf3,
     "/root/dev/fake-run": DevLeaf1,
     "/root/dev/needs-testing": DevLeaf2,
+    "/root/dev/deterministic": DeterministicLeaf,
     "/root/dev/exp/new-thing": ExpLeaf1,
     "/root/dev/exp/crazy": ExpLeaf2,
     "/root/prod/empty-branch": EmptyBranch
@@ -137,6 +238,11 @@ PARAMS_PROPERTY = "thingum"
 JOB_THAT_RUNS = DevLeaf1
 JOB_THAT_RUNS_PATH = "/root/dev/fake-run"
 
+QUEUED_PATH = "/queued"
+STREAMED_PATH = "/queued/streamed"
+
+DETERMINISTIC_LEAF_PATH = "/root/dev/deterministic"
+
 EXPECTED_ROOT_SUB_BRANCH_CLASSES = [ProdBranch, DevBranch]
 EXPECTED_PROD_LEAF_CLASSES = [ProdLeaf1, ProdLeaf2, ProdLeaf3]
 EXPECTED_DEV_SUB_BRANCH_CLASSES = [DevExpBranch]
@@ -0,0 +1,62 @@
+import pdb
+import pytest
+
+from spacewalk import formats
+
+
+def test_parse_accept():
+    accepted = formats.parse_accept(
+        "text/html;q=0.5, application/json; indent=4, */*;q=0.1, image/png;q=0"
+    )
+
+    assert accepted == [
+        ("application/json", {"indent": "4"}),
+        ("text/html", {}),
+        ("*/*", {})
+    ]
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, formats.PRETTY),
+    ("*/*", formats.PRETTY),
+    ("image/png", formats.PRETTY),
+    ("application/json", formats.COMPACT),
+    ("application/json; indent=4", formats.PRETTY),
+    ("application/msgpack", formats.MSGPACK),
+    ("application/x-msgpack, application/json", formats.MSGPACK),
+    ("application/msgpack;q=0.5, application/json", formats.COMPACT),
+    ("*/*, application/json", formats.PRETTY)
+])
+def test_negotiate(header, expected):
+    assert formats.negotiate(header) == expected
+
+
+def test_negotiate_without_msgpack(monkeypatch):
+    monkeypatch.setattr(formats, "msgpack", None)
+
+    assert formats.negotiate(
+        "application/msgpack, application/json;q=0.5"
+    ) == formats.COMPACT
+
+
+def test_body_format():
+    assert formats.body_format("application/msgpack") == formats.MSGPACK
+    assert formats.body_format("application/json") == formats.COMPACT
+    assert formats.body_format(None) == formats.COMPACT
+
+
+def test_json_codec():
+    codec = formats.JsonCodec()
+
+    assert codec.dumps(dict(a=[1, 2])) == '{"a":[1,2]}'
+    assert codec.dumps(dict(a=1), pretty=True) == '{\n    "a": 1\n}'
+    assert codec.loads(b'{"a": 1}') == dict(a=1)
+
+
+def test_msgpack_roundtrip():
+    obj = dict(a=[1, "two", None])
+
+    assert formats.msgpack_loads(formats.msgpack_dumps(obj)) == obj
+
+    with pytest.raises(ValueError):
+        formats.msgpack_loads(b"\xc1")
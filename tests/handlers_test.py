@@ -1,11 +1,16 @@
+import gzip
 import json
+import msgpack
 import pdb
 import pytest
+import uuid
 
+from tornado.httputil import HTTPServerRequest
 import zerog
 
 from spacewalk import handlers
 from spacewalk import server
+from spacewalk.profiling import PROFILE_PARAM
 
 from . import classes
 
@@ -18,43 +23,6 @@ def app(make_structure, make_datastore, make_queue):
     struct = make_structure(classes.Root, "")
     testHandlers = handlers.make_handlers(struct)
 
-    # add some 'bad' handlers to support the bad_branch and not_leaf tests
-    testHandlers.append(
-        (
-            "%s/%s" % ("/whatever", handlers.BRANCHES),
-            handlers.SubBranchesHandler
-        )
-    )
-    testHandlers.append(
-        (
-            "%s/%s" % ("/whatever", handlers.LEAVES),
-            handlers.LeavesHandler
-        )
-    )
-    testHandlers.append(
-        (
-            "%s/%s" % ("/whatever", handlers.POST_SCHEMA),
-            handlers.PostSchemaHandler
-        )
-    )
-    testHandlers.append(
-        (
-            "%s/%s" % ("/whatever", handlers.RUN_JOB),
-            handlers.RunJobHandler
-        )
-    )
-    testHandlers.append(
-        (
-            "%s/%s" % (classes.PROD_PATH, handlers.POST_SCHEMA),
-            handlers.PostSchemaHandler
-        )
-    )
-    testHandlers.append(
-        (
-            "%s/%s" % (classes.PROD_PATH, handlers.RUN_JOB),
-            handlers.RunJobHandler
-        )
-    )
     return server.Server(
         struct,
         "testService",
@@ -119,6 +87,102 @@ def test_post_schema_handler(app, http_client, base_url):
     )
 
 
+@pytest.mark.gen_test
+def test_leaves_handler_compact(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s?compact=true" % (base_url, classes.EXP_PATH, handlers.LEAVES)
+    )
+
+    assert response.code == 200
+    assert b"\n" not in response.body
+    infos = json.loads(response.body)
+    assert len(infos) == len(classes.EXPECTED_EXP_LEAF_CLASSES)
+
+
+@pytest.mark.gen_test
+def test_post_schema_handler_gzip(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" %
+        (base_url, classes.PARAMS_LEAF_PATH, handlers.POST_SCHEMA),
+        headers={"Accept-Encoding": "gzip"},
+        decompress_response=False
+    )
+
+    assert response.code == 200
+    assert response.headers['Content-Encoding'] == "gzip"
+    schema = json.loads(gzip.decompress(response.body))['postSchema']
+    assert classes.PARAMS_PROPERTY in (
+        schema['definitions']['Params']['properties']
+    )
+
+
+@pytest.mark.gen_test
+def test_leaves_handler_negotiated(app, http_client, base_url):
+    url = "%s%s/%s" % (base_url, classes.EXP_PATH, handlers.LEAVES)
+
+    response = yield http_client.fetch(url)
+    pretty = response.body
+    assert b"\n" in pretty
+
+    response = yield http_client.fetch(
+        url, headers={"Accept": "application/json"}
+    )
+    assert b"\n" not in response.body
+    assert json.loads(response.body) == json.loads(pretty)
+
+    response = yield http_client.fetch(
+        url, headers={"Accept": "application/msgpack"}
+    )
+    assert response.headers['Content-Type'] == "application/msgpack"
+    assert msgpack.unpackb(response.body) == json.loads(pretty)
+
+
+@pytest.mark.gen_test
+def test_leaves_handler_etag(app, http_client, base_url):
+    url = "%s%s/%s" % (base_url, classes.EXP_PATH, handlers.LEAVES)
+
+    response = yield http_client.fetch(url)
+    etag = response.headers['Etag']
+
+    response = yield http_client.fetch(
+        url, headers={"If-None-Match": etag}, raise_error=False
+    )
+    assert response.code == 304
+    assert response.body == b""
+
+    response = yield http_client.fetch(
+        url,
+        headers={"If-None-Match": etag, "Accept": "application/json"}
+    )
+    assert response.code == 200
+    assert response.headers['Etag'] != etag
+
+
+@pytest.mark.gen_test
+def test_run_job_msgpack(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=msgpack.packb({}),
+        headers={
+            "Content-Type": "application/msgpack",
+            "Accept": "application/msgpack"
+        }
+    )
+
+    assert response.code == 201
+    assert "uuid" in msgpack.unpackb(response.body)
+
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=b"\xc1",
+        headers={"Content-Type": "application/msgpack"},
+        raise_error=False
+    )
+    assert response.code == 400
+
+
 @pytest.mark.gen_test
 def test_run_job_handler(app, http_client, base_url):
     response = yield http_client.fetch(
@@ -131,6 +195,192 @@ def test_run_job_handler(app, http_client, base_url):
     assert "uuid" in json.loads(response.body)
 
 
+@pytest.mark.gen_test
+def test_run_job_internal_fields(app, http_client, base_url):
+    forged = dict(
+        uuid="forged-uuid",
+        blobs={"table": dict(key="another-jobs-blob", size=1)}
+    )
+
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps(forged)
+    )
+    uuid = json.loads(response.body)['uuid']
+
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOBS),
+        method="POST",
+        body=json.dumps([forged])
+    )
+    uuids = [uuid, json.loads(response.body)['jobs'][0]['uuid']]
+
+    assert "forged-uuid" not in uuids
+    for doc in app.read_jobs(uuids).values():
+        assert not doc.get("blobs")
+
+
+@pytest.mark.gen_test
+def test_run_job_idempotency_key(app, http_client, base_url):
+    url = "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOB)
+    # the test datastore persists between runs, so make unique keys
+    key1, key2 = str(uuid.uuid4()), str(uuid.uuid4())
+    uuids = []
+
+    for key in [key1, key1, key2]:
+        response = yield http_client.fetch(
+            url,
+            method="POST",
+            body=json.dumps({}),
+            headers={"Idempotency-Key": key}
+        )
+        assert response.code == 201
+        uuids.append(json.loads(response.body)['uuid'])
+
+    assert uuids[0] == uuids[1]
+    assert uuids[0] != uuids[2]
+
+
+@pytest.mark.gen_test
+def test_run_job_idempotency_key_params(app, http_client, base_url):
+    url = "%s%s/%s" % (
+        base_url, classes.DETERMINISTIC_LEAF_PATH, handlers.RUN_JOB
+    )
+    headers = {"Idempotency-Key": str(uuid.uuid4())}
+    label = str(uuid.uuid4())
+
+    response = yield http_client.fetch(
+        url, method="POST", body=json.dumps(dict(label=label)),
+        headers=headers
+    )
+    assert response.code == 201
+    jobUuid = json.loads(response.body)['uuid']
+
+    # the same params, normalized, are a replay
+    response = yield http_client.fetch(
+        url, method="POST", body=json.dumps(dict(label=label, n=10)),
+        headers=headers
+    )
+    assert response.code == 201
+    assert response.headers['Idempotent-Replayed'] == "true"
+    assert json.loads(response.body)['uuid'] == jobUuid
+
+    response = yield http_client.fetch(
+        url, method="POST", body=json.dumps(dict(label=label, n=11)),
+        headers=headers, raise_error=False
+    )
+    assert response.code == 422
+
+
+@pytest.mark.gen_test
+def test_run_job_deterministic(app, http_client, base_url):
+    url = "%s%s/%s" % (
+        base_url, classes.DETERMINISTIC_LEAF_PATH, handlers.RUN_JOB
+    )
+
+    # the test datastore persists between runs, so use a unique label
+    label = str(uuid.uuid4())
+    bodies = [
+        dict(label=label),
+        dict(label=label, n=10, notAParam="whatever"),
+        dict(label=label, n=11)
+    ]
+    uuids = []
+
+    for body in bodies:
+        response = yield http_client.fetch(
+            url, method="POST", body=json.dumps(body)
+        )
+        assert response.code == 201
+        uuids.append(json.loads(response.body)['uuid'])
+
+    assert uuids[0] == uuids[1]
+    assert uuids[0] != uuids[2]
+
+
+@pytest.mark.gen_test
+def test_run_job_invalid_params(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({classes.PARAMS_PROPERTY: 5}),
+        raise_error=False
+    )
+
+    assert response.code == 400
+    errors = json.loads(response.body)['errors']
+    assert classes.PARAMS_PROPERTY in errors
+
+
+@pytest.mark.gen_test
+def test_run_job_bad_body(app, http_client, base_url):
+    url = "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOB)
+
+    for body in ["[]", "not json"]:
+        response = yield http_client.fetch(
+            url, method="POST", body=body, raise_error=False
+        )
+        assert response.code == 400
+
+
+@pytest.mark.gen_test
+def test_run_jobs_handler(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOBS),
+        method="POST",
+        body=json.dumps([{}, {classes.PARAMS_PROPERTY: 5}, {}])
+    )
+
+    assert response.code == 201
+    results = json.loads(response.body)['jobs']
+    assert len(results) == 3
+    assert "uuid" in results[0]
+    assert classes.PARAMS_PROPERTY in results[1]['errors']
+    assert "uuid" in results[2]
+    assert results[0]['uuid'] != results[2]['uuid']
+
+
+@pytest.mark.gen_test
+def test_run_jobs_all_invalid(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOBS),
+        method="POST",
+        body=json.dumps([{classes.PARAMS_PROPERTY: 5}, "whatever"]),
+        raise_error=False
+    )
+
+    assert response.code == 400
+    results = json.loads(response.body)['jobs']
+    assert len(results) == 2
+    assert all("errors" in result for result in results)
+
+
+@pytest.mark.gen_test
+def test_run_jobs_empty(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOBS),
+        method="POST",
+        body=json.dumps([])
+    )
+
+    assert response.code == 201
+    assert json.loads(response.body) == dict(jobs=[])
+
+
+@pytest.mark.gen_test
+def test_run_jobs_bad_body(app, http_client, base_url):
+    url = "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.RUN_JOBS)
+
+    tooBig = json.dumps([{}] * (handlers.MAX_BATCH + 1))
+
+    for body in ["{}", "not json", tooBig]:
+        response = yield http_client.fetch(
+            url, method="POST", body=body, raise_error=False
+        )
+        assert response.code == 400
+
+
 @pytest.mark.gen_test
 def test_sub_branches_bad_path(app, http_client, base_url):
     response = yield http_client.fetch(
@@ -171,6 +421,26 @@ def test_run_job_bad_path(app, http_client, base_url):
     assert response.code == 404
 
 
+@pytest.mark.gen_test
+def test_leaves_not_branch(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PARAMS_LEAF_PATH, handlers.LEAVES),
+        raise_error=False
+    )
+
+    assert response.code == 404
+
+
+@pytest.mark.gen_test
+def test_unknown_resource(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.PROD_PATH, "whatever"),
+        raise_error=False
+    )
+
+    assert response.code == 404
+
+
 @pytest.mark.gen_test
 def test_post_schema_not_leaf(app, http_client, base_url):
     response = yield http_client.fetch(
@@ -193,6 +463,46 @@ def test_run_job_not_leaf(app, http_client, base_url):
     assert response.code == 400
 
 
+def test_make_handlers_size(make_structure):
+    # the number of routes doesn't depend on the size of the tree
+    struct = make_structure(classes.Root, "")
+    subStruct = make_structure(classes.DevExpBranch, "")
+
+    assert (
+        len(handlers.make_handlers(struct)) ==
+        len(handlers.make_handlers(subStruct))
+    )
+
+
+def test_route_reserved_leaf_name(make_structure, make_datastore, make_queue):
+    struct = make_structure(classes.ReservedRoot, "")
+    reservedApp = server.Server(
+        struct,
+        "testService",
+        make_datastore,
+        make_queue,
+        zerog.find_subclasses(classes.ReservedRoot),
+        handlers.make_handlers(struct)
+    )
+
+    def handler_class(method, uri):
+        request = HTTPServerRequest(method=method, uri=uri)
+        return reservedApp.wildcard_router.find_handler(request).handler_class
+
+    assert handler_class("POST", "/reserved/data/job") is (
+        handlers.RunJobHandler
+    )
+    assert handler_class("GET", "/reserved/data/post-schema") is (
+        handlers.PostSchemaHandler
+    )
+    assert handler_class("GET", "/reserved/data/%s" % uuid.uuid4()) is (
+        handlers.DataHandler
+    )
+    assert handler_class("GET", "/reserved/progress") is (
+        handlers.MultiProgressHandler
+    )
+
+
 @pytest.mark.gen_test
 def test_progress_handler(app, http_client, base_url):
     response = yield http_client.fetch(
@@ -216,6 +526,37 @@ def test_progress_handler(app, http_client, base_url):
         assert key in progress
 
 
+@pytest.mark.gen_test
+def test_progress_handler_msgpack(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+
+    response = yield http_client.fetch(
+        "%s%s/%s/%s" % (base_url, classes.ROOT_PATH, "progress", uuid),
+        headers={"Accept": "application/msgpack"}
+    )
+
+    assert response.code == 200
+    assert response.headers['Content-Type'] == "application/msgpack"
+    assert msgpack.unpackb(response.body) == dict(
+        completeness=0.0, result=None
+    )
+
+
+@pytest.mark.gen_test
+def test_progress_handler_no_job(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s/%s" % (base_url, classes.ROOT_PATH, "progress", "whatever"),
+        raise_error=False
+    )
+
+    assert response.code == 404
+
+
 @pytest.mark.gen_test
 def test_info_handler(app, http_client, base_url):
     response = yield http_client.fetch(
@@ -259,3 +600,335 @@ def test_data_handler(app, http_client, base_url):
     assert response.code == 200
     data = json.loads(response.body)
     assert data == {}
+
+    response = yield http_client.fetch(
+        "%s%s/%s/%s" % (base_url, classes.ROOT_PATH, "data", uuid),
+        headers={"Accept": "application/msgpack"}
+    )
+
+    assert response.code == 200
+    assert response.headers['Content-Type'] == "application/msgpack"
+    assert msgpack.unpackb(response.body) == {}
+
+
+@pytest.mark.gen_test
+def test_multi_progress_handler(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOBS),
+        method="POST",
+        body=json.dumps([{}, {}])
+    )
+
+    assert response.code == 201
+    uuids = [r['uuid'] for r in json.loads(response.body)['jobs']]
+    uuids.append("no-such-job")
+
+    response = yield http_client.fetch(
+        "%s%s/%s?%s" % (
+            base_url,
+            classes.ROOT_PATH,
+            "progress",
+            "&".join("uuid=%s" % uuid for uuid in uuids)
+        )
+    )
+
+    assert response.code == 200
+    progress = json.loads(response.body)
+    assert set(progress) == set(uuids)
+    assert progress["no-such-job"] is None
+    for uuid in uuids[:2]:
+        for key in ["completeness", "result"]:
+            assert key in progress[uuid]
+
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.ROOT_PATH, "progress"),
+        method="POST",
+        body=json.dumps(uuids)
+    )
+
+    assert response.code == 200
+    assert set(json.loads(response.body)) == set(uuids)
+
+
+@pytest.mark.gen_test
+def test_multi_progress_too_many(app, http_client, base_url):
+    uuids = ["uuid%d" % i for i in range(handlers.MAX_PROGRESS_UUIDS + 1)]
+
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.ROOT_PATH, "progress"),
+        method="POST",
+        body=json.dumps(uuids),
+        raise_error=False
+    )
+
+    assert response.code == 400
+
+
+@pytest.mark.gen_test
+def test_progress_stream_not_found(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/progress/%s/stream" % (base_url, classes.ROOT_PATH, "whatever")
+    )
+
+    assert response.code == 200
+    assert response.headers['Content-Type'] == "text/event-stream"
+    assert b"event: not-found" in response.body
+
+
+@pytest.mark.gen_test
+def test_metrics_handler(app, http_client, base_url):
+    yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.EXP_PATH, handlers.LEAVES)
+    )
+
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.ROOT_PATH, "metrics")
+    )
+
+    assert response.code == 200
+    assert response.headers['Content-Type'].startswith("text/plain")
+    text = response.body.decode()
+    assert "# TYPE spacewalk_request_seconds histogram" in text
+    assert (
+        'spacewalk_requests_total{handler="LeavesHandler",path="%s",'
+        'code="200"}' % classes.EXP_PATH
+    ) in text
+
+
+@pytest.mark.gen_test
+def test_profile_handler_no_job(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s/%s" % (base_url, classes.ROOT_PATH, "profile", "whatever"),
+        raise_error=False
+    )
+
+    assert response.code == 404
+
+
+@pytest.mark.gen_test
+def test_profile_handler_not_profiled(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+
+    response = yield http_client.fetch(
+        "%s%s/%s/%s" % (base_url, classes.ROOT_PATH, "profile", uuid),
+        raise_error=False
+    )
+
+    assert response.code == 404
+
+
+@pytest.mark.gen_test
+def test_profile_handler(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({PROFILE_PARAM: True})
+    )
+    uuid = json.loads(response.body)['uuid']
+    doc = app.datastore.get(uuid)
+    assert doc['profiling']
+
+    job = classes.JOB_THAT_RUNS(app.datastore, app.queue, **doc)
+    job.run()
+    assert "profile" not in app.datastore.get(uuid)
+
+    response = yield http_client.fetch(
+        "%s%s/%s/%s" % (base_url, classes.ROOT_PATH, "profile", uuid)
+    )
+
+    assert response.code == 200
+    assert json.loads(response.body)['summary']
+
+
+def logged_job(app, uuid, numEvents):
+    doc = app.datastore.get(uuid)
+    job = classes.JOB_THAT_RUNS(app.datastore, app.queue, **doc)
+    for i in range(numEvents):
+        job.job_log_info("event %d" % i)
+
+    job.job_log_error("oops")
+    return job
+
+
+@pytest.mark.gen_test
+def test_logs_handler(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+    logged_job(app, uuid, 4)
+
+    response = yield http_client.fetch(
+        "%s%s/logs/%s?offset=1&limit=2" % (base_url, classes.ROOT_PATH, uuid)
+    )
+    page = json.loads(response.body)
+
+    assert [event['msg'] for event in page['events']] == [
+        "event 1", "event 2"
+    ]
+    assert page['total'] == 5
+    assert page['next'] == 3
+
+    response = yield http_client.fetch(
+        "%s%s/logs/%s?offset=3" % (base_url, classes.ROOT_PATH, uuid)
+    )
+    page = json.loads(response.body)
+
+    assert [event['msg'] for event in page['events']] == ["event 3", "oops"]
+    assert page['next'] is None
+
+
+@pytest.mark.gen_test
+def test_logs_handler_job_document(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+
+    # a job that keeps its log in the job document, as zerog does
+    doc = app.datastore.get(uuid)
+    doc['events'] = [
+        dict(level="info", msg="event %d" % i, timeStamp="")
+        for i in range(3)
+    ]
+    app.datastore.set(uuid, doc)
+
+    response = yield http_client.fetch(
+        "%s%s/logs/%s?offset=1" % (base_url, classes.ROOT_PATH, uuid)
+    )
+    page = json.loads(response.body)
+
+    assert [event['msg'] for event in page['events']] == [
+        "event 1", "event 2"
+    ]
+    assert page['total'] == 3
+    assert page['next'] is None
+
+
+@pytest.mark.gen_test
+def test_logs_handler_errors(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/logs/%s" % (base_url, classes.ROOT_PATH, "whatever"),
+        raise_error=False
+    )
+    assert response.code == 404
+
+    response = yield http_client.fetch(
+        "%s%s/logs/%s?limit=0" % (base_url, classes.ROOT_PATH, "whatever"),
+        raise_error=False
+    )
+    assert response.code == 400
+
+
+@pytest.mark.gen_test
+def test_info_handler_chunked_log(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+    logged_job(app, uuid, handlers.INFO_LOG_EVENTS + 5)
+
+    response = yield http_client.fetch(
+        "%s%s/info/%s" % (base_url, classes.ROOT_PATH, uuid)
+    )
+    info = json.loads(response.body)
+
+    assert len(info['events']) == handlers.INFO_LOG_EVENTS
+    assert info['events'][-1]['msg'] == "oops"
+    assert [error['msg'] for error in info['errors']] == ["oops"]
+    assert info['logCount'] == handlers.INFO_LOG_EVENTS + 6
+
+
+def test_job_etag():
+    doc = dict(completeness=0.25, updatedAt="2021-09-28T14:51:57")
+
+    # updates in the same second
+    assert handlers.job_etag(doc) != handlers.job_etag(
+        dict(doc, completeness=0.5)
+    )
+    assert handlers.job_etag(doc, "json") != handlers.job_etag(doc, "pretty")
+    assert handlers.job_etag(dict(doc)) == handlers.job_etag(doc)
+    assert handlers.job_etag(dict(doc, cas=7), 5) == '"7-5"'
+
+
+@pytest.mark.gen_test
+def test_info_handler_etag(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+    job = logged_job(app, uuid, 1)
+    url = "%s%s/info/%s" % (base_url, classes.ROOT_PATH, uuid)
+
+    response = yield http_client.fetch(url)
+    etag = response.headers['Etag']
+    assert response.headers['Cache-Control'] == "no-cache"
+
+    response = yield http_client.fetch(
+        url, headers={"If-None-Match": etag}, raise_error=False
+    )
+    assert response.code == 304
+
+    job.job_log_info("more")
+    response = yield http_client.fetch(url, headers={"If-None-Match": etag})
+    assert response.code == 200
+    assert response.headers['Etag'] != etag
+
+    job.record_result(200)
+    response = yield http_client.fetch(url)
+    assert "immutable" in response.headers['Cache-Control']
+
+
+@pytest.mark.gen_test
+def test_dump_handler_chunked_log(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+    logged_job(app, uuid, 3)
+
+    response = yield http_client.fetch(
+        "%s%s/dump/%s?showLogs=true" % (base_url, classes.ROOT_PATH, uuid)
+    )
+    dump = json.loads(response.body)
+
+    assert dump['uuid'] == uuid
+    assert [event['msg'] for event in dump['events']] == [
+        "event 0", "event 1", "event 2", "oops"
+    ]
+
+
+@pytest.mark.gen_test
+def test_dump_handler_msgpack(app, http_client, base_url):
+    response = yield http_client.fetch(
+        "%s%s/%s" % (base_url, classes.JOB_THAT_RUNS_PATH, handlers.RUN_JOB),
+        method="POST",
+        body=json.dumps({})
+    )
+    uuid = json.loads(response.body)['uuid']
+
+    response = yield http_client.fetch(
+        "%s%s/dump/%s" % (base_url, classes.ROOT_PATH, uuid),
+        headers={"Accept": "application/msgpack"}
+    )
+
+    assert response.code == 200
+    assert response.headers['Content-Type'] == "application/msgpack"
+    dump = msgpack.unpackb(response.body)
+    assert dump['uuid'] == uuid
+    assert "events" not in dump
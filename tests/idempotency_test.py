@@ -0,0 +1,138 @@
+import pdb
+import pytest
+import time
+
+from spacewalk import idempotency
+from spacewalk import structure
+from . import classes
+
+
+class DictDatastore(object):
+    def __init__(self):
+        self.docs = {}
+
+    def set(self, key, value):
+        self.docs[key] = value
+
+    def get(self, key):
+        return self.docs.get(key)
+
+    def delete(self, key):
+        self.docs.pop(key, None)
+
+
+class InsertDatastore(DictDatastore):
+    def __init__(self):
+        super().__init__()
+        self.ttls = {}
+
+    def insert(self, key, value, ttl=None):
+        if key in self.docs:
+            return False
+
+        self.upsert(key, value, ttl)
+        return True
+
+    def upsert(self, key, value, ttl=None):
+        self.docs[key] = value
+        self.ttls[key] = ttl
+
+
+@pytest.fixture
+def datastore():
+    return DictDatastore()
+
+
+def test_set_and_get(datastore):
+    keys = idempotency.IdempotencyKeys(datastore)
+    assert keys.get("jobType", "key1") is None
+
+    keys.set("jobType", "key1", "uuid1")
+    assert keys.get("jobType", "key1") == "uuid1"
+    assert keys.get("otherJobType", "key1") is None
+
+
+def test_shared_through_datastore(datastore):
+    idempotency.IdempotencyKeys(datastore).set("jobType", "key1", "uuid1")
+
+    keys = idempotency.IdempotencyKeys(datastore)
+    assert keys.get("jobType", "key1") == "uuid1"
+
+
+def test_expired(datastore):
+    keys = idempotency.IdempotencyKeys(datastore, ttl=-1)
+    keys.set("jobType", "key1", "uuid1")
+
+    assert keys.get("jobType", "key1") is None
+
+
+def test_lru(datastore):
+    keys = idempotency.IdempotencyKeys(datastore, maxsize=2)
+    for i in range(3):
+        keys.set("jobType", "key%d" % i, "uuid%d" % i)
+
+    assert len(keys.cache) == 2
+    assert keys.record_key("jobType", "key0") not in keys.cache
+
+    # evicted keys are still found in the datastore
+    assert keys.get("jobType", "key0") == "uuid0"
+
+
+def test_expired_deleted(datastore):
+    keys = idempotency.IdempotencyKeys(datastore, ttl=-1)
+    keys.set("jobType", "key1", "uuid1")
+    keys.get("jobType", "key1")
+
+    assert datastore.docs == {}
+
+
+def test_claim(datastore):
+    keys = idempotency.IdempotencyKeys(datastore)
+
+    assert keys.claim("jobType", "key1", "uuid1", paramsDigest="a") is None
+
+    record = idempotency.IdempotencyKeys(datastore).claim(
+        "jobType", "key1", "uuid2", paramsDigest="b"
+    )
+    assert record['uuid'] == "uuid1"
+    assert record['paramsDigest'] == "a"
+
+    keys.delete("jobType", "key1")
+    assert keys.claim("jobType", "key1", "uuid2") is None
+    assert keys.get("jobType", "key1") == "uuid2"
+
+
+def test_claim_insert():
+    datastore = InsertDatastore()
+    keys = idempotency.IdempotencyKeys(datastore, ttl=60)
+
+    assert keys.claim("jobType", "key1", "uuid1") is None
+    assert keys.claim("jobType", "key1", "uuid2")['uuid'] == "uuid1"
+
+    rkey = keys.record_key("jobType", "key1")
+    assert datastore.ttls[rkey] == 60
+
+    keys.set("jobType", "key2", "uuid3", ttl=5)
+    assert datastore.ttls[keys.record_key("jobType", "key2")] == 5
+
+
+def test_claim_expired_insert():
+    datastore = InsertDatastore()
+    keys = idempotency.IdempotencyKeys(datastore, ttl=-1)
+    keys.claim("jobType", "key1", "uuid1")
+
+    assert keys.claim("jobType", "key1", "uuid2") is None
+    assert datastore.docs[keys.record_key("jobType", "key1")]['uuid'] == (
+        "uuid2"
+    )
+
+
+def test_params_digest():
+    leaf = structure.Leaf(classes.DeterministicLeaf, "/tests")
+
+    digest = idempotency.params_digest(leaf, dict(label="a"))
+    assert digest == idempotency.params_digest(leaf, dict(label="a", n=10))
+    assert digest == idempotency.params_digest(
+        leaf, dict(label="a", notAParam=5)
+    )
+    assert digest != idempotency.params_digest(leaf, dict(label="b"))
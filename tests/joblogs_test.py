@@ -0,0 +1,106 @@
+import pdb
+import pytest
+
+from spacewalk import joblogs
+
+
+class Datastore(object):
+    def __init__(self):
+        self.docs = {}
+        self.writes = 0
+
+    def get(self, key):
+        return self.docs.get(key)
+
+    def set(self, key, value):
+        self.writes += 1
+        self.docs[key] = value
+
+    def get_multi(self, keys):
+        return {key: self.docs.get(key) for key in keys}
+
+
+def make_log(datastore, numEvents, chunkSize=3):
+    jobLog = joblogs.JobLog("job", chunkSize)
+    for i in range(numEvents):
+        jobLog.append(datastore, dict(msg=i))
+
+    return jobLog
+
+
+def test_append():
+    datastore = Datastore()
+    make_log(datastore, 7)
+
+    assert datastore.get(joblogs.head_key("job")) == dict(
+        count=7, chunkSize=3
+    )
+    assert datastore.get(joblogs.chunk_key("job", 0))['events'] == [
+        dict(msg=0), dict(msg=1), dict(msg=2)
+    ]
+    assert datastore.get(joblogs.chunk_key("job", 2))['events'] == [
+        dict(msg=6)
+    ]
+    assert datastore.writes == 14
+
+
+def test_append_resumes():
+    datastore = Datastore()
+    make_log(datastore, 4)
+
+    # a new JobLog, as when a job is reloaded, keeps appending in place
+    jobLog = joblogs.JobLog("job", chunkSize=100)
+    jobLog.append(datastore, dict(msg=4))
+
+    assert datastore.get(joblogs.head_key("job")) == dict(
+        count=5, chunkSize=3
+    )
+    assert datastore.get(joblogs.chunk_key("job", 1))['events'] == [
+        dict(msg=3), dict(msg=4)
+    ]
+
+
+def test_extend():
+    datastore = Datastore()
+    jobLog = make_log(datastore, 2)
+    datastore.writes = 0
+
+    jobLog.extend(datastore, [dict(msg=i) for i in range(2, 10)])
+
+    # chunks 0, 1, 2 and 3, then the head
+    assert datastore.writes == 5
+    assert datastore.get(joblogs.head_key("job"))['count'] == 10
+    assert datastore.get(joblogs.chunk_key("job", 3))['events'] == [
+        dict(msg=9)
+    ]
+
+    jobLog.extend(datastore, [])
+    assert datastore.writes == 5
+
+
+def test_read_events():
+    datastore = Datastore()
+    make_log(datastore, 10)
+    head = datastore.get(joblogs.head_key("job"))
+
+    def read(start, end):
+        events = joblogs.read_events(
+            datastore.get_multi, "job", head, start, end
+        )
+        return [event['msg'] for event in events]
+
+    assert read(0, 10) == list(range(10))
+    assert read(2, 7) == [2, 3, 4, 5, 6]
+    assert read(8, 100) == [8, 9]
+    assert read(10, 20) == []
+
+
+def test_tail_events():
+    datastore = Datastore()
+    make_log(datastore, 10)
+    head = datastore.get(joblogs.head_key("job"))
+
+    events = joblogs.tail_events(datastore.get_multi, "job", head, 4)
+
+    assert [event['msg'] for event in events] == [6, 7, 8, 9]
+    assert joblogs.tail_events(datastore.get_multi, "job", None, 4) == []
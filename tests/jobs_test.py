@@ -0,0 +1,99 @@
+import asyncio
+import pdb
+import pytest
+
+from spacewalk.jobs import is_async, message_uuid, queue_message, queue_name
+from spacewalk import metrics
+from spacewalk.profiling import PROFILE_PARAM
+from . import classes
+
+
+def test_param_names():
+    assert classes.ProdLeaf1.PARAM_NAMES == (classes.PARAMS_PROPERTY,)
+    assert classes.ProdLeaf2.PARAM_NAMES == ()
+
+
+def test_params_schema_per_class():
+    schema = classes.ProdLeaf1.PARAMS_SCHEMA
+
+    assert isinstance(schema, classes.ProdLeaf1.Params)
+    assert schema is not classes.ProdLeaf2.PARAMS_SCHEMA
+
+
+def test_job_params(make_datastore, make_queue):
+    job = classes.ProdLeaf1(
+        make_datastore(),
+        make_queue("testService"),
+        **{classes.PARAMS_PROPERTY: "whatever"}
+    )
+
+    assert getattr(job, classes.PARAMS_PROPERTY) == "whatever"
+
+
+def test_job_missing_params(make_datastore, make_queue):
+    job = classes.ProdLeaf1(make_datastore(), make_queue("testService"))
+
+    assert not hasattr(job, classes.PARAMS_PROPERTY)
+
+
+def test_queue_name():
+    assert queue_name("testService", classes.ProdLeaf1) == "testService"
+    assert (
+        queue_name("testService", classes.InteractiveLeaf) ==
+        "testService-interactive"
+    )
+
+
+def test_queue_message():
+    assert queue_message("abc") == "abc"
+    assert message_uuid(queue_message("abc")) == "abc"
+    assert message_uuid('{"uuid": "abc"}') == "abc"
+
+
+def test_job_priority(make_datastore):
+    job = classes.InteractiveLeaf(make_datastore(), None)
+
+    assert job.queueKwargs['priority'] == classes.InteractiveLeaf.PRIORITY
+
+
+def test_job_default_priority(make_datastore):
+    job = classes.DefaultLeaf(make_datastore(), None)
+
+    assert "priority" not in (getattr(job, "queueKwargs", None) or {})
+
+
+def test_request_params():
+    params = dict(
+        uuid="forged", blobs={}, completeness=1.0, thingum="useful"
+    )
+
+    assert classes.ProdLeaf1.request_params(params) == dict(thingum="useful")
+
+
+def test_request_params_profile():
+    params = {PROFILE_PARAM: True, "thingum": "useful"}
+
+    assert classes.ProdLeaf1.request_params(params) == dict(
+        thingum="useful", profiling=True
+    )
+
+
+def test_is_async():
+    assert is_async(classes.AsyncLeaf)
+    assert not is_async(classes.ProdLeaf1)
+
+
+def test_async_run(make_datastore, make_queue):
+    job = classes.AsyncLeaf(make_datastore(), make_queue("testService"))
+    job.save()
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(job.run()) == (200, None)
+    finally:
+        loop.close()
+
+    assert job.completeness == 0.5
+    assert (
+        (classes.AsyncLeaf.JOB_TYPE, "200") in metrics.JOB_SECONDS.values
+    )
@@ -0,0 +1,101 @@
+import pdb
+import pytest
+import urllib.request
+
+from spacewalk import metrics
+from . import classes
+
+
+def test_counter():
+    registry = metrics.Registry()
+    counter = registry.counter("test_total", "a counter", ("a", "b"))
+    counter.inc("x", "y")
+    counter.inc("x", "y", amount=2)
+
+    text = registry.render()
+    assert "# TYPE test_total counter" in text
+    assert 'test_total{a="x",b="y"} 3' in text
+
+
+def test_histogram():
+    registry = metrics.Registry()
+    histogram = registry.histogram(
+        "test_seconds", "a histogram", ("a",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.05, "x")
+    histogram.observe(0.5, "x")
+    histogram.observe(5, "x")
+
+    text = registry.render()
+    assert "# TYPE test_seconds histogram" in text
+    assert 'test_seconds_bucket{a="x",le="0.1"} 1' in text
+    assert 'test_seconds_bucket{a="x",le="1.0"} 2' in text
+    assert 'test_seconds_bucket{a="x",le="+Inf"} 3' in text
+    assert 'test_seconds_count{a="x"} 3' in text
+    assert 'test_seconds_sum{a="x"} 5.55' in text
+
+
+def test_escape_labels():
+    assert metrics.format_labels(("a",), ('say "hi"\n',)) == (
+        '{a="say \\"hi\\"\\n"}'
+    )
+
+
+def test_timed_datastore():
+    class Datastore(object):
+        def get(self, key):
+            return key
+
+        def set(self, key, value):
+            pass
+
+    datastore = metrics.TimedDatastore(Datastore())
+    assert datastore.get("whatever") == "whatever"
+    datastore.set("whatever", 1)
+
+    assert ("read", "get") in metrics.DATASTORE_SECONDS.values
+    assert ("write", "set") in metrics.DATASTORE_SECONDS.values
+    assert not hasattr(datastore, "get_multi")
+    # timed methods are made once
+    assert datastore.get is datastore.get
+    assert "set" in vars(datastore)
+
+
+def test_timed_run(make_datastore, make_queue):
+    job = classes.ProdLeaf1(make_datastore(), make_queue("testService"))
+    job.run()
+
+    assert (
+        (classes.ProdLeaf1.JOB_TYPE, "200") in metrics.JOB_SECONDS.values
+    )
+
+
+def test_histogram_drain_and_merge():
+    histogram = metrics.Histogram(
+        "test_seconds", "a histogram", ("a",), buckets=(0.1, 1.0)
+    )
+    histogram.observe(0.05, "x")
+    histogram.observe(5, "x")
+
+    values = histogram.drain()
+    assert histogram.values == {}
+
+    histogram.observe(0.5, "x")
+    histogram.merge(values)
+
+    assert histogram.values[("x",)] == [1, 1, 1, 5.55]
+
+
+def test_start_http_server():
+    server = metrics.start_http_server(0, "127.0.0.1")
+    try:
+        response = urllib.request.urlopen(
+            "http://127.0.0.1:%d/metrics" % server.server_address[1]
+        )
+        assert response.headers['Content-Type'] == metrics.CONTENT_TYPE
+        assert b"# TYPE spacewalk_job_run_seconds histogram" in (
+            response.read()
+        )
+    finally:
+        server.shutdown()
+        server.server_close()
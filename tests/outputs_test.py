@@ -0,0 +1,169 @@
+import json
+import pdb
+import pytest
+
+import zerog
+
+from spacewalk import blobs
+from spacewalk import handlers
+from spacewalk import outputs
+from spacewalk import server
+
+from . import classes
+from .joblogs_test import Datastore
+
+
+def test_iter_items(monkeypatch):
+    monkeypatch.setattr(outputs, "CHUNKS_PER_READ", 2)
+    datastore = Datastore()
+    outputs.JobOutput("job", chunkSize=3).extend(datastore, range(10))
+    head = datastore.get(outputs.head_key("job"))
+
+    batches = list(outputs.iter_items(datastore.get_multi, "job", head))
+
+    assert batches == [[0, 1, 2, 3, 4, 5], [6, 7, 8, 9]]
+    assert list(outputs.iter_items(datastore.get_multi, "job", None)) == []
+
+
+def test_encode_object():
+    encoded = "".join(
+        outputs.encode_object(
+            dict(a=1),
+            [("rows", outputs.encode_list([[1, 2], [], [3]])), ("b", "2")]
+        )
+    )
+    assert json.loads(encoded) == dict(a=1, rows=[1, 2, 3], b=2)
+
+    encoded = "".join(
+        outputs.encode_object({}, [("rows", outputs.encode_list([]))])
+    )
+    assert json.loads(encoded) == dict(rows=[])
+    assert json.loads("".join(outputs.encode_object({}))) == {}
+
+
+def test_encode_ndjson():
+    encoded = "".join(outputs.encode_ndjson(dict(a=1), [[1, 2], [3]]))
+
+    assert encoded.splitlines() == ['{"a": 1}', "1", "2", "3"]
+
+
+@pytest.fixture
+def app(make_structure, make_datastore, make_queue):
+    struct = make_structure(classes.QueuedRoot, "")
+
+    return server.Server(
+        struct,
+        "testService",
+        make_datastore,
+        make_queue,
+        zerog.find_subclasses(classes.QueuedRoot),
+        handlers.make_handlers(struct)
+    )
+
+
+def streamed_job(app):
+    job = app.make_jobs(classes.StreamedLeaf, [{}])[0]
+    job.run()
+    return job.uuid
+
+
+@pytest.mark.gen_test
+def test_data_handler_streamed(app, http_client, base_url):
+    uuid = streamed_job(app)
+
+    response = yield http_client.fetch(
+        "%s%s/data/%s" % (base_url, classes.QUEUED_PATH, uuid)
+    )
+    data = json.loads(response.body)
+
+    assert data['name'] == "streamed"
+    assert data['rows'] == [dict(row=i) for i in range(25)]
+
+
+@pytest.mark.gen_test
+def test_data_handler_ndjson(app, http_client, base_url):
+    uuid = streamed_job(app)
+
+    response = yield http_client.fetch(
+        "%s%s/data/%s" % (base_url, classes.QUEUED_PATH, uuid),
+        headers={"Accept": handlers.NDJSON_TYPE}
+    )
+    lines = [json.loads(line) for line in response.body.splitlines()]
+
+    assert response.headers['Content-Type'] == handlers.NDJSON_TYPE
+    assert lines[0]['name'] == "streamed"
+    assert lines[1:] == [dict(row=i) for i in range(25)]
+
+
+@pytest.mark.gen_test
+def test_data_handler_paged(app, http_client, base_url):
+    uuid = streamed_job(app)
+
+    response = yield http_client.fetch(
+        "%s%s/data/%s?offset=8&limit=5" % (base_url, classes.QUEUED_PATH, uuid)
+    )
+    data = json.loads(response.body)
+
+    assert data['rows'] == [dict(row=i) for i in range(8, 13)]
+    assert data['total'] == 25
+    assert data['next'] == 13
+
+    response = yield http_client.fetch(
+        "%s%s/data/%s?limit=0" % (base_url, classes.QUEUED_PATH, uuid),
+        raise_error=False
+    )
+    assert response.code == 400
+
+
+@pytest.mark.gen_test
+def test_data_handler_blob(app, http_client, base_url, tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        blobs, "_defaultStore", blobs.MmapFileStore(str(tmp_path))
+    )
+    job = app.make_jobs(classes.BlobLeaf, [{}])[0]
+    job.run()
+
+    response = yield http_client.fetch(
+        "%s%s/data/%s" % (base_url, classes.QUEUED_PATH, job.uuid)
+    )
+
+    assert json.loads(response.body) == dict(
+        table=[[i, str(i)] for i in range(100)]
+    )
+
+
+@pytest.mark.gen_test
+def test_data_handler_etag(app, http_client, base_url):
+    uuid = streamed_job(app)
+    url = "%s%s/data/%s" % (base_url, classes.QUEUED_PATH, uuid)
+
+    response = yield http_client.fetch(url)
+    etag = response.headers['Etag']
+
+    response = yield http_client.fetch(
+        url, headers={"If-None-Match": etag}, raise_error=False
+    )
+    assert response.code == 304
+
+    response = yield http_client.fetch(
+        url + "?offset=0", headers={"If-None-Match": etag}
+    )
+    assert response.code == 200
+
+
+@pytest.mark.gen_test
+def test_data_handler_missing_blob(
+    app, http_client, base_url, tmp_path, monkeypatch
+):
+    store = blobs.MmapFileStore(str(tmp_path))
+    monkeypatch.setattr(blobs, "_defaultStore", store)
+    job = app.make_jobs(classes.BlobLeaf, [{}])[0]
+    job.run()
+    store.delete(job.blobs['table']['key'])
+
+    response = yield http_client.fetch(
+        "%s%s/data/%s" % (base_url, classes.QUEUED_PATH, job.uuid),
+        raise_error=False
+    )
+
+    assert response.code == 404
@@ -0,0 +1,96 @@
+import asyncio
+import marshal
+import pdb
+import pytest
+
+from spacewalk import profiling
+from . import classes
+
+
+def busy():
+    return sum(i * i for i in range(1000))
+
+
+def test_run_profile():
+    with profiling.RunProfile(5) as profile:
+        busy()
+
+    summary = profile.profile['summary']
+    assert 0 < len(summary) <= 5
+    assert any("busy" in row['function'] for row in summary)
+    for key in ["function", "ncalls", "tottime", "cumtime"]:
+        assert key in summary[0]
+
+    stats = marshal.loads(profiling.decode_stats(profile.profile['stats']))
+    assert any(func[2] == "busy" for func in stats)
+
+
+def test_run_profile_exception():
+    profile = profiling.RunProfile(5)
+    with pytest.raises(ZeroDivisionError):
+        with profile:
+            1 / 0
+
+    assert profile.profile is not None
+
+
+def test_profiled_job(make_datastore, make_queue):
+    job = classes.ProdLeaf1(
+        make_datastore(),
+        make_queue("testService"),
+        profiling=True
+    )
+    assert job.profiling
+
+    job.save()
+    job.run()
+    assert job.profile['summary']
+    profile = job.datastore.get(profiling.profile_key(job.uuid))
+    assert profile == job.profile
+    assert "profile" not in job.datastore.get(job.uuid)
+
+
+def test_forged_profile(make_datastore, make_queue):
+    params = classes.ProdLeaf1.request_params(
+        {profiling.PROFILE_PARAM: "yes", "profiling": True, "profile": {}}
+    )
+    assert params == {"profile": {}}
+
+    job = classes.ProdLeaf1(
+        make_datastore(), make_queue("testService"), **params
+    )
+    assert not job.profiling
+    assert job.profile is None
+
+
+def test_unprofiled_job(make_datastore, make_queue):
+    job = classes.ProdLeaf1(make_datastore(), make_queue("testService"))
+    assert not job.profiling
+
+    job.run()
+    assert job.profile is None
+
+
+def test_concurrent_profiled_async_jobs(make_datastore, make_queue):
+    jobs = [
+        classes.AsyncLeaf(
+            make_datastore(),
+            make_queue("testService"),
+            profiling=True
+        )
+        for _ in range(3)
+    ]
+    for job in jobs:
+        job.save()
+
+    async def run_all():
+        return await asyncio.gather(*[job.run() for job in jobs])
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run_all())
+    finally:
+        loop.close()
+
+    assert results == [(200, None)] * 3
+    assert all(job.profile['summary'] for job in jobs)
@@ -0,0 +1,14 @@
+import pdb
+import pytest
+
+from benchmarks import routing
+
+
+def test_routing_benchmark():
+    # the per-node routes and the trie must route every request alike,
+    # or run raises
+    results = routing.run(50, 200)
+
+    assert results['leaves'] >= 50
+    assert results['perNode'] > 0
+    assert results['trie'] > 0
@@ -1,3 +1,4 @@
+import gc
 import pdb
 import pytest
 import zerog
@@ -18,3 +19,101 @@ def test_server_init(make_structure, make_datastore, make_queue):
         []
     )
     assert True
+
+
+@pytest.mark.gen_test
+def test_server_warm_up(make_structure, make_datastore, make_queue):
+    struct = make_structure(classes.Root, "")
+
+    server = spacewalk.Server(
+        struct,
+        "testService",
+        make_datastore,
+        make_queue,
+        zerog.registry.find_subclasses(classes.Root),
+        [],
+        warmUp=True
+    )
+    yield server.warm_up()
+
+    for leaf in struct.get_leaf_targets():
+        assert leaf._postschema is not None
+
+
+def test_serve_forked(
+    monkeypatch, make_structure, make_datastore, make_queue
+):
+    struct = make_structure(classes.Root, "")
+    forks = []
+    started = []
+    metricsPorts = []
+
+    def fork_processes(processes, max_restarts):
+        forks.append((processes, max_restarts))
+        return 1
+
+    class FakeIOLoop(object):
+        @staticmethod
+        def current():
+            return FakeIOLoop()
+
+        def start(self):
+            started.append(True)
+
+    monkeypatch.setattr(spacewalk.server, "fork_processes", fork_processes)
+    monkeypatch.setattr(spacewalk.server, "IOLoop", FakeIOLoop)
+    monkeypatch.setattr(
+        spacewalk.server.metrics,
+        "start_http_server",
+        lambda port, address: metricsPorts.append(port)
+    )
+
+    try:
+        spacewalk.serve_forked(
+            struct,
+            0,
+            "testService",
+            make_datastore,
+            make_queue,
+            zerog.registry.find_subclasses(classes.Root),
+            [],
+            processes=4,
+            address="127.0.0.1",
+            maxRestarts=5,
+            metricsPort=9100
+        )
+    finally:
+        gc.unfreeze()
+
+    assert forks == [(4, 5)]
+    assert started == [True]
+    assert metricsPorts == [9101]
+
+    for leaf in struct.get_leaf_targets():
+        assert leaf._postschema is not None
+        assert leaf._validator is not None
+
+
+def test_server_job_queues(make_structure, make_datastore, make_queue):
+    struct = make_structure(classes.QueuedRoot, "")
+    queueNames = []
+
+    def make_named_queue(queueName):
+        queueNames.append(queueName)
+        return make_queue(queueName)
+
+    server = spacewalk.Server(
+        struct,
+        "testService",
+        make_datastore,
+        make_named_queue,
+        zerog.registry.find_subclasses(classes.QueuedRoot),
+        []
+    )
+    defaultJob = server.make_jobs(classes.DefaultLeaf, [{}])[0]
+    queuedJob = server.make_jobs(classes.InteractiveLeaf, [{}])[0]
+
+    assert queueNames == ["testService", "testService-interactive"]
+    assert defaultJob.queue is server.queue
+    assert queuedJob.queue is server.get_queue(classes.InteractiveLeaf)
+    assert queuedJob.queue is not server.queue
@@ -0,0 +1,200 @@
+import importlib.util
+from marshmallow import fields, Schema
+import pdb
+import pytest
+import sys
+
+from spacewalk import snapshot
+from spacewalk.jobs import BaseJob
+from spacewalk import structure
+from . import classes
+
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path / "structure.snapshot")
+
+
+def test_fingerprint_stable():
+    assert (
+        snapshot.fingerprint(classes.Root, "") ==
+        snapshot.fingerprint(classes.Root, "")
+    )
+
+
+def test_fingerprint_path():
+    assert (
+        snapshot.fingerprint(classes.Root, "") !=
+        snapshot.fingerprint(classes.Root, "/base")
+    )
+
+
+def test_schema_classes():
+    class Point(Schema):
+        x = fields.Integer()
+
+    class Params(Schema):
+        origin = fields.Nested(Point)
+        path = fields.List(fields.Nested(Point()))
+
+    found = set()
+    snapshot.schema_classes(Params, found)
+
+    assert {Params, Point, Schema, fields.Nested, fields.List} <= found
+    assert fields.Integer in found
+
+
+def test_fingerprint_nested_schema_source(tmp_path, monkeypatch):
+    source = tmp_path / "shared_schemas.py"
+    source.write_text(
+        "from marshmallow import fields, Schema\n"
+        "class Shared(Schema):\n"
+        "    n = fields.Integer()\n"
+    )
+    spec = importlib.util.spec_from_file_location("shared_schemas", source)
+    module = importlib.util.module_from_spec(spec)
+    monkeypatch.setitem(sys.modules, "shared_schemas", module)
+    spec.loader.exec_module(module)
+
+    class SharedRoot(BaseJob):
+        NAME = "shared"
+        BRANCH_NAME = "shared"
+        DESCRIPTION = "jobs with a shared nested schema"
+
+        class Params(Schema):
+            shared = fields.Nested(module.Shared)
+
+    before = snapshot.fingerprint(SharedRoot, "")
+    source.write_text(source.read_text() + "    label = fields.String()\n")
+
+    assert snapshot.fingerprint(SharedRoot, "") != before
+
+
+def test_save_and_load(make_structure, filename):
+    struct = make_structure(classes.Root, "")
+    fingerprint = snapshot.fingerprint(classes.Root, "")
+    snapshot.save_snapshot(struct, filename, fingerprint)
+
+    loaded = snapshot.load_snapshot(classes.Root, filename, fingerprint)
+
+    assert set(loaded.pathmap) == set(struct.pathmap)
+    for path, target in struct.pathmap.items():
+        assert loaded.pathmap[path].cls == target.cls
+
+    leaf = loaded.pathmap[classes.PARAMS_LEAF_PATH]
+    assert leaf._encodedPostschema is not None
+    assert leaf.postschema == struct.get_post_schema(classes.PARAMS_LEAF_PATH)
+    assert (
+        loaded.get_leaves(classes.EXP_PATH) ==
+        struct.get_leaves(classes.EXP_PATH)
+    )
+
+
+def test_load_encoded_responses(make_structure, filename, monkeypatch):
+    struct = make_structure(classes.Root, "")
+    fingerprint = snapshot.fingerprint(classes.Root, "")
+    snapshot.save_snapshot(struct, filename, fingerprint)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should load the encoded responses")
+
+    monkeypatch.setattr(structure.EncodedResponse, "__init__", fail)
+    loaded = snapshot.load_snapshot(classes.Root, filename, fingerprint)
+
+    pairs = [
+        (
+            struct.pathmap[classes.EXP_PATH].encodedLeaves,
+            loaded.pathmap[classes.EXP_PATH].encodedLeaves
+        ), (
+            struct.pathmap[classes.PARAMS_LEAF_PATH].encodedPostschema,
+            loaded.pathmap[classes.PARAMS_LEAF_PATH].encodedPostschema
+        )
+    ]
+    variants = [(False, False), (True, False), (False, True), (True, True)]
+    for encoded, loadedEncoded in pairs:
+        for compact, gzipped in variants:
+            assert (
+                loadedEncoded.get_body(compact, gzipped) ==
+                encoded.get_body(compact, gzipped)
+            )
+            assert (
+                loadedEncoded.etag(compact, gzipped) ==
+                encoded.etag(compact, gzipped)
+            )
+
+
+def test_load_other_encoding(make_structure, filename):
+    struct = make_structure(classes.Root, "")
+    fingerprint = snapshot.fingerprint(classes.Root, "")
+    snapshot.save_snapshot(struct, filename, fingerprint)
+
+    with pytest.raises(snapshot.StaleSnapshotError):
+        snapshot.load_snapshot(
+            classes.Root, filename, fingerprint, compress=False
+        )
+
+
+def test_load_stale(make_structure, filename):
+    struct = make_structure(classes.Root, "")
+    snapshot.save_snapshot(struct, filename, "old-fingerprint")
+
+    with pytest.raises(snapshot.StaleSnapshotError):
+        snapshot.load_snapshot(classes.Root, filename, "new-fingerprint")
+
+
+def test_load_changed_description(make_structure, filename, monkeypatch):
+    struct = make_structure(classes.Root, "")
+    fingerprint = snapshot.fingerprint(classes.Root, "")
+    snapshot.save_snapshot(struct, filename, fingerprint)
+
+    monkeypatch.setattr(classes.ProdLeaf1, "DESCRIPTION", "from the env")
+
+    with pytest.raises(snapshot.StaleSnapshotError):
+        snapshot.load_snapshot(classes.Root, filename, fingerprint)
+
+
+def test_cached_structure(filename, monkeypatch):
+    built = snapshot.cached_structure(classes.Root, "", filename)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should load the snapshot")
+
+    monkeypatch.setattr(snapshot, "auto_tree", fail)
+    loaded = snapshot.cached_structure(classes.Root, "", filename)
+
+    assert set(loaded.pathmap) == set(built.pathmap)
+
+
+def test_cached_structure_rebuilds_stale(make_structure, filename):
+    struct = make_structure(classes.Root, "")
+    snapshot.save_snapshot(struct, filename, "old-fingerprint")
+
+    rebuilt = snapshot.cached_structure(classes.Root, "", filename)
+    assert set(rebuilt.pathmap) == set(struct.pathmap)
+
+    # the stale snapshot was replaced
+    fingerprint = snapshot.fingerprint(classes.Root, "")
+    snapshot.load_snapshot(classes.Root, filename, fingerprint)
+
+
+def test_cached_structure_corrupt(filename):
+    with open(filename, "wb") as f:
+        f.write(b"not a snapshot")
+
+    struct = snapshot.cached_structure(classes.Root, "", filename)
+    assert isinstance(struct, structure.Structure)
+
+
+def test_update_snapshot(make_structure, filename):
+    struct = make_structure(classes.Root, "")
+
+    assert snapshot.update_snapshot(struct, filename)
+    assert not snapshot.update_snapshot(struct, filename)
+
+    # it's the snapshot that cached_structure loads
+    assert snapshot.structure_fingerprint(struct) == snapshot.fingerprint(
+        classes.Root, ""
+    )
+    snapshot.load_snapshot(
+        classes.Root, filename, snapshot.fingerprint(classes.Root, "")
+    )
@@ -0,0 +1,42 @@
+import pdb
+import pytest
+import time
+
+import zerog
+
+from benchmarks.standins import MemoryWorker, start_server
+from . import classes
+
+
+def test_memory_worker_queues():
+    url, struct, httpServer = start_server(classes.QueuedRoot)
+    server = httpServer.request_callback
+    worker = MemoryWorker(
+        server.datastore,
+        server.makeQueue.queues,
+        zerog.find_subclasses(classes.QueuedRoot)
+    )
+    worker.start()
+
+    try:
+        jobs = [
+            server.make_jobs(cls, [{}])[0]
+            for cls in [
+                classes.BatchLeaf, classes.InteractiveLeaf,
+                classes.DefaultLeaf
+            ]
+        ]
+        assert len(server.makeQueue.queues) == 3
+
+        deadline = time.time() + 5
+        while time.time() < deadline and not all(
+            server.datastore.get(job.uuid)['completeness'] == 1.0
+            for job in jobs
+        ):
+            time.sleep(0.01)
+    finally:
+        worker.stop()
+        httpServer.stop()
+
+    for job in jobs:
+        assert server.datastore.get(job.uuid)['completeness'] == 1.0
@@ -1,3 +1,5 @@
+import gzip
+import json
 import pdb
 import pytest
 
@@ -161,3 +163,102 @@ def test_get_root_path(make_structure):
 
     rootpath = "%s%s" % (basepath, classes.ROOT_PATH)
     assert struct.get_root_path() == rootpath
+
+
+def test_get_target(make_structure):
+    struct = make_structure(classes.Root, "")
+
+    for path, cls in classes.EXPECTED_MAPPINGS.items():
+        assert struct.get_target(path).cls == cls
+
+
+def test_get_target_base_path(make_structure):
+    basepath = "/test/base/path"
+    struct = make_structure(classes.Root, basepath)
+
+    target = struct.get_target("%s%s" % (basepath, classes.EXP_LEAF_PATH))
+    assert target.cls == classes.ExpLeaf2
+
+
+def test_get_target_bad_path(make_structure):
+    struct = make_structure(classes.Root, "")
+
+    assert struct.get_target("/whatever") is None
+    assert struct.get_target("%s/whatever" % classes.PROD_PATH) is None
+    assert struct.get_target("") is None
+
+
+def test_encoded_responses(make_structure):
+    struct = make_structure(classes.Root, "")
+    branch = struct.pathmap[classes.EXP_PATH]
+    leaf = struct.pathmap[classes.PARAMS_LEAF_PATH]
+
+    body, gzipped = branch.encodedLeaves.get_body()
+    assert not gzipped
+    assert json.loads(body) == struct.get_leaves(classes.EXP_PATH)
+
+    body, gzipped = branch.encodedBranches.get_body(compact=True)
+    assert b" " not in body
+    assert json.loads(body) == struct.get_sub_branches(classes.EXP_PATH)
+
+    body, gzipped = leaf.encodedPostschema.get_body(gzipped=True)
+    assert gzipped
+    assert json.loads(gzip.decompress(body)) == dict(
+        postSchema=struct.get_post_schema(classes.PARAMS_LEAF_PATH)
+    )
+
+
+def test_encoded_response_fallback():
+    encoded = structure.EncodedResponse(dict(a=[1, 2]))
+
+    body, gzipped = encoded.get_body(compact=True, gzipped=True)
+    assert not gzipped
+    assert body == json.dumps(dict(a=[1, 2]), indent=4).encode()
+
+
+def test_encoded_response_etag():
+    encoded = structure.EncodedResponse(dict(a=[1, 2]), compact=True)
+    same = structure.EncodedResponse(dict(a=[1, 2]), compact=True)
+    other = structure.EncodedResponse(dict(a=[1, 3]), compact=True)
+
+    assert encoded.etag() == same.etag()
+    assert encoded.etag() != other.etag()
+    assert len({
+        encoded.etag(),
+        encoded.etag(compact=True),
+        encoded.etag(msgpack=True)
+    }) == 3
+
+    # no gzipped encodings, so the same as the one that is sent instead
+    assert encoded.etag(gzipped=True) == encoded.etag()
+
+
+def test_lazy_post_schema(make_structure):
+    struct = make_structure(classes.Root, "")
+    leaf = struct.pathmap[classes.PARAMS_LEAF_PATH]
+
+    assert leaf._postschema is None
+    schema = leaf.postschema
+    assert classes.PARAMS_PROPERTY in (
+        schema['definitions']['Params']['properties']
+    )
+    assert leaf.postschema is schema
+
+
+def test_warm_up(make_structure):
+    struct = make_structure(classes.Root, "")
+    struct.warm_up()
+
+    for leaf in struct.get_leaf_targets():
+        assert leaf._postschema is not None
+        assert leaf._encodedPostschema is not None
+
+
+def test_leaf_validate():
+    l = structure.Leaf(classes.ProdLeaf1, "/tests")
+
+    assert l.validate({classes.PARAMS_PROPERTY: "whatever"}) == {}
+    assert l.validate({"notAParam": 5}) == {}
+    assert classes.PARAMS_PROPERTY in l.validate({classes.PARAMS_PROPERTY: 5})
+    assert l.validate([]) != {}
+    assert l.validator is l.validator
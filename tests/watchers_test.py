@@ -0,0 +1,158 @@
+import pdb
+import pytest
+
+from tornado import gen
+
+from spacewalk import joblogs, watchers
+
+
+class Datastore(object):
+    def __init__(self, docs):
+        self.docs = docs
+
+    def get(self, key):
+        return self.docs.get(key)
+
+    def set(self, key, value):
+        self.docs[key] = value
+
+
+@pytest.fixture
+def docs():
+    return dict(
+        job1=dict(completeness=0, resultCode=None, events=[]),
+        job2=dict(completeness=0, resultCode=None, events=[])
+    )
+
+
+@pytest.fixture
+def jobWatchers(docs):
+    reads = []
+
+    def read_jobs(uuids):
+        reads.append(uuids)
+        return {uuid: docs.get(uuid) for uuid in uuids}
+
+    jobWatchers = watchers.JobWatchers(read_jobs, interval=0.01)
+    jobWatchers.reads = reads
+    return jobWatchers
+
+
+def drain(queue):
+    messages = []
+    while not queue.empty():
+        messages.append(queue.get_nowait())
+    return messages
+
+
+@pytest.mark.gen_test
+def test_shared_watcher(jobWatchers, docs):
+    queue1 = jobWatchers.subscribe("job1")
+    queue2 = jobWatchers.subscribe("job1")
+    assert len(jobWatchers.watchers) == 1
+
+    jobWatchers.poll_once()
+    docs['job1'] = dict(
+        completeness=0.5, resultCode=None, events=[dict(msg="hi")]
+    )
+    jobWatchers.poll_once()
+
+    for queue in [queue1, queue2]:
+        events = [event for event, _ in drain(queue)]
+        assert events == [
+            watchers.PROGRESS, watchers.LOG, watchers.PROGRESS
+        ]
+
+
+@pytest.mark.gen_test
+def test_bulk_read(jobWatchers):
+    jobWatchers.subscribe("job1")
+    jobWatchers.subscribe("job2")
+    jobWatchers.poll_once()
+
+    assert sorted(jobWatchers.reads[-1]) == [
+        "job1", "job1_log", "job2", "job2_log"
+    ]
+
+
+@pytest.mark.gen_test
+def test_chunked_log_events(jobWatchers, docs):
+    queue = jobWatchers.subscribe("job1")
+    jobWatchers.poll_once()
+
+    jobLog = joblogs.JobLog("job1", chunkSize=2)
+    for i in range(3):
+        jobLog.append(Datastore(docs), dict(msg=str(i)))
+    jobWatchers.poll_once()
+
+    assert drain(queue)[-1] == (
+        watchers.LOG, [dict(msg="0"), dict(msg="1"), dict(msg="2")]
+    )
+
+    jobLog.append(Datastore(docs), dict(msg="3"))
+    jobWatchers.poll_once()
+
+    assert drain(queue) == [(watchers.LOG, [dict(msg="3")])]
+
+
+@pytest.mark.gen_test
+def test_result_ends_watch(jobWatchers, docs):
+    queue = jobWatchers.subscribe("job1")
+    docs['job1'] = dict(completeness=1, resultCode=200, events=[])
+    jobWatchers.poll_once()
+
+    assert drain(queue)[-1][0] == watchers.RESULT
+    assert "job1" not in jobWatchers.watchers
+
+
+@pytest.mark.gen_test
+def test_not_found(jobWatchers):
+    queue = jobWatchers.subscribe("whatever")
+    jobWatchers.poll_once()
+
+    assert drain(queue) == [(watchers.NOT_FOUND, dict(uuid="whatever"))]
+
+
+@pytest.mark.gen_test
+def test_late_subscriber(jobWatchers):
+    jobWatchers.subscribe("job1")
+    jobWatchers.poll_once()
+
+    queue = jobWatchers.subscribe("job1")
+    assert [event for event, _ in drain(queue)] == [watchers.PROGRESS]
+
+
+@pytest.mark.gen_test
+def test_late_subscriber_history(jobWatchers, docs):
+    queue1 = jobWatchers.subscribe("job1")
+    docs['job1'] = dict(
+        completeness=0.5, resultCode=None, events=[dict(msg="hi")]
+    )
+    jobWatchers.poll_once()
+
+    queue2 = jobWatchers.subscribe("job1")
+    assert drain(queue2) == drain(queue1)
+
+
+@pytest.mark.gen_test
+def test_late_subscriber_chunked_history(jobWatchers, docs):
+    queue1 = jobWatchers.subscribe("job1")
+    jobLog = joblogs.JobLog("job1", chunkSize=2)
+    for i in range(3):
+        jobLog.append(Datastore(docs), dict(msg=str(i)))
+    jobWatchers.poll_once()
+
+    queue2 = jobWatchers.subscribe("job1")
+    assert drain(queue2) == drain(queue1)
+
+
+@pytest.mark.gen_test
+def test_unsubscribe_stops_polling(jobWatchers):
+    queue = jobWatchers.subscribe("job1")
+    yield gen.sleep(0.05)
+    assert jobWatchers.polling
+
+    jobWatchers.unsubscribe("job1", queue)
+    yield gen.sleep(0.05)
+    assert not jobWatchers.watchers
+    assert not jobWatchers.polling
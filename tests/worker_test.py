@@ -0,0 +1,428 @@
+import collections
+import concurrent.futures
+import json
+import os
+import signal
+import threading
+import pdb
+import pytest
+
+from spacewalk import metrics
+from spacewalk import snapshot
+from spacewalk import worker
+from . import classes
+
+QueueJob = collections.namedtuple("QueueJob", ["id", "body"])
+
+
+class FakeQueue(object):
+    def __init__(self, queueName="testService"):
+        self.queueName = queueName
+        self.jobs = []
+        self.deleted = []
+        self.released = []
+        self.touched = []
+
+    def reserve(self, timeout=None):
+        return self.jobs.pop(0) if self.jobs else None
+
+    def delete(self, queueJob):
+        self.deleted.append(queueJob.id)
+
+    def release(self, queueJob, **kwargs):
+        self.released.append(queueJob.id)
+        self.releaseKwargs = kwargs
+
+    def touch(self, queueJob):
+        self.touched.append(queueJob.id)
+
+
+class FakeDatastore(object):
+    def __init__(self):
+        self.docs = {}
+
+    def get(self, key):
+        return self.docs.get(key)
+
+    def set(self, key, value):
+        self.docs[key] = value
+
+
+class FakePool(object):
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, func, *args):
+        self.futures.append(concurrent.futures.Future())
+        return self.futures[-1]
+
+    def finish(self, index):
+        self.futures[index].set_result((200, {}))
+
+    def fail(self, index, error):
+        self.futures[index].set_exception(error)
+
+    def shutdown(self, wait=True):
+        pass
+
+    def terminate_workers(self):
+        pass
+
+
+@pytest.fixture
+def make_worker():
+    def func(concurrency=None):
+        w = worker.Worker(
+            classes.Root,
+            "testService",
+            dict,
+            FakeQueue,
+            processes=4,
+            concurrency=concurrency,
+            shutdownTimeout=0
+        )
+        w.datastore = {}
+        w.queue = FakeQueue()
+        w.queues = {"testService": w.queue}
+        w.pool = FakePool()
+        return w
+
+    return func
+
+
+def queue_job(w, jobId, cls):
+    uuid = "uuid-%d" % jobId
+    w.datastore[uuid] = dict(uuid=uuid, jobType=cls.JOB_TYPE)
+    return QueueJob(jobId, json.dumps(dict(uuid=uuid)))
+
+
+def test_worker_classes(make_worker):
+    w = make_worker()
+
+    assert set(w.classes.values()) == set(classes.LEAF_CLASSES)
+
+
+def test_worker_snapshot(tmp_path, monkeypatch):
+    filename = str(tmp_path / "structure.snapshot")
+    built = worker.Worker(
+        classes.Root, "testService", dict, FakeQueue, snapshotFile=filename
+    )
+
+    def fail(*args, **kwargs):
+        raise AssertionError("should load the snapshot")
+
+    monkeypatch.setattr(snapshot, "auto_tree", fail)
+    loaded = worker.Worker(
+        classes.Root, "testService", dict, FakeQueue, snapshotFile=filename
+    )
+
+    assert set(loaded.structure.pathmap) == set(built.structure.pathmap)
+    assert loaded.classes == built.classes
+
+
+def test_worker_unknown_concurrency_path():
+    with pytest.raises(ValueError):
+        worker.Worker(
+            classes.Root, "testService", dict, dict,
+            concurrency={"/root/nope": 1}
+        )
+
+
+def test_worker_limited_paths(make_worker):
+    w = make_worker({classes.DEV_PATH: 2, classes.EXP_LEAF_PATH: 1})
+
+    assert w.limitedPaths[classes.ExpLeaf2.JOB_TYPE] == [
+        classes.DEV_PATH, classes.EXP_LEAF_PATH
+    ]
+    assert w.limitedPaths[classes.ExpLeaf1.JOB_TYPE] == [classes.DEV_PATH]
+    assert w.limitedPaths[classes.ProdLeaf1.JOB_TYPE] == []
+
+
+def test_worker_leaf_concurrency(make_worker):
+    w = make_worker({classes.EXP_LEAF_PATH: 1})
+
+    w.dispatch(w.queue, queue_job(w, 1, classes.ExpLeaf2))
+    w.dispatch(w.queue, queue_job(w, 2, classes.ExpLeaf2))
+    w.dispatch(w.queue, queue_job(w, 3, classes.ExpLeaf1))
+
+    assert list(w.running) == [1, 3]
+    assert w.queue.released == [2]
+
+    w.pool.finish(0)
+    w.reap()
+
+    assert list(w.running) == [3]
+    assert w.queue.deleted == [1]
+
+    w.dispatch(w.queue, queue_job(w, 2, classes.ExpLeaf2))
+    assert list(w.running) == [3, 2]
+
+
+def test_worker_branch_concurrency(make_worker):
+    w = make_worker({classes.DEV_PATH: 2})
+
+    w.dispatch(w.queue, queue_job(w, 1, classes.ExpLeaf2))
+    w.dispatch(w.queue, queue_job(w, 2, classes.DevLeaf1))
+    w.dispatch(w.queue, queue_job(w, 3, classes.ExpLeaf1))
+    w.dispatch(w.queue, queue_job(w, 4, classes.ProdLeaf1))
+
+    assert list(w.running) == [1, 2, 4]
+    assert w.queue.released == [3]
+
+
+def test_worker_missing_job(make_worker):
+    w = make_worker()
+
+    w.dispatch(w.queue, QueueJob(1, json.dumps(dict(uuid="nope"))))
+
+    assert w.running == {}
+    assert w.queue.deleted == [1]
+
+
+def test_worker_shutdown_requeues(make_worker):
+    w = make_worker({classes.DEV_PATH: 2})
+
+    w.dispatch(w.queue, queue_job(w, 1, classes.ExpLeaf2))
+    w.dispatch(w.queue, queue_job(w, 2, classes.DevLeaf1))
+    w.pool.finish(0)
+    w.shutdown()
+
+    assert w.queue.deleted == [1]
+    assert w.queue.released == [2]
+    assert w.running == {}
+    assert w.counts == {classes.DEV_PATH: 0}
+
+
+def test_worker_failed_job_released(make_worker):
+    w = make_worker()
+
+    w.dispatch(w.queue, queue_job(w, 1, classes.ExpLeaf2))
+    w.pool.fail(0, IOError("datastore is down"))
+    w.reap()
+
+    assert w.queue.deleted == []
+    assert w.queue.released == [1]
+    assert w.queue.releaseKwargs['delay'] == worker.FAILED_RETRY_DELAY
+    assert w.running == {}
+
+
+def test_worker_touches_running_jobs(make_worker):
+    w = make_worker()
+
+    w.dispatch(w.queue, queue_job(w, 1, classes.ExpLeaf2))
+    w.dispatch(w.queue, queue_job(w, 2, classes.DevLeaf1))
+    w.pool.finish(0)
+
+    w.touch()
+    assert w.queue.touched == []
+
+    w.lastTouch -= worker.TOUCH_INTERVAL
+    w.touch()
+    assert w.queue.touched == [2]
+
+
+class DyingDatastore(FakeDatastore):
+    """
+    kills the pool process that loads the job "doomed", as the OOM killer
+    might
+    """
+    def get(self, key):
+        if key == "doomed":
+            os.kill(os.getpid(), signal.SIGKILL)
+
+        return dict(uuid=key, jobType=classes.ProdLeaf1.JOB_TYPE)
+
+
+def test_worker_pool_process_dies():
+    w = worker.Worker(
+        classes.Root, "testService", DyingDatastore, FakeQueue,
+        processes=1, concurrency={classes.PROD_PATH: 1}
+    )
+    w.datastore = {}
+    w.queue = FakeQueue()
+    w.pool = pool = w.make_pool()
+    try:
+        w.datastore["doomed"] = dict(
+            uuid="doomed", jobType=classes.ProdLeaf1.JOB_TYPE
+        )
+        w.dispatch(w.queue, QueueJob(1, json.dumps(dict(uuid="doomed"))))
+        concurrent.futures.wait([w.running[1][3]], timeout=10)
+
+        # the dead job's reservation isn't kept alive
+        w.lastTouch -= worker.TOUCH_INTERVAL
+        w.touch()
+        assert w.queue.touched == []
+
+        w.reap()
+        assert w.queue.released == [1]
+        assert w.queue.releaseKwargs['delay'] == worker.FAILED_RETRY_DELAY
+        assert w.running == {}
+        assert w.numRunning[False] == 0
+        assert w.counts == {classes.PROD_PATH: 0}
+        assert w.pool is not pool
+
+        # the new pool runs jobs
+        w.dispatch(w.queue, queue_job(w, 2, classes.ProdLeaf1))
+        assert w.running[2][3].result(timeout=10)[0] == 200
+
+        w.reap()
+        assert w.queue.deleted == [2]
+    finally:
+        w.pool.shutdown()
+
+
+def test_worker_queue_order():
+    w = worker.Worker(classes.QueuedRoot, "testService", dict, FakeQueue)
+
+    assert w.queueNames == [
+        "testService-interactive", "testService-batch", "testService"
+    ]
+
+
+def test_worker_reserve_most_urgent():
+    w = worker.Worker(classes.QueuedRoot, "testService", dict, FakeQueue)
+    w.queues = {name: FakeQueue(name) for name in w.queueNames}
+    w.queues["testService-batch"].jobs.append(QueueJob(1, "batch"))
+    w.queues["testService-interactive"].jobs.append(QueueJob(2, "fast"))
+
+    queue, queueJob = w.reserve()
+    assert queue.queueName == "testService-interactive"
+    assert queueJob.id == 2
+
+    queue, queueJob = w.reserve()
+    assert queue.queueName == "testService-batch"
+    assert w.reserve() is None
+
+
+class WatchingQueue(FakeQueue):
+    def __init__(self, queueName="testService"):
+        super().__init__(queueName)
+        self.watched = [queueName]
+
+    def watch(self, queueName):
+        self.watched.append(queueName)
+
+
+def test_worker_watch_queues():
+    w = worker.Worker(
+        classes.QueuedRoot, "testService", dict, WatchingQueue,
+        reserveTimeout=5
+    )
+    w.queues = {name: WatchingQueue(name) for name in w.queueNames}
+    w.reserver = w.watch_queues()
+
+    assert w.reserver.watched == w.queueNames
+
+    # the one connection reserves the most urgent job of any queue
+    w.reserver.jobs.append(QueueJob(1, "fast"))
+    queue, queueJob = w.reserve()
+
+    assert queue is w.reserver
+    assert queueJob.id == 1
+    assert w.reserve() is None
+
+
+def test_worker_watch_queues_unsupported():
+    w = worker.Worker(classes.QueuedRoot, "testService", dict, FakeQueue)
+
+    assert w.watch_queues() is None
+
+
+def test_worker_release_keeps_priority():
+    w = worker.Worker(
+        classes.QueuedRoot, "testService", dict, FakeQueue,
+        concurrency={"/queued/batch": 0}
+    )
+    w.datastore = {"b": dict(uuid="b", jobType=classes.BatchLeaf.JOB_TYPE)}
+    queue = FakeQueue("testService-batch")
+
+    w.dispatch(queue, QueueJob(1, "b"))
+
+    assert queue.released == [1]
+    assert queue.releaseKwargs == dict(
+        delay=worker.RETRY_DELAY, priority=classes.BatchLeaf.PRIORITY
+    )
+
+
+def test_worker_queue_names():
+    w = worker.Worker(
+        classes.QueuedRoot, "testService", dict, FakeQueue,
+        queueNames=["testService-interactive"]
+    )
+
+    assert w.queueNames == ["testService-interactive"]
+
+
+def test_worker_async_capacity():
+    w = worker.Worker(
+        classes.QueuedRoot, "testService", dict, FakeQueue,
+        processes=1, asyncConcurrency=1
+    )
+
+    assert w.asyncTypes == {classes.AsyncLeaf.JOB_TYPE}
+    assert w.can_start(classes.AsyncLeaf.JOB_TYPE)
+
+    w.numRunning[True] = 1
+    assert not w.can_start(classes.AsyncLeaf.JOB_TYPE)
+    assert w.can_start(classes.DefaultLeaf.JOB_TYPE)
+    assert w.has_capacity()
+
+    w.numRunning[False] = 1
+    assert not w.has_capacity()
+
+
+def test_async_runner():
+    datastore = FakeDatastore()
+    uuids = ["async-%d" % i for i in range(10)]
+    for uuid in uuids:
+        datastore.set(
+            uuid,
+            dict(uuid=uuid, jobType=classes.AsyncLeaf.JOB_TYPE)
+        )
+
+    runner = worker.AsyncRunner(
+        lambda: datastore,
+        FakeQueue,
+        "testService",
+        {classes.AsyncLeaf.JOB_TYPE: classes.AsyncLeaf}
+    )
+    runner.start()
+    try:
+        futures = [runner.submit(uuid) for uuid in uuids]
+        assert [future.result(timeout=5) for future in futures] == [200] * 10
+    finally:
+        runner.stop()
+
+    for uuid in uuids:
+        assert datastore.get(uuid)['completeness'] == 0.5
+        assert datastore.get(uuid)['resultCode'] == 200
+
+
+def test_pool_job_metrics(monkeypatch):
+    datastore = FakeDatastore()
+    datastore.set(
+        "pool-1", dict(uuid="pool-1", jobType=classes.ProdLeaf1.JOB_TYPE)
+    )
+    monkeypatch.setattr(worker, "_datastore", datastore)
+    monkeypatch.setattr(worker, "_makeQueue", FakeQueue)
+    monkeypatch.setattr(worker, "_serviceName", "testService")
+    monkeypatch.setattr(
+        worker, "_classes", {classes.ProdLeaf1.JOB_TYPE: classes.ProdLeaf1}
+    )
+    labels = (classes.ProdLeaf1.JOB_TYPE, "200")
+
+    # as in a pool process, where the job's metrics are drained
+    resultCode, jobSeconds = worker.run_job("pool-1")
+    assert resultCode == 200
+    assert sum(jobSeconds[labels][:-1]) >= 1
+    assert metrics.JOB_SECONDS.values == {}
+
+    # as in the parent, which collects them
+    metrics.JOB_SECONDS.observe(1.0, *labels)
+    future = concurrent.futures.Future()
+    future.set_result((resultCode, jobSeconds))
+
+    assert worker.pool_result(future) == 200
+    assert sum(metrics.JOB_SECONDS.values[labels][:-1]) == 1 + sum(
+        jobSeconds[labels][:-1]
+    )